@@ -1,11 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 
 from email_throttle.api.endpoints.hello import hello
 from email_throttle.api.endpoints.emails import router as send_email
+from email_throttle.api.endpoints.emails.dependencies import (
+    idempotency_index_factory,
+    rabbit_producer_pool,
+    template_store_factory,
+    vendor_registry,
+)
+
+
+@asynccontextmanager
+async def lifespan(api: FastAPI):
+    # vendor services are stateful (failover, breakers, rate limits), every request shares them
+    api.state.vendors = vendor_registry()
+    api.state.templates = template_store_factory()
+    api.state.idempotency = idempotency_index_factory()
+    # broker connections live as long as the application, requests check them out
+    api.state.rabbit_pool = rabbit_producer_pool()
+    await run_in_threadpool(api.state.rabbit_pool.start)
+    yield
+    await run_in_threadpool(api.state.rabbit_pool.close)
 
 
 def create_api():
-    api = FastAPI()
+    api = FastAPI(lifespan=lifespan)
 
     api.include_router(hello.router)
     api.include_router(send_email.router, prefix="/email")
@@ -0,0 +1,34 @@
+import json
+import os
+
+from email_throttle.core.failover import AsyncEmailFailoverWithState
+from email_throttle.core.service import AsyncEmailService
+from email_throttle.infra.services import create_services
+
+DEFAULT_VENDORS = [{"name": str(i)} for i in range(3)]
+
+
+def vendors_config() -> list[dict]:
+    """Vendors of the API, from `$EMAIL_THROTTLE_VENDORS` (same JSON format as the simulator vendors config).
+
+    e.g.: [{"name": "v1", "middlewares": ["gcra"], "rate_limiter": {"max_attempts": 10, "per_seconds": 1}}]
+    """
+    config = os.getenv("EMAIL_THROTTLE_VENDORS")
+    return json.loads(config) if config else DEFAULT_VENDORS
+
+
+class VendorRegistry:
+    """Vendor services of the application, built once at startup and shared by every request.
+
+    Sticky vendor choice, rate limiter windows and circuit breaker state persist between requests.
+    The services are asyncio ones and only run on the event loop of the application,
+    so requests interleave only at `await` points and the middleware state needs no locks.
+    """
+
+    def __init__(self, services: list[AsyncEmailService]):
+        self.services = services
+        self.failover = AsyncEmailFailoverWithState(services)
+
+    @classmethod
+    def from_config(cls, vendors_config: list[dict]) -> "VendorRegistry":
+        return cls(create_services(vendors_config, asynchronous=True))
@@ -1,28 +1,82 @@
-from typing import Callable
-from fastapi import Depends
-from email_throttle.api.endpoints.emails.dtos import EmailDto
-from email_throttle.core.failover import EmailFailover, EmailFailoverWithState
-from email_throttle.core.service import EmailService
-from email_throttle.vendors.noop import NoOpEmailSender
-from email_throttle.infra.rabbit.factories import (
-    create_connection as create_connection_factory,
-    create_producer as create_producer_factory,
-)
+import os
 
+from fastapi import HTTPException, Request
+from email_throttle.api.core.registry import VendorRegistry, vendors_config
+from email_throttle.core.dedup import IdempotencyIndex
+from email_throttle.core.failover import AsyncEmailFailoverWithState
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+from email_throttle.infra.blobs.store import FileBlobStore
+from email_throttle.infra.blobs.templates import TemplateStore
+from email_throttle.infra.rabbit.factories import create_producer_pool as create_producer_pool_factory
+from email_throttle.infra.rabbit.pool import PoolExhausted
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import Topology
 
-def email_services():
-    return [EmailService(NoOpEmailSender(_), []) for _ in range(3)]
 
+def vendor_registry():
+    return VendorRegistry.from_config(vendors_config())
 
-def email_failover_service(services: list[EmailService] = Depends(email_services)):
-    return EmailFailover(services)
 
+def idempotency_index_factory() -> IdempotencyIndex | None:
+    """Keys of the emails sent by the API, remembered `EMAIL_THROTTLE_DEDUP_WINDOW` seconds (0 disables it)."""
+    window = float(os.getenv("EMAIL_THROTTLE_DEDUP_WINDOW", "3600"))
+    return IdempotencyIndex.create(window=window) if window else None
 
-def email_failover_with_state(services: list[EmailService] = Depends(email_services)):
-    return EmailFailoverWithState(services)
 
+def idempotency_index(request: Request) -> IdempotencyIndex | None:
+    """Index of the application (see `create_api` lifespan), None when disabled or outside of the lifespan."""
+    return getattr(request.app.state, "idempotency", None)
 
-def rabbit_producer(connection_fn=create_connection_factory):
-    serializer: Callable[[EmailDto], str] = lambda data: data.model_dump_json()
 
-    return create_producer_factory(serializer, connection_fn)
+def async_email_failover_with_state(request: Request) -> AsyncEmailFailoverWithState:
+    """Failover of the application vendor registry (see `create_api` lifespan), shared by every request."""
+    return request.app.state.vendors.failover
+
+
+def blob_store() -> FileBlobStore | None:
+    """The blob store in `EMAIL_THROTTLE_BLOB_DIR` (shared with the consumers), if set."""
+    blob_dir = os.getenv("EMAIL_THROTTLE_BLOB_DIR")
+    return FileBlobStore(blob_dir) if blob_dir else None
+
+
+def claim_check() -> ClaimCheck | None:
+    """Offloads large bodies and attachments to the blob store, if any."""
+    store = blob_store()
+    if store is None:
+        return None
+    threshold = int(os.getenv("EMAIL_THROTTLE_CLAIM_CHECK_OVER", str(256 * 1024)))
+    return ClaimCheck(store, threshold=threshold)
+
+
+def template_store_factory() -> TemplateStore | None:
+    store = blob_store()
+    return TemplateStore(store) if store is not None else None
+
+
+def template_store(request: Request) -> TemplateStore:
+    """Templates of the application (see `create_api` lifespan), they are kept in the blob store."""
+    templates = request.app.state.templates
+    if templates is None:
+        raise HTTPException(status_code=503, detail="Templates need a blob store, set EMAIL_THROTTLE_BLOB_DIR")
+    return templates
+
+
+def rabbit_producer_pool():
+    # consumers decode every codec, switch the producers once they are deployed
+    wire_format = WireFormat(
+        codec=os.getenv("EMAIL_THROTTLE_CODEC", "json"),
+        compression=os.getenv("EMAIL_THROTTLE_COMPRESSION") or None,
+        claim_check=claim_check(),
+    )
+
+    # the consumers declare the same queues, they must use the same EMAIL_THROTTLE_QUEUE_TYPE
+    return create_producer_pool_factory(wire_format=wire_format, topology=Topology.from_env())
+
+
+def rabbit_producer(request: Request):
+    """Checks out a producer of the application pool (see `create_api` lifespan) for the request."""
+    try:
+        with request.app.state.rabbit_pool.acquire() as producer:
+            yield producer
+    except PoolExhausted as e:
+        raise HTTPException(status_code=503, detail=str(e))
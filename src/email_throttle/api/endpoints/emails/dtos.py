@@ -1,8 +1,21 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
+from email_throttle.core.entity import Priority
+
+
+class BulkResultDto(BaseModel):
+    accepted: int
+    rejected: int
+
+
+class TemplateDto(BaseModel):
+    template_id: str
+
 
-class EmailDto(BaseModel):
-    subject: str
-    body: str
+class TemplateRecipientDto(BaseModel):
     to: list[str]
-    from_email: str
+    variables: dict[str, str] = {}
+    idempotency_key: Optional[str] = None
+    priority: Priority = Priority.BULK
@@ -1,40 +1,95 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 
-from email_throttle.api.endpoints.emails.dependencies import email_failover_with_state, rabbit_producer
-from email_throttle.api.endpoints.emails.dtos import EmailDto
-from email_throttle.core.entity import EmailMessage
-from email_throttle.core.failover import EmailFailoverWithState
+from email_throttle.api.endpoints.emails.dependencies import (
+    async_email_failover_with_state,
+    idempotency_index,
+    rabbit_producer,
+    template_store,
+)
+from email_throttle.api.endpoints.emails.dtos import BulkResultDto, TemplateDto, TemplateRecipientDto
+from email_throttle.core.dedup import IdempotencyIndex
+from email_throttle.core.entity import EmailMessage, EmailTemplate, TemplatedEmail
+from email_throttle.core.failover import AsyncEmailFailoverWithState
+from email_throttle.infra.blobs.templates import TemplateStore
 from email_throttle.infra.rabbit.handlers import RabbitProducer
 
 
 router = APIRouter()
 
 
+# the body is validated straight into the entity dataclass, there is no intermediate model to copy from
 @router.post("/")
-def send_email(email: EmailDto, sender: EmailFailoverWithState = Depends(email_failover_with_state)) -> bool:
+async def send_email(
+    email: EmailMessage,
+    sender: AsyncEmailFailoverWithState = Depends(async_email_failover_with_state),
+    index: IdempotencyIndex | None = Depends(idempotency_index),
+) -> bool:
     # TODO: add validations
-    entity = EmailMessage(
-        subject=email.subject,
-        body=email.body,
-        to=email.to,
-        from_email=email.from_email,
-    )
-    result = sender.send_email(entity)
+    key = index is not None and email.idempotency_key
+    if key and not index.claim(key):
+        # a client retry of an email already sent (or being sent)
+        return True
+
+    sent = False
+    try:
+        result = await sender.send_email(email)
+        sent = bool(result)
+    finally:
+        if key:
+            index.release(key, sent)
 
     return result
 
 
+@router.get("/idempotency")
+def idempotency_stats(index: IdempotencyIndex | None = Depends(idempotency_index)) -> dict:
+    """Duplicates dropped, false positive rate and memory of the idempotency index of this API process."""
+    if index is None:
+        raise HTTPException(status_code=404, detail="The idempotency index is disabled")
+    return index.stats()
+
+
+# the producer is a blocking pika channel, FastAPI runs this endpoint in its threadpool
 @router.post("/bulk")
 def send_email_bulk(
-    emails: list[EmailDto],
+    emails: list[EmailMessage],
     producer: RabbitProducer = Depends(rabbit_producer),
-) -> bool:
+) -> BulkResultDto:
     # TODO: add validations
 
-    for email in emails:
-        producer.send(email)
+    accepted, rejected = producer.send_many(emails)
+
+    return BulkResultDto(accepted=accepted, rejected=rejected)
+
+
+@router.post("/templates")
+def register_template(
+    template: EmailTemplate,
+    templates: TemplateStore = Depends(template_store),
+) -> TemplateDto:
+    try:
+        return TemplateDto(template_id=templates.register(template))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+# only the recipients and their variables are queued, the consumers render the template at send time
+@router.post("/templates/{template_id}/bulk")
+def send_template_bulk(
+    template_id: str,
+    recipients: list[TemplateRecipientDto],
+    templates: TemplateStore = Depends(template_store),
+    producer: RabbitProducer = Depends(rabbit_producer),
+) -> BulkResultDto:
+    if not templates.exists(template_id):
+        raise HTTPException(status_code=404, detail=f"Template {template_id} not found")
+
+    accepted, rejected = producer.send_many(
+        TemplatedEmail(template_id, recipient.to, recipient.variables, recipient.idempotency_key, recipient.priority)
+        for recipient in recipients
+    )
 
-    return True
+    return BulkResultDto(accepted=accepted, rejected=rejected)
 
 
 """
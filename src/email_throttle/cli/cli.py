@@ -27,13 +27,17 @@ email-throttle-cli simulate
     --vendors VENDORS [VENDORS ...]
             Names of the vendors
     --middlewares MIDDLEWARES [MIDDLEWARES ...]
-            Middlewares in the format retry,cb,rl per vendor
+            Middlewares in the format retry,cb,rl per vendor (rl can be replaced by tb or gcra)
     --circuit-breakers CIRCUIT_BREAKERS [CIRCUIT_BREAKERS ...]
             Circuit breaker configuration in format threshold,reset_timeout
     --rate-limiters RATE_LIMITERS [RATE_LIMITERS ...]
-            Rate limiter configuration in format max_attempts,per_seconds
+            Rate limiter configuration in format max_attempts,per_seconds[,max_wait]
     --retries RETRIES [RETRIES ...]
             Retry configuration in format retries
+    --workers WORKERS
+            Processes sending the emails, one report is merged from theirs
+    --shared-vendor-state
+            The workers share the rate limiters and circuit breakers of each vendor
 >>>
 
 Usage examples:
@@ -1,29 +1,165 @@
 import argparse
+import os
+from typing import Sequence
 
 from loguru import logger
-from pydantic_core import from_json
 
-from email_throttle.api.endpoints.emails.dtos import EmailDto
-from email_throttle.core.entity import EmailMessage
+from email_throttle.core.dedup import IdempotencyIndex, TimeWindowBloomFilter
+from email_throttle.core.entity import EmailMessage, Priority, TemplatedEmail
+from email_throttle.core.exceptions import PoisonMessage
 from email_throttle.core.failover import EmailFailover, EmailFailoverWithState
+from email_throttle.core.log_sampling import SampledLog
+from email_throttle.core.scheduling import DomainScheduler, FifoScheduler, PriorityLanes
+from email_throttle.core.templates import TemplateRenderer
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+from email_throttle.infra.blobs.store import FileBlobStore, is_reference
+from email_throttle.infra.blobs.templates import TemplateStore
 from email_throttle.infra.rabbit.factories import create_consumer
-from email_throttle.cli.simulator import create_services as create_services_from_config
+from email_throttle.infra.rabbit.handlers import FAILURE_POLICIES
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import QUEUE_TYPES, Topology
+from email_throttle.infra.services import create_services as create_services_from_config
+from email_throttle.infra.shared.dedup import SharedTimeWindowBloomFilter
+
+RETRY_DELAYS = (1, 5, 30, 60)
+LANE_WEIGHTS = ("transactional=4", "bulk=1")
+# keys sent per window, the filter takes about 3.6 MB per million keys at this false positive rate
+DEDUP_CAPACITY = 1_000_000
+DEDUP_ERROR_RATE = 1e-6
 
 
 def install_consumer_command(
     subparsers: "argparse._SubParsersAction[argparse.ArgumentParser]",
 ):
     subparser = subparsers.add_parser("consumer", help="Create a worker for the queue")
+    subparser.add_argument(
+        "--state-dir",
+        default=os.getenv("EMAIL_THROTTLE_STATE_DIR"),
+        help="Directory to share rate limiter and circuit breaker state between the consumers of the node "
+        "(default: $EMAIL_THROTTLE_STATE_DIR, in-process state if empty). e.g.: /dev/shm/email-throttle",
+    )
+    subparser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Messages handled in parallel by a thread pool, acks are sent once each message is handled. e.g.: 8",
+    )
+    subparser.add_argument(
+        "--prefetch",
+        type=int,
+        default=None,
+        help="Unacked deliveries the broker pushes to this consumer, per queue (default: the concurrency, 8 times "
+        "the concurrency with --domain-rate or --lane-weights). e.g.: 16",
+    )
+    subparser.add_argument(
+        "--retry-delays",
+        nargs="+",
+        type=float,
+        default=list(RETRY_DELAYS),
+        help="Seconds before each redelivery of a failed email, the last one is used for the following attempts. "
+        "The email waits in a broker queue, the consumer doesn't sleep. e.g.: 1 5 30 60",
+    )
+    subparser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Deliveries of an email before it is parked in the emails.parked queue. e.g.: 5",
+    )
+    subparser.add_argument(
+        "--on-failure",
+        choices=FAILURE_POLICIES,
+        default=None,
+        help="What to do with an email that could not be sent: retry it after the --retry-delays (default), "
+        "requeue it right away (needs --queue-type quorum and --delivery-limit) or dead-letter it to emails.parked. "
+        "Emails that can't be decoded are always dead-lettered",
+    )
+    subparser.add_argument(
+        "--queue-type",
+        choices=QUEUE_TYPES,
+        default=os.getenv("EMAIL_THROTTLE_QUEUE_TYPE", "durable"),
+        help="transient: queues and messages lost on a broker restart, durable: durable queues and persistent "
+        "messages, quorum: replicated quorum queues. The API must use the same type "
+        "(default: $EMAIL_THROTTLE_QUEUE_TYPE or durable)",
+    )
+    subparser.add_argument(
+        "--delivery-limit",
+        type=int,
+        default=int(os.getenv("EMAIL_THROTTLE_DELIVERY_LIMIT") or 0) or None,
+        help="Deliveries after which a quorum queue dead-letters a message to emails.parked, e.g. one that crashes "
+        "its consumers (default: $EMAIL_THROTTLE_DELIVERY_LIMIT, no limit if empty). e.g.: 10",
+    )
+    subparser.add_argument(
+        "--blob-dir",
+        default=os.getenv("EMAIL_THROTTLE_BLOB_DIR"),
+        help="Blob store of the templates and of the large bodies and attachments offloaded by the API, the same "
+        "directory as its EMAIL_THROTTLE_BLOB_DIR (default: $EMAIL_THROTTLE_BLOB_DIR). "
+        "e.g.: /var/lib/email-throttle/blobs",
+    )
+    subparser.add_argument(
+        "--dedup-window",
+        type=float,
+        default=3600,
+        help="Seconds an idempotency key is remembered after its email is sent, duplicates are not sent again "
+        "(0 disables it). With --state-dir, the keys are shared by the consumers of the node. e.g.: 3600",
+    )
+    subparser.add_argument(
+        "--dedup-strict",
+        action="store_true",
+        help="Also drop the keys only found by the Bloom filter (older than the exact LRU, or sent by another "
+        "consumer), at the cost of dropping a new email with the filter false positive rate (1e-6)",
+    )
+
+    subparser.add_argument(
+        "--domain-rate",
+        type=float,
+        default=None,
+        help="Recipients per second sent to each recipient domain. Enables the domain scheduler: domains take turns "
+        "(deficit round robin), so a large campaign to a domain doesn't delay the others. e.g.: 10",
+    )
+    subparser.add_argument(
+        "--domain-burst",
+        type=int,
+        default=None,
+        help="Recipients a domain can burst over its rate (default: the rate). e.g.: 20",
+    )
+    subparser.add_argument(
+        "--domain-limit",
+        nargs="+",
+        default=[],
+        help="Rate (and burst) of specific domains as domain=rate[:burst]. e.g.: gmail.com=50:100 outlook.com=20",
+    )
+    subparser.add_argument(
+        "--lane-weights",
+        nargs="*",
+        default=list(LANE_WEIGHTS),
+        help="Weight of each priority lane (queue) as priority=weight: while both lanes have messages, the "
+        "transactional one sends 4 of every 5 and bulk is never starved. Without values, only the bulk queue "
+        f"is consumed. (default: {' '.join(LANE_WEIGHTS)})",
+    )
 
     subparser.set_defaults(func=consumer_command)
     return subparser
 
 
-def create_services():
+def create_services(
+    state_dir: str | None = None,
+    prefetch: int | None = None,
+    concurrency: int = 1,
+    retry_delays: Sequence[float] = RETRY_DELAYS,
+    max_attempts: int = 5,
+    blob_dir: str | None = None,
+    dedup_window: float = 3600,
+    dedup_strict: bool = False,
+    scheduler: DomainScheduler | PriorityLanes | None = None,
+    failure_policy: str | None = None,
+    queue_type: str = "durable",
+    delivery_limit: int | None = None,
+):
     # TODO: should create a real instance
     vendors_config = dict(
         name="Consumer",
-        middlewares=["retry", "rl", "cb"],
+        # no retry middleware: a failed email is redelivered by the broker after a delay (see `RabbitConsumer`)
+        middlewares=["rl", "cb"],
         rate_limiter=dict(
             max_attempts=10,
             per_seconds=5,
@@ -32,34 +168,133 @@ def create_services():
             threshold=3,
             reset_timeout=10,
         ),
-        retry=dict(
-            retries=3,
-        ),
     )
+    if concurrency > 1 or scheduler is not None:
+        # a worker paces itself at the vendor quota instead of failing over. Only in the worker threads: without
+        # them the handler runs on the connection thread, a sleep there would hold the heartbeats and the acks
+        vendors_config["rate_limiter"]["max_wait"] = 5
+
+    if state_dir:
+        vendors_config["state_dir"] = state_dir
 
     services = create_services_from_config([vendors_config])
-    failover = EmailFailoverWithState(services)
+    # give up after a cycle over the services, the broker retries the email later
+    failover = EmailFailoverWithState(services, max_retries=0)
 
     rb_consumer = create_consumer(
-        deserializer=lambda model: EmailDto.model_validate(from_json(model)),
-        handler=factory_handler_message(failover),
+        # decodes the deliveries by their content type, whatever codec the producers use
+        wire_format=WireFormat(),
+        handler=factory_handler_message(
+            failover,
+            *create_blob_readers(blob_dir),
+            index=create_idempotency_index(state_dir, dedup_window, dedup_strict),
+        ),
+        # the scheduler needs messages of several domains (or lanes) at hand to interleave them
+        prefetch=prefetch or (concurrency * 8 if scheduler is not None else concurrency),
+        concurrency=concurrency,
+        retry_delays=retry_delays,
+        max_attempts=max_attempts,
+        scheduler=scheduler,
+        failure_policy=failure_policy,
+        topology=Topology(queue_type, delivery_limit),
     )
 
     return rb_consumer
 
 
-def factory_handler_message(failover: EmailFailoverWithState | EmailFailover):
-    def handle_message(msg: EmailDto):
+def parse_domain_limits(values: Sequence[str]) -> dict[str, tuple[float, int]]:
+    """["gmail.com=50:100", "outlook.com=20"] -> {"gmail.com": (50, 100), "outlook.com": (20, 20)}"""
+    limits = {}
+    for value in values:
+        domain, _, limit = value.partition("=")
+        rate, _, burst = limit.partition(":")
+        limits[domain.strip().lower()] = (float(rate), int(burst) if burst else max(1, round(float(rate))))
+    return limits
+
+
+def parse_lane_weights(values: Sequence[str]) -> dict[Priority, int]:
+    """["transactional=4", "bulk=1"] -> {Priority.TRANSACTIONAL: 4, Priority.BULK: 1}"""
+    weights = {}
+    for value in values:
+        lane, _, weight = value.partition("=")
+        weights[Priority(lane.strip().lower())] = int(weight)
+    return weights
+
+
+def create_scheduler(
+    rate: float | None, burst: int | None, limits: Sequence[str], lane_weights: Sequence[str] = ()
+) -> DomainScheduler | PriorityLanes | None:
+    def create_domain_scheduler() -> DomainScheduler:
+        return DomainScheduler(rate=rate, burst=burst or max(1, round(rate)), limits=parse_domain_limits(limits))
+
+    weights = parse_lane_weights(lane_weights)
+    if weights:
+        # each lane paces its own domains
+        return PriorityLanes(weights, create_domain_scheduler if rate else FifoScheduler)
+    if not rate:
+        return None
+    return create_domain_scheduler()
+
+
+def create_blob_readers(blob_dir: str | None) -> tuple[ClaimCheck | None, TemplateRenderer | None]:
+    if not blob_dir:
+        return None, None
+    store = FileBlobStore(blob_dir)
+    return ClaimCheck(store), TemplateRenderer(TemplateStore(store).load)
+
+
+def create_idempotency_index(state_dir: str | None, window: float, strict: bool) -> IdempotencyIndex | None:
+    if not window:
+        return None
+    if state_dir:
+        bloom = SharedTimeWindowBloomFilter.for_node(state_dir, DEDUP_CAPACITY, DEDUP_ERROR_RATE, window)
+    else:
+        bloom = TimeWindowBloomFilter(DEDUP_CAPACITY, DEDUP_ERROR_RATE, window)
+    return IdempotencyIndex(bloom, strict=strict)
+
+
+def factory_handler_message(
+    failover: EmailFailoverWithState | EmailFailover,
+    claim_check: ClaimCheck | None = None,
+    renderer: TemplateRenderer | None = None,
+    index: IdempotencyIndex | None = None,
+):
+    duplicates_log = SampledLog(interval=60, level="INFO")
+
+    def handle_message(msg: EmailMessage | TemplatedEmail):
         logger.info(f"Sending email {msg}")
-        result = failover.send_email(
-            EmailMessage(
-                to=msg.to,
-                subject=msg.subject,
-                body=msg.body,
-                from_email=msg.from_email,
-            )
-        )
+        # redeliveries and client retries carry the key of an email that may have been sent already
+        key = index is not None and msg.idempotency_key
+        if key and not index.claim(key):
+            # the index is only formatted (its stats computed) when the log is emitted
+            duplicates_log.log("Dropped the duplicate email {}, idempotency index: {}", key, index)
+            return
+        sent = False
+        try:
+            # templates are rendered and offloaded data is read only now, right before sending
+            if isinstance(msg, TemplatedEmail):
+                if renderer is None:
+                    raise PoisonMessage("Templated emails need the blob store of the templates (--blob-dir)")
+                try:
+                    msg = renderer.render(msg)
+                except (KeyError, ValueError) as e:
+                    # a missing variable or an invalid template fails the same way on every attempt
+                    raise PoisonMessage(f"The email can't be rendered with its template: {e!r}") from e
+            elif claim_check:
+                msg = claim_check.check_out(msg)
+            elif is_reference(msg.body) or any(map(is_reference, msg.attachments)):
+                # the reference itself would be sent as the body or the attachment. Retrying can't fix the
+                # configuration of the consumer: the email is dead-lettered
+                raise PoisonMessage("Offloaded emails need the blob store of their data (--blob-dir)")
+            result = failover.send_email(msg)
+            sent = bool(result)
+        finally:
+            if key:
+                index.release(key, sent)
         logger.info(f"Result for email {msg} = {result}")
+        if not result:
+            # the consumer schedules a delayed redelivery
+            raise Exception("The email could not be sent by any service")
 
     return handle_message
 
@@ -70,8 +305,23 @@ def send_emails(failover: EmailFailoverWithState | EmailFailover, message):
 
 
 def consumer_command(args):
-    consumer = create_services()
+    consumer = create_services(
+        state_dir=args.state_dir,
+        prefetch=args.prefetch,
+        concurrency=args.concurrency,
+        retry_delays=args.retry_delays,
+        max_attempts=args.max_attempts,
+        blob_dir=args.blob_dir,
+        dedup_window=args.dedup_window,
+        dedup_strict=args.dedup_strict,
+        scheduler=create_scheduler(args.domain_rate, args.domain_burst, args.domain_limit, args.lane_weights),
+        failure_policy=args.on_failure,
+        queue_type=args.queue_type,
+        delivery_limit=args.delivery_limit,
+    )
     try:
         consumer.start_consuming()
     except KeyboardInterrupt:
         logger.info("Stopping consumer")
+    finally:
+        consumer.close()
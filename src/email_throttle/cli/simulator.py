@@ -1,15 +1,18 @@
 import argparse
+import functools
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
 
 from loguru import logger
 
+from email_throttle.core.abstract.routing import RoutingStrategy
 from email_throttle.core.entity import EmailMessage
 from email_throttle.core.failover import EmailFailover, EmailFailoverWithState
-from email_throttle.core.middlewares.default.circuit_breaker import \
-    CircuitBreaker
-from email_throttle.core.middlewares.default.rate_limiter import RateLimiter
-from email_throttle.core.middlewares.default.retry import Retry
-from email_throttle.core.service import EmailService
-from email_throttle.vendors.noop import NoOpEmailSender
+from email_throttle.infra.services import RATE_LIMITERS, ROUTINGS, create_routing, create_services
 
 
 def install_simulator_command(
@@ -22,6 +25,20 @@ def install_simulator_command(
         action="store_true",
         help="Enable stateful failover mechanism for vendors (EmailFailoverWithState or EmailFailover)",
     )
+    subparser.add_argument(
+        "--routing",
+        choices=list(ROUTINGS),
+        default="ordered",
+        help="Order in which EmailFailover tries the vendors: list order, weighted round robin (--weights), "
+        "least sends in flight or lowest latency average. Vendors that would reject the email are skipped",
+    )
+    subparser.add_argument(
+        "--weights",
+        nargs="+",
+        type=int,
+        required=False,
+        help="Weight of each vendor for the wrr routing. e.g.: 5 1 1",
+    )
     subparser.add_argument(
         "--email-count",
         type=int,
@@ -44,7 +61,7 @@ def install_simulator_command(
         "--middlewares",
         nargs="+",
         required=True,
-        help="Middlewares in the format retry,cb,rl per vendor. e.g.: retry,cb cb,lr retry retry,cb,lr ",
+        help="Middlewares in the format retry,cb,rl|tb|gcra per vendor. e.g.: retry,cb cb,rl retry retry,cb,gcra",
     )
     subparser.add_argument(
         "--circuit-breakers",
@@ -58,14 +75,30 @@ def install_simulator_command(
         nargs="+",
         required=False,
         default="",
-        help="Rate limiter configuration in format max_attempts,per_seconds. e.g.: 2,10 3,20",
+        help="Rate limiter configuration in format max_attempts,per_seconds[,max_wait]. "
+        "With max_wait, the limiter waits up to max_wait seconds (inf: no deadline) for a permit. e.g.: 2,10 3,20,5",
     )
     subparser.add_argument(
         "--retries",
         nargs="+",
         required=False,
         default="",
-        help="Retry configuration in format retries. e.g.: 10",
+        help="Retry configuration in format retries[,backoff[,budget]]. backoff: exponential (default), full, "
+        "decorrelated or adaptive (honours the rate limiter retry_after). budget: max share of retries over the "
+        "requests of the last 10 seconds. e.g.: 10 3,adaptive,0.1",
+    )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes sending the emails, each one sends its share with vendors of its own. e.g.: 8",
+    )
+    subparser.add_argument(
+        "--shared-vendor-state",
+        default=False,
+        action="store_true",
+        help="The workers share the rate limiters and circuit breakers of each vendor (as the processes of a node "
+        "do) instead of each one having its own",
     )
     subparser.set_defaults(func=command_simulate)
     return subparser
@@ -93,88 +126,155 @@ def parse_args(args):
                         "reset_timeout": cb_reset_timeout,
                     },
                 }
-            elif middleware == "rl" and "rate_limiter" not in vendor_config:
-                rl_max_attempts, rl_per_seconds = map(
-                    int,
-                    args.rate_limiters[i].split(","),
-                )
+            elif middleware in RATE_LIMITERS and "rate_limiter" not in vendor_config:
+                rl_max_attempts, rl_per_seconds, *rl_max_wait = args.rate_limiters[i].split(",")
+                rate_limiter = {
+                    "max_attempts": int(rl_max_attempts),
+                    "per_seconds": int(rl_per_seconds),
+                }
+                if rl_max_wait:
+                    # waits for a free permit instead of failing right away
+                    rate_limiter["max_wait"] = float(rl_max_wait[0])
                 vendor_config = {
                     **vendor_config,
-                    "rate_limiter": {
-                        "max_attempts": rl_max_attempts,
-                        "per_seconds": rl_per_seconds,
-                    },
+                    "rate_limiter": rate_limiter,
                 }
             elif middleware == "retry" and "retry" not in vendor_config:
-                retries = int(args.retries[i])
+                retries, *retry_options = args.retries[i].split(",")
+                retry = {
+                    "retries": int(retries),
+                }
+                if retry_options:
+                    retry["backoff"] = retry_options[0]
+                if len(retry_options) > 1:
+                    retry["budget"] = float(retry_options[1])
                 vendor_config = {
                     **vendor_config,
-                    "retry": {
-                        "retries": retries,
-                    },
+                    "retry": retry,
                 }
 
         vendors_config.append(vendor_config)
     return vendors_config
 
 
-def create_services(vendors_config: list[dict]) -> list[EmailService]:
-    services = []
-    for config in vendors_config:
-        vendor = NoOpEmailSender(config["name"])
-        middlewares = []
-        for middleware in config.get("middlewares", []):
-            if middleware == "rl":
-                m = RateLimiter(
-                    config["rate_limiter"]["max_attempts"],
-                    config["rate_limiter"]["per_seconds"],
-                )
-            if middleware == "cb":
-                m = CircuitBreaker(
-                    config["circuit_breaker"]["threshold"],
-                    config["circuit_breaker"]["reset_timeout"],
-                )
-            elif middleware == "retry":
-                m = Retry(
-                    config["retry"]["retries"],
-                )
-            middlewares.append(m)
-        service = EmailService(vendor, middlewares)
-        services.append(service)
-    return services
-
-
-def generate_emails(num_emails):
-    for i in range(num_emails):
+def generate_emails(num_emails, start=0):
+    # generating is part of the measured send loop: only the subject is numbered, the body is a shared constant
+    for i in range(start, start + num_emails):
         yield EmailMessage(
             subject=f"Test Email {i}",
-            body=f"This is a test email {i}",
-            to="email",
+            body="This is a test email",
+            to=["email"],
             from_email="from",
         )
 
 
-def send_emails(services, email_count, with_state_failover):
+def send_emails(services, email_count, with_state_failover, routing: Optional[RoutingStrategy] = None, start: int = 0):
     if with_state_failover:
         failover = EmailFailoverWithState(services)  # or EmailFailover
     else:
-        failover = EmailFailover(services)
-    errors = []
+        failover = EmailFailover(services, routing)
+    errors = 0
 
-    for message in generate_emails(num_emails=email_count):
+    for message in generate_emails(num_emails=email_count, start=start):
         if not failover.send_email(message):
-            errors.append(message)
+            errors += 1
 
     return errors
 
 
+@dataclass(slots=True)
+class SimulationReport:
+    """Emails sent by a worker, or by all of them once the reports are merged."""
+
+    emails: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "SimulationReport") -> "SimulationReport":
+        # the workers send at the same time, the simulation lasts as long as the slowest one
+        return SimulationReport(
+            self.emails + other.emails, self.errors + other.errors, max(self.seconds, other.seconds)
+        )
+
+    @property
+    def rate(self) -> float:
+        return self.emails / self.seconds if self.seconds else 0.0
+
+
+def shard(email_count: int, workers: int) -> list[tuple[int, int]]:
+    """(start, count) of the emails of each worker, contiguous and as even as possible."""
+    size, extra = divmod(email_count, workers)
+    shards, start = [], 0
+    for worker in range(workers):
+        count = size + (worker < extra)
+        if count:
+            shards.append((start, count))
+        start += count
+    return shards
+
+
+def simulate_shard(
+    vendors_config: list[dict],
+    start: int,
+    email_count: int,
+    with_state_failover: bool = False,
+    routing: str = "ordered",
+    weights: Optional[list[int]] = None,
+) -> SimulationReport:
+    """Sends the emails `start` to `start + email_count` with services of its own (the work of a worker)."""
+    services = create_services(vendors_config)
+    strategy = create_routing(routing, len(services), weights)
+    began = time.perf_counter()
+    errors = send_emails(services, email_count, with_state_failover, strategy, start=start)
+    return SimulationReport(email_count, errors, time.perf_counter() - began)
+
+
+def run_simulation(
+    vendors_config: list[dict],
+    email_count: int,
+    workers: int = 1,
+    with_state_failover: bool = False,
+    routing: str = "ordered",
+    weights: Optional[list[int]] = None,
+) -> SimulationReport:
+    """Sends `email_count` emails split among `workers` processes and merges their reports.
+
+    Each worker creates its own services from `vendors_config`: quotas and circuit breakers are per worker, unless
+    the configs have a `state_dir` to share them. The workers are spawned, not forked: they don't inherit the log
+    file of the CLI (each one would rotate it on its own), only the stderr logs.
+    """
+    shards = shard(email_count, workers)
+    if len(shards) <= 1:
+        return simulate_shard(vendors_config, 0, email_count, with_state_failover, routing, weights)
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(simulate_shard, vendors_config, start, count, with_state_failover, routing, weights)
+            for start, count in shards
+        ]
+        reports = [future.result() for future in futures]
+    return functools.reduce(SimulationReport.merge, reports)
+
+
 def command_simulate(args):
     if len(args.vendors) != args.vendor_count or len(args.middlewares) != args.vendor_count:
         raise ValueError("Number of vendors must match number of vendors_count")
+    if args.weights and len(args.weights) != args.vendor_count:
+        raise ValueError("Number of weights must match number of vendors_count")
+    if args.workers < 1:
+        raise ValueError("Number of workers must be at least 1")
 
     vendors_config = parse_args(args)
-    services = create_services(vendors_config)
-    errors = send_emails(services, args.email_count, args.with_state_failover)
+    began = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="email-throttle-") as state_dir:
+        if args.shared_vendor_state:
+            # a directory of this run: quotas used by a previous simulation don't carry over
+            vendors_config = [{**config, "state_dir": state_dir} for config in vendors_config]
+        report = run_simulation(
+            vendors_config, args.email_count, args.workers, args.with_state_failover, args.routing, args.weights
+        )
+    # the whole run, spawning the workers and creating their services included, not only their send loops
+    report.seconds = time.perf_counter() - began
 
-    logger.info(f"Emails {args.email_count}")
-    logger.info(f"Errors {len(errors)}")
+    logger.info(f"Emails {report.emails}")
+    logger.info(f"Errors {report.errors}")
+    logger.info(f"Sent in {report.seconds:.3f}s ({report.rate:.0f} emails/s) by {args.workers} workers")
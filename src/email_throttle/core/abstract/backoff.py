@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 
 class Backoff(ABC):
     @abstractmethod
-    def get_delay(self, attempt: int) -> int:
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
+        """Seconds to wait before the retry `attempt` (1 is the first retry).
+        `error` is the exception of the failed attempt and `previous` the delay used before it, if any."""
         pass
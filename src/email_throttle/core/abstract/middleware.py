@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable
 
 
 class Middleware(ABC):
@@ -10,3 +10,31 @@ class Middleware(ABC):
     @abstractmethod
     def call(self, func: Callable) -> Any:
         pass
+
+    def call_many(self, func: Callable, permits: int) -> Any:
+        """Wraps a batch of `permits` messages. By default a batch counts as a single call."""
+        return self.call(func)
+
+    def is_available(self) -> bool:
+        """Whether a call would be admitted right now, without consuming anything (used to route around it)."""
+        return True
+
+
+class AsyncMiddleware(ABC):
+    """Middleware for the asyncio pipeline: `call` receives a coroutine function and must await it."""
+
+    @abstractmethod
+    def allow_request(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        pass
+
+    async def call_many(self, func: Callable[[], Awaitable[Any]], permits: int) -> Any:
+        """Wraps a batch of `permits` messages. By default a batch counts as a single call."""
+        return await self.call(func)
+
+    def is_available(self) -> bool:
+        """Whether a call would be admitted right now, without consuming anything (used to route around it)."""
+        return True
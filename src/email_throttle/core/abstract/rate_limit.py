@@ -0,0 +1,19 @@
+from abc import ABC, abstractmethod
+
+
+class RateLimitEngine(ABC):
+    """Admission algorithm used by the rate limiter middlewares.
+
+    Implementations must run in constant (or amortised constant) time per call and
+    measure time with `time.monotonic()`, so wall-clock adjustments never open or close the window.
+    """
+
+    @abstractmethod
+    def try_acquire(self, permits: int = 1) -> bool:
+        """Consumes `permits` if they are available right now, otherwise leaves the state untouched."""
+        pass
+
+    @abstractmethod
+    def wait_time(self, permits: int = 1) -> float:
+        """Seconds until `permits` could be acquired (0 if they are available now, inf if they never fit)."""
+        pass
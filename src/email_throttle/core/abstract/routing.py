@@ -0,0 +1,22 @@
+from abc import ABC, abstractmethod
+
+
+class RoutingStrategy(ABC):
+    """Chooses the order in which a failover tries its services.
+
+    The failover reports every send to the strategy (`started` and `finished`), so strategies can keep
+    load or latency statistics. Implementations are shared by concurrent senders and must be thread-safe.
+    """
+
+    @abstractmethod
+    def order(self, size: int) -> list[int]:
+        """Indexes of the `size` services, in the order they should be tried for the next message."""
+        pass
+
+    def started(self, index: int):
+        """Called right before the service `index` sends."""
+        pass
+
+    def finished(self, index: int, elapsed: float, success: bool):
+        """Called when the send of the service `index` ends, `elapsed` in seconds."""
+        pass
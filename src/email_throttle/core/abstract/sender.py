@@ -1,5 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Sequence
 
 from email_throttle.core.entity import EmailMessage
 
@@ -16,3 +17,37 @@ class EmailSender(ABC):
     @abstractmethod
     def send_email(self, message: "EmailMessage") -> Any:
         pass
+
+    def send_many(self, messages: Sequence["EmailMessage"]) -> list[tuple[bool, Any]]:
+        """Sends a batch, returning a (sent, result or error) per message.
+
+        Vendors with a bulk API should override it to send the batch in a single round trip,
+        this default sends the messages one by one.
+        """
+        results = []
+        for message in messages:
+            try:
+                results.append((True, self.send_email(message)))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+
+class AsyncEmailSender(ABC):
+    """Vendor sender for the asyncio pipeline, the vendor call must not block the event loop."""
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @abstractmethod
+    async def send_email(self, message: "EmailMessage") -> Any:
+        pass
+
+    async def send_many(self, messages: Sequence["EmailMessage"]) -> list[tuple[bool, Any]]:
+        """Same as `EmailSender.send_many`, this default sends the messages concurrently."""
+        results = await asyncio.gather(*(self.send_email(message) for message in messages), return_exceptions=True)
+        return [(not isinstance(result, Exception), result) for result in results]
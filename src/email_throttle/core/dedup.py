@@ -0,0 +1,165 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def bloom_parameters(capacity: int, error_rate: float) -> tuple[int, int]:
+    """Bits and hash functions of a Bloom filter holding `capacity` keys with the `error_rate` false positive rate."""
+    bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+class BloomFilter:
+    """Set membership in a fixed size bit array: no false negatives, false positives at a known rate.
+
+    The bits can be any writable buffer (e.g.: a memory map shared by several processes).
+    Positions come from a single blake2b digest split in two hashes (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[memoryview] = None):
+        self.size, self.hashes = bloom_parameters(capacity, error_rate)
+        self.bits = bits if bits is not None else bytearray(self.byte_size(capacity, error_rate))
+
+    @staticmethod
+    def byte_size(capacity: int, error_rate: float) -> int:
+        return (bloom_parameters(capacity, error_rate)[0] + 7) // 8
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] >> (position & 7) & 1 for position in self._positions(key))
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+
+    def false_positive_rate(self) -> float:
+        """Estimated from the bits set: the chance that every position of a new key is already set."""
+        return (int.from_bytes(self.bits).bit_count() / self.size) ** self.hashes
+
+
+class TimeWindowBloomFilter:
+    """Keys added in the last `window` seconds, in two Bloom filters of `capacity` keys each.
+
+    Keys are added to the current filter. When it is `window` seconds old, the previous one is cleared and
+    becomes the current one, so a key is remembered between `window` and twice `window` seconds,
+    and memory doesn't grow with the traffic. Not thread safe, see `IdempotencyIndex`.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, window: float, buffers: Optional[tuple] = None):
+        self.window = window
+        self.filters = [BloomFilter(capacity, error_rate, bits) for bits in (buffers or (None, None))]
+        self.current = 0
+        self.rotated_at = time.monotonic()
+
+    def _rotate(self):
+        elapsed = time.monotonic() - self.rotated_at
+        if elapsed < self.window:
+            return
+        previous = 1 - self.current
+        self.filters[previous].clear()
+        if elapsed >= 2 * self.window:
+            self.filters[self.current].clear()
+        self.current = previous
+        self.rotated_at = time.monotonic()
+
+    def add(self, key: str):
+        self._rotate()
+        self.filters[self.current].add(key)
+
+    def __contains__(self, key: str) -> bool:
+        self._rotate()
+        return any(key in bloom for bloom in self.filters)
+
+    def false_positive_rate(self) -> float:
+        rates = [bloom.false_positive_rate() for bloom in self.filters]
+        if max(rates) >= 1:
+            return 1.0
+        # 1 - prod(1 - rate), without rounding small rates to 0
+        return -math.expm1(sum(math.log1p(-rate) for rate in rates))
+
+    def memory(self) -> int:
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+
+class IdempotencyIndex:
+    """Idempotency keys of the emails already sent, checked before calling a vendor.
+
+    A key is claimed before sending and released after it: only a sent email records its key, so a failed one
+    can be retried, and a key in flight can't be claimed twice. The last `exact_size` keys are kept in an exact LRU,
+    older ones only in the time windowed Bloom filter.
+    A key found in the LRU is a duplicate. A key found only in the filter is either older than the LRU or
+    a false positive: it is counted as `uncertain` and sent anyway, unless `strict`, which drops it (at most
+    `error_rate` of the new keys) to deduplicate over the whole filter window, e.g. with a filter shared by
+    the consumers of the node.
+    """
+
+    def __init__(self, bloom: TimeWindowBloomFilter, exact_size: int = 100_000, strict: bool = False):
+        self.bloom = bloom
+        self.exact_size = exact_size
+        self.strict = strict
+        self.recent: OrderedDict[str, None] = OrderedDict()
+        self.in_flight: set[str] = set()
+        self.duplicates = 0
+        self.uncertain = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, window: float = 3600, capacity: int = 1_000_000, error_rate: float = 1e-6, **kwargs):
+        return cls(TimeWindowBloomFilter(capacity, error_rate, window), **kwargs)
+
+    def claim(self, key: str) -> bool:
+        """False when the email of this key was already sent (or is being sent): it must not be sent again."""
+        with self._lock:
+            if key in self.in_flight:
+                self.duplicates += 1
+                return False
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                self.duplicates += 1
+                return False
+            if key in self.bloom:
+                self.uncertain += 1
+                if self.strict:
+                    self.duplicates += 1
+                    return False
+            self.in_flight.add(key)
+            return True
+
+    def release(self, key: str, sent: bool):
+        with self._lock:
+            self.in_flight.discard(key)
+            if not sent:
+                return
+            self.bloom.add(key)
+            self.recent[key] = None
+            if len(self.recent) > self.exact_size:
+                self.recent.popitem(last=False)
+
+    def __str__(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['duplicates']} duplicates, {stats['uncertain']} uncertain, {stats['recent_keys']} recent keys, "
+            f"false positive rate {stats['false_positive_rate']:.2g}, filter {stats['filter_bytes'] / 2**20:.1f} MB"
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "recent_keys": len(self.recent),
+                "duplicates": self.duplicates,
+                "uncertain": self.uncertain,
+                "false_positive_rate": self.bloom.false_positive_rate(),
+                "filter_bytes": self.bloom.memory(),
+            }
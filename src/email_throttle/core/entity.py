@@ -1,25 +1,54 @@
+from dataclasses import dataclass, field
+from enum import StrEnum
 from typing import Optional
 
 
+class Priority(StrEnum):
+    """Class of an email: queued emails of each class go to their own queue (lane), consumed by weight."""
+
+    TRANSACTIONAL = "transactional"
+    BULK = "bulk"
+
+
+@dataclass(slots=True)
 class EmailMessage:
-    def __init__(
-        self,
-        subject: str,
-        body: str,
-        to: list[str],
-        from_email: str,
-        cc: Optional[list[str]] = None,
-        bcc: Optional[list[str]] = None,
-        attachments: Optional[list[str]] = None,
-        is_html: bool = False,
-        links: Optional[list[str]] = None,
-    ):
-        self.subject = subject
-        self.body = body
-        self.to = to
-        self.from_email = from_email
-        self.cc = cc or []
-        self.bcc = bcc or []
-        self.attachments = attachments or []
-        self.is_html = is_html
-        self.links = links or []
+    """An email to send.
+
+    A slotted dataclass: no per instance `__dict__`, which matters with many messages in flight, and the optional
+    lists are tuples defaulting to a shared `()`, so a message without them allocates nothing for them.
+    Being a dataclass, pydantic can validate JSON straight into it (see `infra/rabbit/serializers.py`).
+    """
+
+    subject: str
+    body: str
+    to: list[str]
+    from_email: str
+    cc: tuple[str, ...] = ()
+    bcc: tuple[str, ...] = ()
+    attachments: tuple[str, ...] = ()
+    is_html: bool = False
+    links: tuple[str, ...] = ()
+    # same key for every copy of the message (hedged or retried sends), so vendors can deduplicate them
+    idempotency_key: Optional[str] = None
+    priority: Priority = Priority.BULK
+
+
+@dataclass(slots=True, frozen=True)
+class EmailTemplate:
+    """Subject and body with `$name` (or `${name}`) placeholders, rendered per recipient (see `core/templates.py`)."""
+
+    subject: str
+    body: str
+    from_email: str
+    is_html: bool = False
+
+
+@dataclass(slots=True)
+class TemplatedEmail:
+    """An email to render from a registered template at send time: only the recipient and its variables are queued."""
+
+    template_id: str
+    to: list[str]
+    variables: dict[str, str] = field(default_factory=dict)
+    idempotency_key: Optional[str] = None
+    priority: Priority = Priority.BULK
@@ -0,0 +1,26 @@
+from typing import Optional
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a rate limiter rejects a request.
+
+    `retry_after` holds the seconds until the limiter could admit the request again, when known.
+    """
+
+    def __init__(self, message: str = "Too many requests", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BatchFailed(Exception):
+    """Raised in the batch pipeline when the vendor failed every message of a batch, so the middlewares see the
+    failure (a circuit breaker counts it, a retry resends the batch). `results` holds the error of each message."""
+
+    def __init__(self, results: list):
+        super().__init__(f"Every message of the batch failed: {results[0][1]!r}")
+        self.results = results
+
+
+class PoisonMessage(Exception):
+    """Raised by a message handler for a message that no attempt could send (e.g.: a template that can't be
+    rendered with its variables): the consumer dead-letters it instead of retrying it."""
@@ -1,38 +1,97 @@
+import threading
+import time
+from typing import Any, Iterator, Optional
+
 from loguru import logger
 
+from email_throttle.core.abstract.routing import RoutingStrategy
 from email_throttle.core.entity import EmailMessage
-from email_throttle.core.service import EmailService
+from email_throttle.core.log_sampling import SampledLog
+from email_throttle.core.routing import OrderedRouting
+from email_throttle.core.service import AsyncEmailService, EmailService
 
 
 class EmailFailover:
     """
     A class to manage email sending through multiple services with failover support.
 
-    If one email service fails, the next service in the list is tried until either
+    If one email service fails, the next service is tried until either
     an email is successfully sent or all services have been attempted.
+    The order comes from the routing strategy (list order by default, see `core/routing.py`),
+    and services whose middlewares would reject the message right now are skipped without calling them.
     """
 
-    def __init__(self, services: list[EmailService]):
+    def __init__(self, services: list[EmailService], routing: Optional[RoutingStrategy] = None):
         self.services = services
+        self.routing = routing or OrderedRouting()
+        # during an outage these happen on every message
+        self._skipped_log = SampledLog()
+        self._failed_log = SampledLog(level="ERROR")
+
+    def _routed(self) -> Iterator[tuple[int, EmailService]]:
+        """Available services, in the order of the routing strategy."""
+        for index in self.routing.order(len(self.services)):
+            service = self.services[index]
+            if service.is_available():
+                yield index, service
+            else:
+                self._skipped_log.log("Service {} is not available. Skipping it.", service.name)
 
     def send_email(self, message: EmailMessage) -> bool:
         """
-        Attempts to send the given email message using the available services in order.
+        Attempts to send the given email message using the available services in routing order.
 
-        This method tries to send the email using each service in the list until one succeeds.
+        This method tries to send the email using each service until one succeeds.
         If all services fail, it returns False.
         """
-        for service in self.services:
+        for index, service in self._routed():
             logger.info(f"Trying to send email with {service.name}")
+            self.routing.started(index)
+            start = time.perf_counter()
             result, _ = service.send_email(message)
+            self.routing.finished(index, time.perf_counter() - start, result)
             if result:
                 logger.info(f"Email sent using {service.name}.")
                 return True
             else:
                 logger.warning(f"Service {service.name} failed. Trying next service.")
-        logger.error("All email services failed.")
+        self._failed_log.log("All email services failed.")
         return False
 
+    def send_many(self, messages: list[EmailMessage]) -> list[bool]:
+        """
+        Sends the batch with each service in order, only the messages that failed go to the next service.
+        Returns whether each message was sent.
+        """
+        sent = [False] * len(messages)
+        pending = list(range(len(messages)))
+        for index, service in self._routed():
+            if not pending:
+                break
+            logger.info(f"Trying to send {len(pending)} emails with {service.name}")
+            self.routing.started(index)
+            start = time.perf_counter()
+            results = service.send_many([messages[i] for i in pending])
+            failed = _mark_sent(sent, pending, results)
+            self.routing.finished(index, time.perf_counter() - start, len(failed) < len(pending))
+            pending = failed
+            if pending:
+                logger.warning(f"Service {service.name} failed for {len(pending)} emails. Trying next service.")
+        if pending:
+            self._failed_log.log("All email services failed for {} emails.", len(pending))
+        return sent
+
+
+def _mark_sent(sent: list[bool], pending: list[int], results: list[tuple[bool, Any]]) -> list[int]:
+    """Marks the successful messages of a batch and returns the positions that are still pending."""
+    failed = []
+    for index, (result, _) in zip(pending, results):
+        if result:
+            sent[index] = True
+        else:
+            failed.append(index)
+    return failed
+
 
 class EmailFailoverWithState:
     """
@@ -40,7 +99,7 @@ class EmailFailoverWithState:
 
     Emails are sent one by one. If a service fails, the next service in the list is used.
     If a service succeeds, subsequent emails continue with this service until it fails.
-
+    A service whose middlewares would reject the email right now counts as failed, without calling it.
     """
 
     def __init__(self, services: list[EmailService], max_retries: int = 10000):
@@ -48,16 +107,40 @@ class EmailFailoverWithState:
         self.current_service_index = 0
         self.cycles = 0
         self.max_retries = max_retries
+        self._lock = threading.Lock()
+        # failed or not available, during an outage it happens on every message
+        self._failover_log = SampledLog()
+
+    def _next_service(self, failed_index: int):
+        """Moves to the service after `failed_index`.
+        If a concurrent send already moved on, its choice is kept, so a failing service is only skipped once."""
+        with self._lock:
+            if self.current_service_index == failed_index:
+                self.current_service_index = (failed_index + 1) % len(self.services)
+                if self.current_service_index == 0:
+                    self.cycles += 1
 
     def send_email(self, message: EmailMessage) -> bool:
         """
         Attempts to send the given email message using the current email service.
         If the service fails, it moves to the next service in the list and tries again.
+        It raises when the services have been cycled more than `max_retries` times, or as soon as a whole cycle
+        finds no available service.
         """
+        unavailable = 0
         while self.current_service_index < len(self.services):
-            current_service = self.services[self.current_service_index]
-            logger.info(f"Trying to send email with {current_service.name}")
-            result, _ = current_service.send_email(message)
+            index = self.current_service_index
+            current_service = self.services[index]
+            if not current_service.is_available():
+                unavailable += 1
+                if unavailable == len(self.services):
+                    # a whole cycle without an available service, cycling again would only spin
+                    raise Exception("No email service available")
+                result = False
+            else:
+                unavailable = 0
+                logger.info(f"Trying to send email with {current_service.name}")
+                result, _ = current_service.send_email(message)
             if result:
                 logger.info(f"Email sent using {current_service.name}.")
                 self.cycles = 0
@@ -66,9 +149,181 @@ class EmailFailoverWithState:
                 logger.error("All email services failed. Raise and an error.")
                 raise Exception("Max retries reached")
             else:
-                logger.warning(f"Service {current_service.name} failed. Trying next service.")
-                self.current_service_index = (self.current_service_index + 1) % len(self.services)
-                if self.current_service_index == 0:
-                    self.cycles += 1
+                self._failover_log.log("Service {} failed. Trying next service.", current_service.name)
+                self._next_service(index)
+        logger.info("All email services failed.")
+        return False
+
+    def send_many(self, messages: list[EmailMessage]) -> list[bool]:
+        """
+        Sends the batch with the current service, the messages that failed are sent again with the next one.
+        Like `send_email`, it raises when the services have been cycled more than `max_retries` times, or as soon
+        as a whole cycle finds no available service.
+        """
+        sent = [False] * len(messages)
+        pending = list(range(len(messages)))
+        unavailable = 0
+        while pending:
+            index = self.current_service_index
+            current_service = self.services[index]
+            if not current_service.is_available():
+                unavailable += 1
+                if unavailable == len(self.services):
+                    raise Exception("No email service available")
+                failed = pending
+            else:
+                unavailable = 0
+                logger.info(f"Trying to send {len(pending)} emails with {current_service.name}")
+                results = current_service.send_many([messages[i] for i in pending])
+                failed = _mark_sent(sent, pending, results)
+            if len(failed) < len(pending):
+                self.cycles = 0
+            if not failed:
+                logger.info(f"Emails sent using {current_service.name}.")
+            elif self.cycles > self.max_retries:
+                logger.error("All email services failed. Raise and an error.")
+                raise Exception("Max retries reached")
+            else:
+                self._failover_log.log(
+                    "Service {} failed for {} emails. Trying next service.", current_service.name, len(failed)
+                )
+                self._next_service(index)
+            pending = failed
+        return sent
+
+
+class AsyncEmailFailover(EmailFailover):
+    """asyncio counterpart of `EmailFailover`."""
+
+    def __init__(self, services: list[AsyncEmailService], routing: Optional[RoutingStrategy] = None):
+        super().__init__(services, routing)
+
+    async def send_email(self, message: EmailMessage) -> bool:
+        """
+        Attempts to send the given email message using the available services in routing order.
+        If all services fail, it returns False.
+        """
+        for index, service in self._routed():
+            logger.info(f"Trying to send email with {service.name}")
+            self.routing.started(index)
+            start = time.perf_counter()
+            result, _ = await service.send_email(message)
+            self.routing.finished(index, time.perf_counter() - start, result)
+            if result:
+                logger.info(f"Email sent using {service.name}.")
+                return True
+            else:
+                logger.warning(f"Service {service.name} failed. Trying next service.")
+        self._failed_log.log("All email services failed.")
+        return False
+
+    async def send_many(self, messages: list[EmailMessage]) -> list[bool]:
+        """Same as `EmailFailover.send_many`."""
+        sent = [False] * len(messages)
+        pending = list(range(len(messages)))
+        for index, service in self._routed():
+            if not pending:
+                break
+            logger.info(f"Trying to send {len(pending)} emails with {service.name}")
+            self.routing.started(index)
+            start = time.perf_counter()
+            results = await service.send_many([messages[i] for i in pending])
+            failed = _mark_sent(sent, pending, results)
+            self.routing.finished(index, time.perf_counter() - start, len(failed) < len(pending))
+            pending = failed
+            if pending:
+                logger.warning(f"Service {service.name} failed for {len(pending)} emails. Trying next service.")
+        if pending:
+            self._failed_log.log("All email services failed for {} emails.", len(pending))
+        return sent
+
+
+class AsyncEmailFailoverWithState:
+    """
+    asyncio counterpart of `EmailFailoverWithState`.
+
+    The current service is shared by all the sends in flight: when one of them fails over,
+    the following sends start with the new service.
+    """
+
+    def __init__(self, services: list[AsyncEmailService], max_retries: int = 10000):
+        self.services = services
+        self.current_service_index = 0
+        self.cycles = 0
+        self.max_retries = max_retries
+        # failed or not available, during an outage it happens on every message
+        self._failover_log = SampledLog()
+
+    def _next_service(self, failed_index: int):
+        """Same as `EmailFailoverWithState._next_service`, without lock: sends only interleave at `await` points."""
+        if self.current_service_index == failed_index:
+            self.current_service_index = (failed_index + 1) % len(self.services)
+            if self.current_service_index == 0:
+                self.cycles += 1
+
+    async def send_email(self, message: EmailMessage) -> bool:
+        """
+        Attempts to send the given email message using the current email service.
+        If the service fails, it moves to the next service in the list and tries again.
+        It raises when the services have been cycled more than `max_retries` times, or as soon as a whole cycle
+        finds no available service.
+        """
+        unavailable = 0
+        while self.current_service_index < len(self.services):
+            index = self.current_service_index
+            current_service = self.services[index]
+            if not current_service.is_available():
+                unavailable += 1
+                if unavailable == len(self.services):
+                    # a whole cycle without an available service, cycling again would only spin
+                    raise Exception("No email service available")
+                result = False
+            else:
+                unavailable = 0
+                logger.info(f"Trying to send email with {current_service.name}")
+                result, _ = await current_service.send_email(message)
+            if result:
+                logger.info(f"Email sent using {current_service.name}.")
+                self.cycles = 0
+                return True
+            elif self.cycles > self.max_retries:
+                logger.error("All email services failed. Raise and an error.")
+                raise Exception("Max retries reached")
+            else:
+                self._failover_log.log("Service {} failed. Trying next service.", current_service.name)
+                self._next_service(index)
         logger.info("All email services failed.")
         return False
+
+    async def send_many(self, messages: list[EmailMessage]) -> list[bool]:
+        """Same as `EmailFailoverWithState.send_many`."""
+        sent = [False] * len(messages)
+        pending = list(range(len(messages)))
+        unavailable = 0
+        while pending:
+            index = self.current_service_index
+            current_service = self.services[index]
+            if not current_service.is_available():
+                unavailable += 1
+                if unavailable == len(self.services):
+                    raise Exception("No email service available")
+                failed = pending
+            else:
+                unavailable = 0
+                logger.info(f"Trying to send {len(pending)} emails with {current_service.name}")
+                results = await current_service.send_many([messages[i] for i in pending])
+                failed = _mark_sent(sent, pending, results)
+            if len(failed) < len(pending):
+                self.cycles = 0
+            if not failed:
+                logger.info(f"Emails sent using {current_service.name}.")
+            elif self.cycles > self.max_retries:
+                logger.error("All email services failed. Raise and an error.")
+                raise Exception("Max retries reached")
+            else:
+                self._failover_log.log(
+                    "Service {} failed for {} emails. Trying next service.", current_service.name, len(failed)
+                )
+                self._next_service(index)
+            pending = failed
+        return sent
@@ -0,0 +1,195 @@
+import dataclasses
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Optional
+
+from loguru import logger
+
+from email_throttle.core.abstract.routing import RoutingStrategy
+from email_throttle.core.entity import EmailMessage
+from email_throttle.core.failover import EmailFailover
+from email_throttle.core.service import EmailService
+
+
+class LatencyWindow:
+    """The last `size` send latencies, in seconds, to estimate a percentile."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Nearest-rank percentile of the window, None if it is empty."""
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        rank = max(int(round(percentile / 100 * len(samples))) - 1, 0)
+        return samples[min(rank, len(samples) - 1)]
+
+
+class HedgeMetrics:
+    """Counters of a `HedgedEmailFailover`.
+
+    - `hedge_rate`: share of the messages that needed a hedged send.
+    - `hedge_wins`: hedged sends that answered before the primary one.
+    - `saved_latency`: seconds saved by the hedge wins, measured when the primary send finishes later.
+    """
+
+    def __init__(self):
+        self.sends = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved_latency = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedges / self.sends if self.sends else 0.0
+
+    def record(self, hedged: bool, hedge_won: bool):
+        with self._lock:
+            self.sends += 1
+            self.hedges += hedged
+            self.hedge_wins += hedge_won
+
+    def record_saved(self, seconds: float):
+        with self._lock:
+            self.saved_latency += seconds
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "sends": self.sends,
+                "hedges": self.hedges,
+                "hedge_rate": self.hedge_rate,
+                "hedge_wins": self.hedge_wins,
+                "saved_latency": self.saved_latency,
+            }
+
+
+class HedgedEmailFailover(EmailFailover):
+    """
+    `EmailFailover` that sends speculatively to cut the tail latency.
+
+    The email is sent with the first available service (routing order). If it hasn't answered after the hedge delay,
+    the same email is also sent with the next available service, and the first success wins.
+    The hedge delay is the `percentile` of the recent send latencies (`initial_delay` until `min_samples` are known),
+    so only the slowest sends are hedged. A failed send fails over to the next service right away, like `EmailFailover`.
+
+    Sends run in a thread pool. The loser can't be interrupted once the vendor is called: a copy that has not started
+    yet when the winner answers is cancelled, and every copy carries the same `idempotency_key` (one is generated if the
+    message has none, on a copy: the caller's message is left as is) so vendors can deduplicate the rest.
+    Batches (`send_many`) are not hedged.
+    """
+
+    def __init__(
+        self,
+        services: list[EmailService],
+        routing: Optional[RoutingStrategy] = None,
+        percentile: float = 95,
+        initial_delay: float = 0.5,
+        min_samples: int = 20,
+        max_hedges: int = 1,
+        window: int = 200,
+        max_workers: Optional[int] = None,
+    ):
+        super().__init__(services, routing)
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.latency = LatencyWindow(window)
+        self.metrics = HedgeMetrics()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or 4 * len(services), thread_name_prefix="hedged-send"
+        )
+
+    def hedge_delay(self) -> float:
+        if len(self.latency) < self.min_samples:
+            return self.initial_delay
+        return self.latency.percentile(self.percentile)
+
+    def _attempt(self, index: int, service: EmailService, message: EmailMessage, won: threading.Event) -> Any:
+        """Runs in the pool. Returns None, without sending, when another copy already won."""
+        if won.is_set():
+            return None
+        self.routing.started(index)
+        start = time.perf_counter()
+        result = service.send_email(message)
+        elapsed = time.perf_counter() - start
+        self.routing.finished(index, elapsed, result[0])
+        if result[0]:
+            self.latency.add(elapsed)
+        return result
+
+    def send_email(self, message: EmailMessage) -> bool:
+        """
+        Sends the email with hedging, returns whether any service sent it.
+        """
+        if message.idempotency_key is None:
+            message = dataclasses.replace(message, idempotency_key=uuid.uuid4().hex)
+        candidates = self._routed()
+        won = threading.Event()
+        pending: dict[Future, int] = {}
+
+        def launch() -> Optional[Future]:
+            for index, service in candidates:
+                logger.info(f"Trying to send email with {service.name}")
+                future = self.executor.submit(self._attempt, index, service, message, won)
+                pending[future] = index
+                return future
+            return None
+
+        primary = launch()
+        hedges = 0
+        hedging = self.max_hedges > 0
+        deadline = time.perf_counter() + self.hedge_delay()
+        while pending:
+            timeout = max(deadline - time.perf_counter(), 0) if hedging else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # the delay expired: hedge with the next service, stop hedging when there is none
+                if launch():
+                    hedges += 1
+                    deadline = time.perf_counter() + self.hedge_delay()
+                    hedging = hedges < self.max_hedges
+                else:
+                    hedging = False
+                continue
+            for future in done:
+                index = pending.pop(future)
+                result = future.result()
+                if result and result[0]:
+                    won.set()
+                    logger.info(f"Email sent using {self.services[index].name}.")
+                    self._finish(primary, future, pending, hedged=hedges > 0)
+                    return True
+            if not pending and launch():
+                # failed over, the new send gets its own hedge delay
+                deadline = time.perf_counter() + self.hedge_delay()
+        self.metrics.record(hedged=hedges > 0, hedge_won=False)
+        self._failed_log.log("All email services failed.")
+        return False
+
+    def _finish(self, primary: Future, winner: Future, pending: dict[Future, int], hedged: bool):
+        hedge_won = hedged and winner is not primary
+        self.metrics.record(hedged=hedged, hedge_won=hedge_won)
+        for future in pending:
+            future.cancel()
+        if hedge_won and not primary.done():
+            won_at = time.perf_counter()
+            primary.add_done_callback(lambda _: self.metrics.record_saved(time.perf_counter() - won_at))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
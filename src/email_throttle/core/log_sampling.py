@@ -0,0 +1,32 @@
+import threading
+import time
+
+from loguru import logger
+
+
+class SampledLog:
+    """Logs a repeated event at most once every `interval` seconds.
+
+    The message is only formatted (loguru `str.format` style arguments) when it is emitted,
+    and it reports how many occurrences were skipped since the previous one. Meant for events that
+    can happen on every message, e.g. a vendor outage, so they don't flood the logs.
+    """
+
+    def __init__(self, interval: float = 5.0, level: str = "WARNING"):
+        self.interval = interval
+        self.level = level
+        self.next_at = 0.0
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def log(self, message: str, *args):
+        now = time.monotonic()
+        with self._lock:
+            if now < self.next_at:
+                self.suppressed += 1
+                return
+            suppressed, self.suppressed = self.suppressed, 0
+            self.next_at = now + self.interval
+        if suppressed:
+            message += f" ({suppressed} more since the last report)"
+        logger.opt(depth=1).log(self.level, message, *args)
@@ -1,48 +1,78 @@
+import threading
 from datetime import datetime
+from typing import Any, Awaitable, Callable
 
 from loguru import logger
 
-from email_throttle.core.abstract.middleware import Middleware
+from email_throttle.core.abstract.middleware import AsyncMiddleware, Middleware
 
 
 class CircuitBreaker(Middleware):
+    """Rejects the calls for `reset_timeout` seconds after `failure_threshold` failures.
+
+    State transitions run under a lock, so it can be shared by concurrent senders.
+    The lock is only held to read and update the counters, never while the wrapped function runs.
+    Once the timeout expires, a single call probes the vendor (HALF-OPEN) and the others are rejected until it
+    succeeds or fails. A probe that doesn't report back within `reset_timeout` is presumed lost, another is admitted.
+    """
+
     def __init__(self, failure_threshold: int, reset_timeout: int):
         self.failure_threshold = failure_threshold
         self.reset_timeout = reset_timeout
         self.failure_count = 0
         self.last_failure_time = None
         self.state = "CLOSED"
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def _admits(self, now: datetime) -> bool:
+        if self.state == "OPEN":
+            # if timeout between last failure surpased the reset timeout
+            return (now - self.last_failure_time).seconds >= self.reset_timeout
+        if self.state == "HALF-OPEN":
+            # a single probe at a time
+            return self._probe_started is None or (now - self._probe_started).total_seconds() >= self.reset_timeout
+        return True  # is closed
 
     def allow_request(self) -> bool:
         """the method allow_request returns if the request can be made,
         depending on the state of the circuit breaker or
         if the timeout has expired.
         """
-        if self.state == "OPEN":
-            timeout = (datetime.now() - self.last_failure_time).seconds
-            # if timeout between last failure surpased the reset timeout
-            if timeout >= self.reset_timeout:
+        with self._lock:
+            now = datetime.now()
+            if not self._admits(now):
+                return False  # continues open, or its probe is in flight
+            if self.state != "CLOSED":
                 self.state = "HALF-OPEN"
-                return True
-            return False  # continues open
-        return True  # is closed
+                self._probe_started = now
+            return True
+
+    def is_available(self) -> bool:
+        """Same decision as `allow_request`, without moving an expired open circuit to half-open."""
+        with self._lock:
+            return self._admits(datetime.now())
 
     def reset(self):
         """The reset method should be called when the circuit is in a
         half-open state and the wrapped function resumes operation."""
 
-        self.failure_count = 0
-        self.state = "CLOSED"
+        with self._lock:
+            self.failure_count = 0
+            self.state = "CLOSED"
+            self._probe_started = None
 
     def record_failure(self):
         """The record_failure method should be called when a failure occurs"""
-        self.failure_count += 1
-        self.last_failure_time = datetime.now()
-        # if the failure count is greater than or equal to the threshold,
-        # open the circuit
-        if self.failure_count >= self.failure_threshold:
-            self.state = "OPEN"
+        with self._lock:
+            self._probe_started = None
+            self.failure_count += 1
             self.last_failure_time = datetime.now()
+            # if the failure count is greater than or equal to the threshold,
+            # open the circuit
+            if self.failure_count >= self.failure_threshold:
+                self.state = "OPEN"
+                self.last_failure_time = datetime.now()
 
     def call(self, func):
         if not self.allow_request():
@@ -59,3 +89,23 @@ class CircuitBreaker(Middleware):
             logger.error(f"{e}")
             self.record_failure()
             raise e
+
+
+class AsyncCircuitBreaker(CircuitBreaker, AsyncMiddleware):
+    """Circuit breaker for the asyncio pipeline, same states and transitions as `CircuitBreaker`."""
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.allow_request():
+            msg = f"Circuit is {self.state}, expect the timeout was expired"
+            logger.error(msg)
+            raise Exception(msg)
+        try:
+            result = await func()
+            if self.state == "HALF-OPEN":
+                logger.info("Reopen CircuitBreaker")
+                self.reset()
+            return result
+        except Exception as e:
+            logger.error(f"{e}")
+            self.record_failure()
+            raise e
@@ -0,0 +1,122 @@
+import math
+import threading
+import time
+from collections import deque
+
+from email_throttle.core.abstract.rate_limit import RateLimitEngine
+
+# tolerance for the float accumulation of GCRA emission intervals
+_EPSILON = 1e-9
+
+# Every engine updates its state under a lock, held only for the few arithmetic operations of a decision:
+# an engine (and its rate limiter) can be shared by any number of threads and never admits more than its quota.
+
+
+class SlidingWindowEngine(RateLimitEngine):
+    """Exact sliding-window log: at most `max_requests` admits in any `per_second` window.
+
+    Timestamps are kept in arrival order, so expired entries are popped from the left
+    instead of rebuilding the whole list on every call (amortised O(1)).
+    Memory is O(max_requests).
+    """
+
+    def __init__(self, max_requests: int, per_second: float):
+        self.max_requests = max_requests
+        self.per_second = per_second
+        self.requests: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        threshold = now - self.per_second
+        requests = self.requests
+        while requests and requests[0] <= threshold:
+            requests.popleft()
+
+    def try_acquire(self, permits: int = 1) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+
+            if len(self.requests) + permits <= self.max_requests:
+                self.requests.extend([now] * permits)
+                return True
+            return False
+
+    def wait_time(self, permits: int = 1) -> float:
+        if permits > self.max_requests:
+            return math.inf
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+
+            overflow = len(self.requests) + permits - self.max_requests
+            if overflow <= 0:
+                return 0.0
+            # the request that has to expire to leave room for `permits`
+            return max(self.requests[overflow - 1] + self.per_second - now, 0.0)
+
+
+class TokenBucketEngine(RateLimitEngine):
+    """Token bucket: bursts up to `max_requests`, then refills at `max_requests / per_second` tokens per second.
+
+    O(1) time and memory, the state is the amount of tokens and the last refill time.
+    """
+
+    def __init__(self, max_requests: int, per_second: float):
+        self.capacity = max_requests
+        self.rate = max_requests / per_second
+        self.tokens = float(max_requests)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = max(now - self.updated_at, 0.0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, permits: int = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= permits:
+                self.tokens -= permits
+                return True
+            return False
+
+    def wait_time(self, permits: int = 1) -> float:
+        if permits > self.capacity:
+            return math.inf
+        with self._lock:
+            self._refill(time.monotonic())
+            return max((permits - self.tokens) / self.rate, 0.0)
+
+
+class GCRAEngine(RateLimitEngine):
+    """Generic Cell Rate Algorithm (a.k.a. virtual scheduling).
+
+    Every admit pushes the theoretical arrival time (TAT) by one emission interval
+    (`per_second / max_requests`). A request is rejected when the TAT would move further than
+    `per_second` into the future, which allows bursts of `max_requests`. The whole state is a single float.
+    """
+
+    def __init__(self, max_requests: int, per_second: float):
+        self.period = per_second
+        self.interval = per_second / max_requests
+        self.tat = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, permits: int = 1) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            new_tat = max(self.tat, now) + permits * self.interval
+            if new_tat - now > self.period + _EPSILON:
+                return False
+            self.tat = new_tat
+            return True
+
+    def wait_time(self, permits: int = 1) -> float:
+        if permits * self.interval > self.period + _EPSILON:
+            return math.inf
+        with self._lock:
+            now = time.monotonic()
+            new_tat = max(self.tat, now) + permits * self.interval
+            return max(new_tat - now - self.period, 0.0)
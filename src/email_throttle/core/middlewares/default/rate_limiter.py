@@ -1,32 +1,122 @@
-from datetime import datetime, timedelta
-from typing import Any, Callable
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Optional
 
 from loguru import logger
 
-from email_throttle.core.abstract.middleware import Middleware
+from email_throttle.core.abstract.middleware import AsyncMiddleware, Middleware
+from email_throttle.core.abstract.rate_limit import RateLimitEngine
+from email_throttle.core.exceptions import RateLimitExceeded
+from email_throttle.core.middlewares.default.rate_limit_engines import (
+    GCRAEngine,
+    SlidingWindowEngine,
+    TokenBucketEngine,
+)
 
 
 class RateLimiter(Middleware):
-    def __init__(self, max_requests: int, per_second: int):
+    """Allows at most `max_requests` calls every `per_second` seconds.
+
+    The admission algorithm is delegated to a `RateLimitEngine`, subclasses only choose a different engine.
+
+    By default a request over the limit is rejected right away. With `wait=True` the call sleeps exactly
+    until the engine frees a permit, and only fails if that would take longer than `max_wait` seconds
+    (`None` waits as long as needed).
+    """
+
+    engine_class: type[RateLimitEngine] = SlidingWindowEngine
+
+    def __init__(
+        self,
+        max_requests: int,
+        per_second: int,
+        engine: Optional[RateLimitEngine] = None,
+        wait: bool = False,
+        max_wait: Optional[float] = None,
+    ):
         self.max_requests = max_requests
         self.per_second = per_second
-        self.requests = []
+        self.engine = engine or self.engine_class(max_requests, per_second)
+        self.wait = wait
+        self.max_wait = max_wait
 
     def allow_request(self):
-        now = datetime.now()
-        # Clean up old requests
-        self.requests = [req_time for req_time in self.requests if req_time > now - timedelta(seconds=self.per_second)]
+        return self.engine.try_acquire()
+
+    @property
+    def max_batch(self) -> int:
+        """The largest batch `call_many` can admit, the services split larger ones (see `EmailService.send_many`)."""
+        return self.max_requests
 
-        if len(self.requests) < self.max_requests:
-            self.requests.append(now)
-            return True
-        return False
+    def is_available(self) -> bool:
+        """Whether a call would be admitted now (or, in wait mode, within `max_wait`), without taking a permit."""
+        delay = self.engine.wait_time()
+        return delay == 0 or (self.wait and (self.max_wait is None or delay <= self.max_wait))
+
+    def acquire(self, permits: int = 1, max_wait: Optional[float] = None) -> bool:
+        """Blocks until `permits` are admitted.
+        Returns False, without sleeping, when they can't be admitted within `max_wait` seconds."""
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while not self.engine.try_acquire(permits):
+            delay = self.engine.wait_time(permits)
+            if delay == math.inf or (deadline is not None and time.monotonic() + delay > deadline):
+                return False
+            time.sleep(delay)
+        return True
 
     def call(self, func: Callable) -> Any:
-        if not self.allow_request():
+        return self.call_many(func, 1)
+
+    def call_many(self, func: Callable, permits: int) -> Any:
+        """A batch needs `permits` permits at once. Batches larger than `max_requests` are always rejected,
+        the services send them in chunks of `max_batch`."""
+        admitted = self.acquire(permits, max_wait=self.max_wait) if self.wait else self.engine.try_acquire(permits)
+        if not admitted:
             logger.error(f"Rate limited reached, max requests of {self.max_requests} on last {self.per_second} seconds")
-            raise Exception("Too many requests")
+            raise RateLimitExceeded(retry_after=self.engine.wait_time(permits))
 
         # current middleware is not checking if the request failed
         # in case of failure, exception must be raised inside the function
         return func()
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """Rate limiter with a constant time token bucket (bursts of `max_requests`, smooth refill)."""
+
+    engine_class = TokenBucketEngine
+
+
+class GCRARateLimiter(RateLimiter):
+    """Rate limiter with a constant time GCRA engine (evenly spaced admits, bursts of `max_requests`)."""
+
+    engine_class = GCRAEngine
+
+
+class AsyncRateLimiter(RateLimiter, AsyncMiddleware):
+    """Rate limiter for the asyncio pipeline, the wait mode awaits the next permit instead of sleeping the thread.
+    Any engine can be used, e.g.: `AsyncRateLimiter(10, 1, engine=GCRAEngine(10, 1), wait=True)`."""
+
+    async def acquire_async(self, permits: int = 1, max_wait: Optional[float] = None) -> bool:
+        """Same as `acquire`, but awaiting instead of blocking the event loop."""
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while not self.engine.try_acquire(permits):
+            delay = self.engine.wait_time(permits)
+            if delay == math.inf or (deadline is not None and time.monotonic() + delay > deadline):
+                return False
+            await asyncio.sleep(delay)
+        return True
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.call_many(func, 1)
+
+    async def call_many(self, func: Callable[[], Awaitable[Any]], permits: int) -> Any:
+        if self.wait:
+            admitted = await self.acquire_async(permits, max_wait=self.max_wait)
+        else:
+            admitted = self.engine.try_acquire(permits)
+        if not admitted:
+            logger.error(f"Rate limited reached, max requests of {self.max_requests} on last {self.per_second} seconds")
+            raise RateLimitExceeded(retry_after=self.engine.wait_time(permits))
+
+        return await func()
@@ -1,9 +1,14 @@
+import asyncio
+import random
+import threading
 import time
+from typing import Any, Awaitable, Callable, Optional
 
 from loguru import logger
 
 from email_throttle.core.abstract.backoff import Backoff
-from email_throttle.core.abstract.middleware import Middleware
+from email_throttle.core.abstract.middleware import AsyncMiddleware, Middleware
+from email_throttle.core.log_sampling import SampledLog
 
 
 class ExponentialBackoff(Backoff):
@@ -12,7 +17,7 @@ class ExponentialBackoff(Backoff):
         self.factor = factor
         self.max_delay = max_delay
 
-    def get_delay(self, attempt: int) -> int:
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
         delay = min(self.base * (self.factor**attempt), self.max_delay)
         return delay
 
@@ -21,32 +26,152 @@ class ConstantBackoff(Backoff):
     def __init__(self, seconds=10):
         self.seconds = seconds
 
-    def get_delay(self, attempt) -> int:
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
         return self.seconds
 
 
+class FullJitterBackoff(ExponentialBackoff):
+    """Random delay between 0 and the exponential one, so workers that failed together don't retry together."""
+
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
+        return random.uniform(0, super().get_delay(attempt))
+
+
+class DecorrelatedJitterBackoff(Backoff):
+    """Random delay between `base` and three times the previous delay (capped at `max_delay`).
+    It grows like the exponential backoff on average, but consecutive delays of different workers spread out."""
+
+    def __init__(self, base=1, max_delay=60):
+        self.base = base
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
+        return min(self.max_delay, random.uniform(self.base, (previous or self.base) * 3))
+
+
+class AdaptiveBackoff(Backoff):
+    """Waits what the vendor asked for when the error carries a `retry_after` hint (e.g. `RateLimitExceeded`,
+    or a `Retry-After` header), capped at `max_delay`. Otherwise it delegates to `fallback` (full jitter by default)."""
+
+    def __init__(self, fallback: Optional[Backoff] = None, max_delay=60):
+        self.fallback = fallback or FullJitterBackoff(max_delay=max_delay)
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, error: Optional[Exception] = None, previous: Optional[float] = None) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return self.fallback.get_delay(attempt, error, previous)
+
+
+class RetryBudget:
+    """Limits the retries of a service to `ratio` of its requests over the last `window` seconds,
+    plus `min_retries` per window so a service with little traffic can still retry.
+
+    During an incident every request fails, and without a budget each one turns into `retries` calls.
+    Counters are kept in per second buckets, so recording is O(1) and memory is O(window).
+    """
+
+    def __init__(self, ratio: float = 0.1, window: int = 10, min_retries: int = 10):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self.seconds = [-1] * window
+        self.requests = [0] * window
+        self.retries = [0] * window
+        self._lock = threading.Lock()
+
+    def _bucket(self, now: float) -> int:
+        second = int(now)
+        index = second % self.window
+        if self.seconds[index] != second:
+            self.seconds[index] = second
+            self.requests[index] = 0
+            self.retries[index] = 0
+        return index
+
+    def record_request(self):
+        with self._lock:
+            self.requests[self._bucket(time.monotonic())] += 1
+
+    def try_retry(self) -> bool:
+        """Takes a retry from the budget, False if there is none left."""
+        now = time.monotonic()
+        with self._lock:
+            index = self._bucket(now)
+            oldest = int(now) - self.window
+            requests = retries = 0
+            for second, bucket_requests, bucket_retries in zip(self.seconds, self.requests, self.retries):
+                if second > oldest:
+                    requests += bucket_requests
+                    retries += bucket_retries
+            if retries + 1 > self.min_retries + self.ratio * requests:
+                return False
+            self.retries[index] += 1
+            return True
+
+
 class Retry(Middleware):
-    def __init__(self, retries: int = 3, backoff: Backoff = None):
+    """Calls the function up to `retries` times, waiting the backoff delay between attempts.
+
+    The attempt is tracked per call, so concurrent sends through the same service don't share it.
+    With a `budget`, a retry is only made if the budget has room left, otherwise the error is raised right away.
+    """
+
+    def __init__(self, retries: int = 3, backoff: Backoff = None, budget: Optional[RetryBudget] = None):
         self.retries = retries
         self.backoff = backoff or ExponentialBackoff()
-        self.attempt = 0
+        self.budget = budget
+        self._exhausted_log = SampledLog()
+
+    def _next_delay(self, attempt: int, error: Exception, previous: Optional[float]) -> Optional[float]:
+        """Delay before the next attempt, None if the error must be raised."""
+        if attempt >= self.retries:
+            logger.error(f"Failed attempt because max retries reached ({attempt} retries)")
+            return None
+        if self.budget and not self.budget.try_retry():
+            self._exhausted_log.log("Retry budget exhausted, not retrying")
+            return None
+        return self.backoff.get_delay(attempt, error, previous)
 
     def allow_request(self) -> bool:
-        return self.attempt < self.retries
+        # stateless, every call has its own attempts
+        return True
 
     def call(self, func):
-        while self.allow_request():
+        if self.budget:
+            self.budget.record_request()
+        attempt = 0
+        delay = None
+        while True:
             try:
-                logger.info(f"Trying Attempt {self.attempt + 1}...")
-                result = func()
-                self.attempt = 0
-                return result
+                logger.info(f"Trying Attempt {attempt + 1}...")
+                return func()
             except Exception as e:
-                self.attempt += 1
-                if not self.allow_request():
-                    logger.error(f"Failed attempt because max retries reached ({self.attempt} retries)")
-                    self.attempt = 0
+                attempt += 1
+                delay = self._next_delay(attempt, e, delay)
+                if delay is None:
                     raise e
-                delay = self.backoff.get_delay(self.attempt)
-                logger.warning(f"Attempt {self.attempt + 1} failed. Retrying in {delay:.2f} seconds...")
+                logger.warning(f"Attempt {attempt + 1} failed. Retrying in {delay:.2f} seconds...")
                 time.sleep(delay)
+
+
+class AsyncRetry(Retry, AsyncMiddleware):
+    """Retry for the asyncio pipeline, it awaits the backoff delay instead of sleeping the thread."""
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if self.budget:
+            self.budget.record_request()
+        attempt = 0
+        delay = None
+        while True:
+            try:
+                logger.info(f"Trying Attempt {attempt + 1}...")
+                return await func()
+            except Exception as e:
+                attempt += 1
+                delay = self._next_delay(attempt, e, delay)
+                if delay is None:
+                    raise e
+                logger.warning(f"Attempt {attempt + 1} failed. Retrying in {delay:.2f} seconds...")
+                await asyncio.sleep(delay)
@@ -0,0 +1,78 @@
+import threading
+from typing import Optional, Sequence
+
+from email_throttle.core.abstract.routing import RoutingStrategy
+
+
+class OrderedRouting(RoutingStrategy):
+    """Always the list order: the first service takes all the load while it is available."""
+
+    def order(self, size: int) -> list[int]:
+        return list(range(size))
+
+
+class WeightedRoundRobin(RoutingStrategy):
+    """Smooth weighted round robin: service `i` goes first in `weights[i] / sum(weights)` of the messages,
+    interleaved instead of in bursts (e.g. weights 5, 1, 1 give a, a, b, a, c, a, a).
+    The rest of the services follow by weight, as fallbacks.
+    """
+
+    def __init__(self, weights: Sequence[int]):
+        self.weights = list(weights)
+        self.total = sum(self.weights)
+        self.current = [0] * len(self.weights)
+        self._lock = threading.Lock()
+
+    def order(self, size: int) -> list[int]:
+        if size != len(self.weights):
+            raise ValueError(f"{len(self.weights)} weights for {size} services, expected a weight per service")
+        with self._lock:
+            for i, weight in enumerate(self.weights):
+                self.current[i] += weight
+            first = max(range(size), key=self.current.__getitem__)
+            self.current[first] -= self.total
+        return [first] + sorted((i for i in range(size) if i != first), key=lambda i: -self.weights[i])
+
+
+class LeastInFlight(RoutingStrategy):
+    """Tries first the service with the fewest sends in progress, ties go to the list order."""
+
+    def __init__(self, size: int):
+        self.in_flight = [0] * size
+        self._lock = threading.Lock()
+
+    def order(self, size: int) -> list[int]:
+        in_flight = list(self.in_flight)
+        return sorted(range(size), key=in_flight.__getitem__)
+
+    def started(self, index: int):
+        with self._lock:
+            self.in_flight[index] += 1
+
+    def finished(self, index: int, elapsed: float, success: bool):
+        with self._lock:
+            self.in_flight[index] -= 1
+
+
+class EwmaLatency(RoutingStrategy):
+    """Tries first the service with the lowest exponentially weighted moving average of its send latency.
+
+    A failed send counts as `failure_penalty` seconds more than it took, so failing vendors drift back.
+    Services without samples go first, so every service gets measured.
+    """
+
+    def __init__(self, size: int, alpha: float = 0.3, failure_penalty: float = 1.0):
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self.latency: list[Optional[float]] = [None] * size
+        self._lock = threading.Lock()
+
+    def order(self, size: int) -> list[int]:
+        latency = list(self.latency)
+        return sorted(range(size), key=lambda i: -1.0 if latency[i] is None else latency[i])
+
+    def finished(self, index: int, elapsed: float, success: bool):
+        sample = elapsed if success else elapsed + self.failure_penalty
+        with self._lock:
+            previous = self.latency[index]
+            self.latency[index] = sample if previous is None else previous + self.alpha * (sample - previous)
@@ -0,0 +1,193 @@
+from collections import deque
+from typing import Any, Callable, Optional
+
+from email_throttle.core.middlewares.default.rate_limit_engines import TokenBucketEngine
+
+
+def recipient_domain(to: list[str]) -> str:
+    """Domain of the first recipient, which a message is scheduled under (lowercase, "" without recipients)."""
+    return to[0].rpartition("@")[2].lower() if to else ""
+
+
+class _Domain:
+    __slots__ = ("queue", "bucket", "deficit", "in_turn")
+
+    def __init__(self, bucket: TokenBucketEngine):
+        self.queue: deque[tuple[Any, int]] = deque()
+        self.bucket = bucket
+        self.deficit = 0
+        self.in_turn = False
+
+
+class DomainScheduler:
+    """Per recipient domain queues, served by deficit round robin and paced by a token bucket per domain.
+
+    Items are pushed under a domain with a cost (e.g.: the recipients of the message). `pop` returns the next item
+    to send: domains with queued items take turns, each turn adds `quantum` to the domain deficit and the domain
+    sends while its deficit covers the cost of its next item. A large campaign to a domain only gets its share of
+    the turns, so the items of small domains never wait behind it.
+    A domain also needs tokens of its bucket (`rate` items per second, bursts of `burst`, or the pair in `limits`):
+    a paced domain skips its turn, without piling up deficit, and the other domains are served meanwhile.
+    `pop` returns None when nothing can be sent right now, `wait_time` tells when a paced domain can.
+
+    Not thread safe, the consumer only uses it from the connection thread.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10,
+        burst: int = 10,
+        quantum: int = 1,
+        limits: Optional[dict[str, tuple[float, int]]] = None,
+        max_idle_domains: int = 10_000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.quantum = quantum
+        self.limits = limits or {}
+        self.max_idle_domains = max_idle_domains
+        self.domains: dict[str, _Domain] = {}
+        self.active: deque[str] = deque()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def push(self, domain: str, item, cost: int = 1):
+        state = self.domains.get(domain)
+        if state is None:
+            if len(self.domains) - len(self.active) >= self.max_idle_domains:
+                self._forget_idle()
+            rate, burst = self.limits.get(domain, (self.rate, self.burst))
+            state = self.domains[domain] = _Domain(TokenBucketEngine(burst, burst / rate))
+        if not state.queue:
+            self.active.append(domain)
+        # a cost over the burst would never fit in the bucket
+        state.queue.append((item, min(cost, state.bucket.capacity)))
+        self.size += 1
+
+    def pop(self):
+        paced = 0
+        while self.active and paced < len(self.active):
+            domain = self.active[0]
+            state = self.domains[domain]
+            if not state.in_turn:
+                state.in_turn = True
+                state.deficit += self.quantum
+            item, cost = state.queue[0]
+            if state.deficit < cost:
+                # the deficit grows every turn, the domain sends in a following round
+                self._end_turn()
+                paced = 0
+                continue
+            if not state.bucket.try_acquire(cost):
+                # a paced domain doesn't pile up credit while it waits
+                state.deficit = min(state.deficit, cost)
+                self._end_turn()
+                paced += 1
+                continue
+            state.queue.popleft()
+            state.deficit -= cost
+            self.size -= 1
+            if not state.queue:
+                # an idle domain keeps no credit
+                self.active.popleft()
+                state.deficit = 0
+                state.in_turn = False
+            return item
+        return None
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds until the first paced domain can send, None when nothing is queued."""
+        if not self.active:
+            return None
+        return min(self.domains[domain].bucket.wait_time(self.domains[domain].queue[0][1]) for domain in self.active)
+
+    def _forget_idle(self):
+        """Drops the domains without queued items whose bucket is full again: they would start the same way."""
+        for domain in [d for d, state in self.domains.items() if not state.queue]:
+            bucket = self.domains[domain].bucket
+            if bucket.wait_time(bucket.capacity) == 0:
+                del self.domains[domain]
+
+    def _end_turn(self):
+        domain = self.active.popleft()
+        self.domains[domain].in_turn = False
+        self.active.append(domain)
+
+
+class FifoScheduler:
+    """Items in arrival order, without pacing: the lanes of a consumer without a domain rate."""
+
+    def __init__(self):
+        self.queue: deque = deque()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def push(self, domain: str, item, cost: int = 1):
+        self.queue.append(item)
+
+    def pop(self):
+        return self.queue.popleft() if self.queue else None
+
+    def wait_time(self) -> Optional[float]:
+        return 0.0 if self.queue else None
+
+
+class _Lane:
+    __slots__ = ("scheduler", "weight", "current")
+
+    def __init__(self, scheduler, weight: int):
+        self.scheduler = scheduler
+        self.weight = weight
+        self.current = 0
+
+
+class PriorityLanes:
+    """Lanes of items (e.g.: transactional and bulk emails) served by smooth weighted round robin.
+
+    Each lane has its own scheduler (`create_scheduler`, FIFO by default, or a `DomainScheduler` to pace the
+    domains of the lane). While several lanes have items, a lane with weight w gets w of every `sum(weights)` pops,
+    evenly spread: a transactional lane of weight 9 sends ahead of a bulk backlog, which still gets 1 of every 10
+    pops and never starves. A lane with nothing to send right now (empty or paced) gives its turn to the others,
+    without earning credit for it.
+    """
+
+    def __init__(self, weights: dict[str, int], create_scheduler: Callable[[], Any] = FifoScheduler):
+        if not weights or min(weights.values()) < 1:
+            raise ValueError(f"Lane weights must be positive integers, got {weights}")
+        self.lanes = {name: _Lane(create_scheduler(), weight) for name, weight in weights.items()}
+
+    def __len__(self) -> int:
+        return sum(len(lane.scheduler) for lane in self.lanes.values())
+
+    def push(self, lane: str, domain: str, item, cost: int = 1):
+        self.lanes[lane].scheduler.push(domain, item, cost)
+
+    def pop(self):
+        ready = []
+        for lane in self.lanes.values():
+            if len(lane.scheduler):
+                ready.append(lane)
+            else:
+                # an idle lane keeps no credit
+                lane.current = 0
+        total = sum(lane.weight for lane in ready)
+        for lane in ready:
+            lane.current += lane.weight
+        for lane in sorted(ready, key=lambda lane: lane.current, reverse=True):
+            item = lane.scheduler.pop()
+            if item is not None:
+                lane.current -= total
+                return item
+            # a paced lane gives back the credit of this round: kept, it would build up while the lane waits
+            # and burst ahead of the others once it can send
+            lane.current -= lane.weight
+            total -= lane.weight
+        return None
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds until a lane can send, None when nothing is queued."""
+        waits = [lane.scheduler.wait_time() for lane in self.lanes.values() if len(lane.scheduler)]
+        return min(waits, default=None)
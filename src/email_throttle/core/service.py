@@ -1,12 +1,113 @@
 import functools
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Sequence
 
-from email_throttle.core.abstract.middleware import Middleware
-from email_throttle.core.abstract.sender import EmailSender
+from email_throttle.core.abstract.middleware import AsyncMiddleware, Middleware
+from email_throttle.core.abstract.sender import AsyncEmailSender, EmailSender
 from email_throttle.core.entity import EmailMessage
+from email_throttle.core.exceptions import BatchFailed
+from email_throttle.core.log_sampling import SampledLog
+
+
+def compile_pipeline(
+    handler: Callable[[EmailMessage], Any],
+    middlewares: Sequence[Middleware | AsyncMiddleware],
+    batch: bool = False,
+) -> Callable[[EmailMessage], Any]:
+    """Chains the middlewares around `handler` once, the first middleware being the outermost one.
+
+    The result takes the message, so sending only runs the middlewares themselves
+    (plus a `partial` per middleware to hand them the zero-argument callable they expect).
+    It works for both pipelines: in the async one, every step returns the coroutine of the next.
+    With `batch`, the handler and the result take a list of messages and the middlewares are called with `call_many`.
+    """
+    wrap = _wrap_many if batch else _wrap
+    pipeline = handler
+    for middleware in reversed(middlewares):
+        pipeline = wrap(middleware, pipeline)
+    return pipeline
+
+
+def _wrap(middleware: Middleware | AsyncMiddleware, handler: Callable[[EmailMessage], Any]):
+    call = middleware.call
+    return lambda message: call(functools.partial(handler, message))
+
+
+def _wrap_many(middleware: Middleware | AsyncMiddleware, handler: Callable[[Sequence[EmailMessage]], Any]):
+    call_many = middleware.call_many
+    return lambda messages: call_many(functools.partial(handler, messages), len(messages))
+
+
+def _raise_failed_batch(send_many: Callable) -> Callable:
+    """Vendors report each message instead of raising: a batch where every message failed raises `BatchFailed`."""
+
+    def send(messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        results = send_many(messages)
+        if results and not any(sent for sent, _ in results):
+            raise BatchFailed(results)
+        return results
+
+    return send
+
+
+def _raise_failed_batch_async(send_many: Callable) -> Callable:
+    """Same as `_raise_failed_batch` for an async vendor."""
+
+    async def send(messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        results = await send_many(messages)
+        if results and not any(sent for sent, _ in results):
+            raise BatchFailed(results)
+        return results
+
+    return send
+
+
+def _max_batch(middlewares: Sequence[Middleware | AsyncMiddleware]) -> Optional[int]:
+    """The largest batch every middleware admits at once, None when none limits it.
+    Middlewares that limit the size of a batch have a `max_batch` (e.g.: `RateLimiter`)."""
+    sizes = [middleware.max_batch for middleware in middlewares if getattr(middleware, "max_batch", None)]
+    return min(sizes, default=None)
+
+
+def _chunks(messages: Sequence[EmailMessage], size: Optional[int]) -> list[Sequence[EmailMessage]]:
+    if size is None or len(messages) <= size:
+        return [messages]
+    return [messages[start : start + size] for start in range(0, len(messages), size)]
+
+
+class Rejected:
+    """Result of a send refused by a middleware before the vendor was called (see `EmailService.send_email`).
+
+    Services keep one instance per middleware, so a rejection allocates nothing and captures no traceback.
+    """
+
+    __slots__ = ("middleware",)
+
+    def __init__(self, middleware: Middleware | AsyncMiddleware):
+        self.middleware = middleware
+
+    def __repr__(self) -> str:
+        return f"Rejected({self.middleware.__class__.__name__})"
+
+
+def _admission_checks(middlewares: Sequence[Middleware | AsyncMiddleware]) -> tuple:
+    """(is_available, Rejected) of the middlewares that can reject a message up front.
+    Middlewares that keep the default `is_available` always admit, so they are left out."""
+    defaults = (Middleware.is_available, AsyncMiddleware.is_available)
+    return tuple(
+        (middleware.is_available, Rejected(middleware))
+        for middleware in middlewares
+        if getattr(type(middleware), "is_available", None) not in defaults
+    )
 
 
 class EmailService:
+    """Sends emails with the vendor through the middlewares.
+
+    Before running the pipeline, the middlewares are asked whether they would admit the message
+    (`is_available`, nothing is consumed). If one would not, for instance an open circuit breaker during an outage,
+    the send returns `(False, Rejected)` right away: no exception is raised and the rejection log is sampled.
+    """
+
     def __init__(
         self,
         vendor: EmailSender,
@@ -15,20 +116,126 @@ class EmailService:
         self.service = vendor
         self.middlewares = middlewares
         self.name = vendor.name or vendor.__class__.__name__
+        self._rejection_log = SampledLog()
+
+    @property
+    def middlewares(self) -> tuple[Middleware, ...]:
+        return self._middlewares
+
+    @middlewares.setter
+    def middlewares(self, middlewares: Sequence[Middleware]):
+        """Assigning the middlewares recompiles the pipelines."""
+        self._middlewares = tuple(middlewares)
+        self._pipeline = compile_pipeline(self.service.send_email, self._middlewares)
+        self._batch_pipeline = compile_pipeline(
+            _raise_failed_batch(self.service.send_many), self._middlewares, batch=True
+        )
+        self._admission = _admission_checks(self._middlewares)
+        self._max_batch = _max_batch(self._middlewares)
 
-    def _send_email(self, message: EmailMessage) -> Callable[..., Any]:
-        return lambda: self.service.send_email(message)
+    def is_available(self) -> bool:
+        """Whether every middleware would admit a message now. Nothing is consumed and the vendor is not called."""
+        return all(is_available() for is_available, _ in self._admission)
+
+    def _rejected(self) -> Optional[Rejected]:
+        for is_available, rejected in self._admission:
+            if not is_available():
+                self._rejection_log.log("Service {} rejected the emails: {}", self.name, rejected)
+                return rejected
+        return None
 
     def send_email(self, message: EmailMessage) -> tuple[bool, Any]:
-        functions = [self._send_email(message)] + self.middlewares[::-1]
+        rejected = self._rejected()
+        if rejected:
+            return False, rejected
+        try:
+            result = self._pipeline(message)
+            return True, result
+        except Exception as e:
+            return False, e
+
+    def send_many(self, messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        """Sends the batch through the middlewares in a single pass (see `Middleware.call_many`),
+        returning a (sent, result or error) per message. If the pipeline fails, every message fails.
+        A batch whose every message failed is a failure for the middlewares, like a single failed send.
+
+        A batch larger than a middleware admits at once (e.g.: the `max_requests` of a rate limiter) is sent in
+        chunks, each one a pass of its own.
+        """
+        results = []
+        for chunk in _chunks(messages, self._max_batch):
+            results.extend(self._send_chunk(chunk))
+        return results
+
+    def _send_chunk(self, messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        if not messages:
+            return []
+        rejected = self._rejected()
+        if rejected:
+            return [(False, rejected)] * len(messages)
+        try:
+            return self._batch_pipeline(messages)
+        except BatchFailed as e:
+            return e.results
+        except Exception as e:
+            return [(False, e)] * len(messages)
 
-        pipeline = functools.reduce(
-            lambda func, middleware: lambda: middleware.call(func),
-            functions,
+
+class AsyncEmailService(EmailService):
+    """asyncio counterpart of `EmailService`: the vendor and every middleware are awaited,
+    so waiting for a retry or a rate limit permit doesn't hold a thread."""
+
+    def __init__(
+        self,
+        vendor: AsyncEmailSender,
+        middlewares: list[AsyncMiddleware],
+    ):
+        self.service = vendor
+        self.middlewares = middlewares
+        self.name = vendor.name or vendor.__class__.__name__
+        self._rejection_log = SampledLog()
+
+    @property
+    def middlewares(self) -> tuple[AsyncMiddleware, ...]:
+        return self._middlewares
+
+    @middlewares.setter
+    def middlewares(self, middlewares: Sequence[AsyncMiddleware]):
+        """Assigning the middlewares recompiles the pipelines."""
+        self._middlewares = tuple(middlewares)
+        self._pipeline = compile_pipeline(self.service.send_email, self._middlewares)
+        self._batch_pipeline = compile_pipeline(
+            _raise_failed_batch_async(self.service.send_many), self._middlewares, batch=True
         )
+        self._admission = _admission_checks(self._middlewares)
+        self._max_batch = _max_batch(self._middlewares)
 
+    async def send_email(self, message: EmailMessage) -> tuple[bool, Any]:
+        rejected = self._rejected()
+        if rejected:
+            return False, rejected
         try:
-            result = pipeline()
+            result = await self._pipeline(message)
             return True, result
         except Exception as e:
             return False, e
+
+    async def send_many(self, messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        """Same as `EmailService.send_many`."""
+        results = []
+        for chunk in _chunks(messages, self._max_batch):
+            results.extend(await self._send_chunk(chunk))
+        return results
+
+    async def _send_chunk(self, messages: Sequence[EmailMessage]) -> list[tuple[bool, Any]]:
+        if not messages:
+            return []
+        rejected = self._rejected()
+        if rejected:
+            return [(False, rejected)] * len(messages)
+        try:
+            return await self._batch_pipeline(messages)
+        except BatchFailed as e:
+            return e.results
+        except Exception as e:
+            return [(False, e)] * len(messages)
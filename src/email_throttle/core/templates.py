@@ -0,0 +1,78 @@
+import functools
+from string import Template
+from typing import Callable
+
+from email_throttle.core.entity import EmailMessage, EmailTemplate, TemplatedEmail
+
+
+def compile_text(text: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Splits a text with `string.Template` placeholders into its literals and placeholder names, once:
+    the rendered text is literals[0] + variables[names[0]] + literals[1] + ... A `$$` is a literal `$`."""
+    literals, names, current = [], [], []
+    position = 0
+    for match in Template.pattern.finditer(text):
+        current.append(text[position : match.start()])
+        position = match.end()
+        if match.group("escaped") is not None:
+            current.append(Template.delimiter)
+            continue
+        name = match.group("named") or match.group("braced")
+        if name is None:
+            raise ValueError(f"Invalid placeholder in template at index {match.start()}")
+        literals.append("".join(current))
+        names.append(name)
+        current = []
+    current.append(text[position:])
+    literals.append("".join(current))
+    return tuple(literals), tuple(names)
+
+
+def render_text(compiled: tuple[tuple[str, ...], tuple[str, ...]], variables: dict[str, str]) -> str:
+    literals, names = compiled
+    parts = [literals[0]]
+    for name, literal in zip(names, literals[1:]):
+        parts.append(variables[name])
+        parts.append(literal)
+    return "".join(parts)
+
+
+class CompiledTemplate:
+    """A template whose placeholders are parsed once and rendered many times, without scanning the text again."""
+
+    __slots__ = ("template", "subject", "body")
+
+    def __init__(self, template: EmailTemplate):
+        self.template = template
+        self.subject = compile_text(template.subject)
+        self.body = compile_text(template.body)
+
+    def render(self, email: TemplatedEmail) -> EmailMessage:
+        """Raises KeyError when a placeholder has no variable: an email is never sent half rendered."""
+        return EmailMessage(
+            subject=render_text(self.subject, email.variables),
+            body=render_text(self.body, email.variables),
+            to=email.to,
+            from_email=self.template.from_email,
+            is_html=self.template.is_html,
+            idempotency_key=email.idempotency_key,
+            priority=email.priority,
+        )
+
+
+class TemplateRenderer:
+    """Renders templated emails at send time.
+
+    Templates are loaded with `load` (e.g.: from the template store) and compiled on first use, the `cache_size`
+    most recently used ones are kept compiled. Template ids are content addressed, a cached template never changes.
+    """
+
+    def __init__(self, load: Callable[[str], EmailTemplate], cache_size: int = 128):
+        self.load = load
+        # lru_cache is thread safe, concurrent workers of a consumer share the compiled templates
+        self.compiled = functools.lru_cache(maxsize=cache_size)(self._compile)
+
+    def render(self, email: TemplatedEmail) -> EmailMessage:
+        return self.compiled(email.template_id).render(email)
+
+    def _compile(self, template_id: str) -> CompiledTemplate:
+        return CompiledTemplate(self.load(template_id))
@@ -0,0 +1,42 @@
+import dataclasses
+
+from email_throttle.core.entity import EmailMessage
+from email_throttle.infra.blobs.store import FileBlobStore, is_reference
+
+
+class ClaimCheck:
+    """Moves large bodies and attachments out of the queued messages.
+
+    `check_in` (producer) stores the body and each attachment longer than `threshold` characters in the blob store
+    and replaces them by their reference, so the broker only holds small messages. `check_out` (consumer) reads them
+    back when the email is about to be sent, so a message that waits or is redelivered is never read in between.
+    An inline value that looks like a reference is stored too, every reference in a message is a real one.
+    """
+
+    def __init__(self, store: FileBlobStore, threshold: int = 256 * 1024):
+        self.store = store
+        self.threshold = threshold
+
+    def check_in(self, message: EmailMessage) -> EmailMessage:
+        body = self._offload(message.body)
+        attachments = tuple(self._offload(attachment) for attachment in message.attachments)
+        if body is message.body and all(new is old for new, old in zip(attachments, message.attachments)):
+            return message
+        return dataclasses.replace(message, body=body, attachments=attachments)
+
+    def check_out(self, message: EmailMessage) -> EmailMessage:
+        if not is_reference(message.body) and not any(map(is_reference, message.attachments)):
+            return message
+        return dataclasses.replace(
+            message,
+            body=self._load(message.body),
+            attachments=tuple(self._load(attachment) for attachment in message.attachments),
+        )
+
+    def _offload(self, value: str) -> str:
+        if len(value) <= self.threshold and not is_reference(value):
+            return value
+        return self.store.put(value.encode())
+
+    def _load(self, value: str) -> str:
+        return self.store.read_text(value) if is_reference(value) else value
@@ -0,0 +1,76 @@
+import hashlib
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+REFERENCE_PREFIX = "blob:sha256:"
+_REFERENCE = re.compile(r"blob:sha256:([0-9a-f]{64})")
+
+
+def is_reference(value: str) -> bool:
+    return value.startswith(REFERENCE_PREFIX)
+
+
+class FileBlobStore:
+    """Content addressed blobs in a directory, a stand-in for an object storage.
+
+    A blob is named after the SHA-256 of its data, so the same data (e.g.: an attachment sent to many recipients)
+    is stored once, and a reference is valid on every process that mounts the directory. Blobs are written to a
+    temporary file and renamed, readers never see a partial blob. They are read through a memory map: the pages
+    are loaded by the OS when they are accessed, and shared by the processes reading the same blob.
+
+    Blobs are never removed by the store, expiring them is left to the deployment (e.g.: a cleanup by age).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def put(self, data: bytes) -> str:
+        """Stores the data (unless it is already stored) and returns its reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        return REFERENCE_PREFIX + digest
+
+    @contextmanager
+    def open(self, reference: str) -> Iterator[memoryview]:
+        """A read only view of the blob, valid inside the context."""
+        with open(self._path(self._digest(reference)), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # an empty file can't be memory mapped
+                yield memoryview(b"")
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def exists(self, reference: str) -> bool:
+        match = _REFERENCE.fullmatch(reference)
+        return match is not None and os.path.exists(self._path(match.group(1)))
+
+    def read_text(self, reference: str) -> str:
+        with self.open(reference) as view:
+            return str(view, "utf-8")
+
+    def _path(self, digest: str) -> str:
+        # a level of subdirectories keeps the directories small
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    @staticmethod
+    def _digest(reference: str) -> str:
+        match = _REFERENCE.fullmatch(reference)
+        if match is None:
+            raise ValueError(f"Invalid blob reference {reference[:80]!r}")
+        return match.group(1)
@@ -0,0 +1,30 @@
+from pydantic import TypeAdapter
+
+from email_throttle.core.entity import EmailTemplate
+from email_throttle.core.templates import compile_text
+from email_throttle.infra.blobs.store import REFERENCE_PREFIX, FileBlobStore
+
+_email_template = TypeAdapter(EmailTemplate)
+
+
+class TemplateStore:
+    """Registered templates, stored as JSON in the blob store shared by the API and the consumers.
+
+    The template id is the digest of the template: registering the same template twice returns the same id,
+    and a template never changes once registered, so consumers can cache it without invalidation.
+    """
+
+    def __init__(self, store: FileBlobStore):
+        self.store = store
+
+    def register(self, template: EmailTemplate) -> str:
+        """Raises ValueError if the subject or the body has an invalid placeholder, before storing anything."""
+        compile_text(template.subject)
+        compile_text(template.body)
+        return self.store.put(_email_template.dump_json(template)).removeprefix(REFERENCE_PREFIX)
+
+    def exists(self, template_id: str) -> bool:
+        return self.store.exists(REFERENCE_PREFIX + template_id)
+
+    def load(self, template_id: str) -> EmailTemplate:
+        return _email_template.validate_json(self.store.read_text(REFERENCE_PREFIX + template_id))
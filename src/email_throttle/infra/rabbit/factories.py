@@ -1,22 +1,62 @@
 import json
-from typing import Any, Callable
+import os
+from typing import Any, Callable, Optional, Sequence
+from email_throttle.core.scheduling import DomainScheduler, PriorityLanes
 from email_throttle.infra.rabbit.handlers import RabbitConsumer, RabbitProducer, create_connection
+from email_throttle.infra.rabbit.pool import RabbitProducerPool
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import Topology
 
 
 def create_producer(
     serializer: Callable[..., str] = json.dumps,
     create_connection_fn=create_connection,
+    wire_format: Optional[WireFormat] = None,
+    topology: Optional[Topology] = None,
 ):
     connection = create_connection_fn()
 
-    return RabbitProducer(connection, serializer)
+    return RabbitProducer(connection, serializer, wire_format=wire_format, topology=topology)
+
+
+def create_producer_pool(
+    serializer: Callable[..., str] = json.dumps,
+    create_connection_fn=create_connection,
+    wire_format: Optional[WireFormat] = None,
+    topology: Optional[Topology] = None,
+):
+    size = int(os.getenv("RABBITMQ_POOL_SIZE", "4"))
+
+    return RabbitProducerPool(
+        serializer, size=size, create_connection_fn=create_connection_fn, wire_format=wire_format, topology=topology
+    )
 
 
 def create_consumer(
     deserializer: Callable[..., Any] = json.loads,
     handler: Callable = lambda data: data,
     create_connection_fn=create_connection,
+    prefetch: int = 1,
+    concurrency: int = 1,
+    retry_delays: Sequence[float] = (),
+    max_attempts: int = 5,
+    wire_format: Optional[WireFormat] = None,
+    scheduler: Optional[DomainScheduler | PriorityLanes] = None,
+    failure_policy: Optional[str] = None,
+    topology: Optional[Topology] = None,
 ):
     connection = create_connection_fn()
 
-    return RabbitConsumer(connection, handler, deserializer)
+    return RabbitConsumer(
+        connection,
+        handler,
+        deserializer,
+        prefetch=prefetch,
+        concurrency=concurrency,
+        retry_delays=retry_delays,
+        max_attempts=max_attempts,
+        wire_format=wire_format,
+        scheduler=scheduler,
+        failure_policy=failure_policy,
+        topology=topology,
+    )
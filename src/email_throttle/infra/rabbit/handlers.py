@@ -1,9 +1,19 @@
+import functools
+import itertools
 import os
-from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, Sequence
 
 import pika
+from loguru import logger
 from pika.channel import Channel
 
+from email_throttle.core.entity import Priority
+from email_throttle.core.exceptions import PoisonMessage
+from email_throttle.core.scheduling import DomainScheduler, PriorityLanes, recipient_domain
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import Topology
+
 
 def create_connection():
     # TODO: add it to a config file or config class
@@ -12,7 +22,7 @@ def create_connection():
     user = os.getenv("RABBITMQ_USER", "user")
     password = os.getenv("RABBITMQ_PASSWORD", "password")
 
-    print(host, port, user, password)
+    logger.info(f"Connecting to RabbitMQ at {host}:{port}")
     connection = pika.BlockingConnection(
         pika.ConnectionParameters(
             host,
@@ -24,62 +34,367 @@ def create_connection():
     return connection
 
 
+EMAILS_QUEUE = "emails"
+RETRY_EXCHANGE = "throttler.retry"
+PARKING_QUEUE = "emails.parked"
+ATTEMPT_HEADER = "x-attempt"
+# a queue per priority, bulk keeps the queue of the producers that predate the lanes
+LANE_QUEUES = {Priority.TRANSACTIONAL: "emails.transactional", Priority.BULK: EMAILS_QUEUE}
+QUEUE_LANES = {queue: lane for lane, queue in LANE_QUEUES.items()}
+# what the consumer does with a message its handler failed to send
+FAILURE_POLICIES = ("retry", "requeue", "dead-letter")
+
+
+def retry_queue_name(delay: float, queue: str = EMAILS_QUEUE) -> str:
+    return f"{queue}.retry.{int(delay * 1000)}ms"
+
+
+def lane_queue(message) -> str:
+    """Queue of the priority of a message, messages without one (e.g.: already serialized) are bulk."""
+    return LANE_QUEUES[getattr(message, "priority", Priority.BULK)]
+
+
 class RabbitConnector:
-    def __init__(self, connection: pika.BlockingConnection):
+    def __init__(self, connection: pika.BlockingConnection, declare: bool = True, topology: Optional[Topology] = None):
+        self.connection = connection
         self.channel = connection.channel()
-        self.channel.exchange_declare(exchange="throttler", exchange_type="direct")
-        self.channel.queue_declare(queue="emails")
-        self.channel.queue_bind(
-            exchange="throttler",
-            queue="emails",
-        )
+        self.topology = topology or Topology()
+        if declare:
+            self.declare_topology()
+
+    def declare_topology(self):
+        """The throttler exchange routes each lane (routing key: the queue name) to its queue. Messages rejected
+        by the consumers (or, with a delivery limit, redelivered too many times) are dead-lettered to
+        `emails.parked` through the retry exchange."""
+        self.topology.declare_exchange(self.channel, "throttler")
+        self.topology.declare_exchange(self.channel, RETRY_EXCHANGE)
+        self.topology.declare_queue(self.channel, PARKING_QUEUE)
+        self.channel.queue_bind(exchange=RETRY_EXCHANGE, queue=PARKING_QUEUE, routing_key=PARKING_QUEUE)
+        for queue in LANE_QUEUES.values():
+            self.topology.declare_queue(
+                self.channel,
+                queue,
+                {"x-dead-letter-exchange": RETRY_EXCHANGE, "x-dead-letter-routing-key": PARKING_QUEUE},
+                consumed=True,
+            )
+            self.channel.queue_bind(
+                exchange="throttler",
+                queue=queue,
+            )
+
+    def declare_retry_topology(self, delays: Sequence[float], queues: Sequence[str] = (EMAILS_QUEUE,)):
+        """A queue per retry delay and lane, without consumers: messages expire after the delay (queue TTL) and are
+        dead-lettered back to the queue of their lane."""
+        for lane in queues:
+            for delay in delays:
+                queue = retry_queue_name(delay, lane)
+                self.topology.declare_queue(
+                    self.channel,
+                    queue,
+                    {
+                        "x-message-ttl": int(delay * 1000),
+                        "x-dead-letter-exchange": "throttler",
+                        "x-dead-letter-routing-key": lane,
+                    },
+                )
+                self.channel.queue_bind(exchange=RETRY_EXCHANGE, queue=queue, routing_key=queue)
 
 
 class RabbitProducer(RabbitConnector):
+    """Publishes emails to the throttler exchange.
+
+    With `confirm` (default), the channel is transactional: publishes are pipelined and a single commit per batch
+    waits for the broker to take all of them. The blocking adapter only supports synchronous, per message
+    publisher confirms, so a transaction is the way to get a broker acknowledgement per batch.
+
+    With a `wire_format`, it encodes the messages instead of the serializer and sets their content type.
+    Each message is routed to the queue of its priority (see `LANE_QUEUES`), persistent unless the `topology`
+    is transient.
+    """
+
     def __init__(
         self,
         connection: pika.BlockingConnection,
         serializer: Callable[..., str],
+        confirm: bool = True,
+        batch_size: int = 500,
+        declare: bool = True,
+        wire_format: Optional[WireFormat] = None,
+        topology: Optional[Topology] = None,
     ):
-        super().__init__(connection)
+        super().__init__(connection, declare=declare, topology=topology)
         self.serializer = serializer
+        self.wire_format = wire_format
+        self.confirm = confirm
+        self.batch_size = batch_size
+        if confirm:
+            self.channel.tx_select()
 
     def send(self, messages):
+        self._publish(*self._encode(messages), routing_key=lane_queue(messages))
+        if self.confirm:
+            self.channel.tx_commit()
+
+    def send_many(self, messages: Iterable) -> tuple[int, int]:
+        """Publishes the messages in batches of `batch_size`, returns how many were accepted and rejected.
+        A batch is accepted or rejected as a whole."""
+        accepted = rejected = 0
+        for batch in itertools.batched(messages, self.batch_size):
+            bodies = [(*self._encode(message), lane_queue(message)) for message in batch]
+            try:
+                for body, properties, routing_key in bodies:
+                    self._publish(body, properties, routing_key)
+                if self.confirm:
+                    self.channel.tx_commit()
+                accepted += len(bodies)
+            except pika.exceptions.AMQPError as e:
+                logger.error(f"Batch of {len(bodies)} messages rejected: {e!r}")
+                rejected += len(bodies)
+                self._recover()
+        return accepted, rejected
+
+    def _encode(self, message) -> tuple[bytes | str, Optional[pika.BasicProperties]]:
+        if self.wire_format is None:
+            return self.serializer(message), None
+        return self.wire_format.encode(message)
+
+    def _publish(self, body, properties: Optional[pika.BasicProperties] = None, routing_key: str = EMAILS_QUEUE):
         self.channel.basic_publish(
             exchange="throttler",
-            routing_key="emails",
-            body=self.serializer(messages),
+            routing_key=routing_key,
+            body=body,
+            properties=self.topology.persist(properties),
         )
 
+    def _recover(self):
+        """Discards the uncommitted publishes, or reopens the channel if the broker closed it."""
+        try:
+            if self.channel.is_open:
+                if self.confirm:
+                    self.channel.tx_rollback()
+            elif self.connection.is_open:
+                self.channel = self.connection.channel()
+                if self.confirm:
+                    self.channel.tx_select()
+        except pika.exceptions.AMQPError as e:
+            logger.error(f"Could not recover the channel: {e!r}")
+
 
 class RabbitConsumer(RabbitConnector):
+    """Consumes the emails queue.
+
+    With `concurrency` > 1, deliveries are handled by a thread pool so up to `concurrency` messages are in flight,
+    and `prefetch` bounds how many unacked deliveries the broker pushes. pika channels are not thread safe:
+    workers never touch the channel, the ack is scheduled on the connection thread with `add_callback_threadsafe`
+    once the message has been handled.
+
+    Every delivery is settled, so a failed message never holds a prefetch slot. A message whose handler fails
+    follows the `failure_policy`:
+    - retry (default with `retry_delays`): it is republished to the retry queue of its attempt and acked, the broker
+      brings it back after the delay, so the consumer never sleeps and keeps sending its heartbeats. The attempt
+      travels in the `x-attempt` header, after `max_attempts` deliveries the message is parked.
+    - requeue: it is nacked back to its queue and redelivered right away. Only with a quorum `topology` with a
+      delivery limit: the broker dead-letters it after that many deliveries, instead of redelivering it forever.
+    - dead-letter (default without `retry_delays`): it is rejected, the broker dead-letters it to `emails.parked`.
+    A message that can't be decoded, or that the handler finds poison (`PoisonMessage`), is always dead-lettered:
+    no attempt would succeed.
+
+    With a `wire_format`, deliveries are decoded by their content type instead of the deserializer.
+
+    With a `scheduler`, deliveries are decoded on arrival and queued by the domain of their first recipient, and the
+    free workers take them in the scheduler order (deficit round robin, paced per domain). A `prefetch` larger than
+    the concurrency lets messages of other domains arrive while a large campaign is queued or a domain is paced.
+    With `PriorityLanes` as the scheduler, it consumes the queue of each lane (see `LANE_QUEUES`) and the workers
+    take the messages of the lanes by weight. The prefetch applies to each queue, a bulk backlog never takes the
+    slots of the transactional queue.
+    """
+
     def __init__(
         self,
         connection: pika.BlockingConnection,
         consume_callback: Callable,
         deserializer: Callable,
+        prefetch: int = 1,
+        concurrency: int = 1,
+        retry_delays: Sequence[float] = (),
+        max_attempts: int = 5,
+        wire_format: Optional[WireFormat] = None,
+        scheduler: Optional[DomainScheduler | PriorityLanes] = None,
+        failure_policy: Optional[str] = None,
+        topology: Optional[Topology] = None,
     ):
-        super().__init__(
-            connection,
-        )
-        self.channel.basic_consume(
-            queue="emails",
-            on_message_callback=self.consume,
-            auto_ack=False,
+        failure_policy = failure_policy or ("retry" if retry_delays else "dead-letter")
+        if failure_policy not in FAILURE_POLICIES:
+            raise ValueError(f"Unknown failure policy {failure_policy!r}, expected one of {FAILURE_POLICIES}")
+        if failure_policy == "retry" and not retry_delays:
+            raise ValueError("The retry failure policy needs retry delays")
+        if failure_policy == "requeue" and (topology is None or topology.delivery_limit is None):
+            raise ValueError("The requeue failure policy needs quorum queues with a delivery limit")
+        super().__init__(connection, topology=topology)
+        self.failure_policy = failure_policy
+        self.wire_format = wire_format
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        # scheduled messages handed to the workers, only used from the connection thread
+        self.in_flight = 0
+        self._wake_pending = False
+        self._closing = False
+        self.queues = (
+            [LANE_QUEUES[lane] for lane in scheduler.lanes] if isinstance(scheduler, PriorityLanes) else [EMAILS_QUEUE]
         )
-        self.channel.basic_qos(prefetch_count=1)
+        self.retry_delays = retry_delays
+        self.max_attempts = max_attempts
+        if failure_policy == "retry":
+            self.declare_retry_topology(retry_delays, self.queues)
+        # qos must be set before consuming, otherwise the broker may push unbounded deliveries
+        self.channel.basic_qos(prefetch_count=prefetch)
+        for queue in self.queues:
+            self.channel.basic_consume(
+                queue=queue,
+                on_message_callback=functools.partial(self.consume, queue=queue),
+                auto_ack=False,
+            )
         self.consume_callback = consume_callback
         self.deserializer = deserializer
+        self.executor = (
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="consumer")
+            if concurrency > 1 or scheduler is not None
+            else None
+        )
 
     def start_consuming(self):
         self.channel.start_consuming()
 
-    def consume(self, ch: Channel, method, properties, body):
-        print(self, ch, method, properties, body)
+    def close(self):
+        """Waits for the messages in flight and flushes their acks. Scheduled messages not handed to a worker are
+        left unacked, the broker delivers them again."""
+        self._closing = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.connection.process_data_events(time_limit=0)
 
+    def consume(self, ch: Channel, method, properties, body, queue: str = EMAILS_QUEUE):
+        logger.debug(f"Received message {method.delivery_tag}")
+
+        if self.scheduler is not None:
+            self._schedule(ch, method.delivery_tag, properties, body, queue)
+        elif self.executor is None:
+            self._settle(ch, method.delivery_tag, properties, body, queue, self.handle(body, properties))
+        else:
+            self.executor.submit(self._handle_in_worker, ch, method.delivery_tag, properties, body, queue)
+
+    def handle(self, body, properties=None) -> Optional[bool]:
+        """True when the message was handled, False when the handler failed, None when it can't be decoded or
+        the handler found it poison."""
+        try:
+            message = self._decode(body, properties)
+        except Exception as e:
+            logger.error(f"Discarding a message that can't be decoded: {e}")
+            return None
+        return self._call(message)
+
+    def _decode(self, body, properties):
+        if self.wire_format is None:
+            return self.deserializer(body)
+        return self.wire_format.decode(body, properties)
+
+    def _call(self, message) -> Optional[bool]:
         try:
-            message = self.deserializer(body)
             self.consume_callback(message)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return True
+        except PoisonMessage as e:
+            logger.error(f"Discarding a message that can't be sent: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error while consuming {e}")
+            return False
+
+    def _schedule(self, ch: Channel, delivery_tag: int, properties, body, queue: str):
+        try:
+            message = self._decode(body, properties)
         except Exception as e:
-            print("Error while consuming", e)
+            logger.error(f"Discarding a message that can't be decoded: {e}")
+            self._settle(ch, delivery_tag, properties, body, queue, handled=None)
+            return
+        scheduled = (ch, delivery_tag, properties, body, queue, message)
+        if isinstance(self.scheduler, PriorityLanes):
+            self.scheduler.push(QUEUE_LANES[queue], recipient_domain(message.to), scheduled, cost=len(message.to))
+        else:
+            self.scheduler.push(recipient_domain(message.to), scheduled, cost=len(message.to))
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hands the next scheduled messages to the free workers, and sets a timer if the queued domains are paced.
+        Runs on the connection thread."""
+        if self._closing:
+            return
+        while self.in_flight < self.concurrency:
+            scheduled = self.scheduler.pop()
+            if scheduled is None:
+                break
+            self.in_flight += 1
+            self.executor.submit(self._handle_scheduled, *scheduled)
+        if self.in_flight < self.concurrency and len(self.scheduler) and not self._wake_pending:
+            self._wake_pending = True
+            self.connection.call_later(self.scheduler.wait_time(), self._wake)
+
+    def _wake(self):
+        self._wake_pending = False
+        self._dispatch()
+
+    def _handle_scheduled(self, ch: Channel, delivery_tag: int, properties, body, queue: str, message):
+        handled = self._call(message)
+        self.connection.add_callback_threadsafe(
+            functools.partial(self._finish_scheduled, ch, delivery_tag, properties, body, queue, handled)
+        )
+
+    def _finish_scheduled(self, ch: Channel, delivery_tag: int, properties, body, queue: str, handled: Optional[bool]):
+        self.in_flight -= 1
+        self._settle(ch, delivery_tag, properties, body, queue, handled)
+        self._dispatch()
+
+    def _settle(self, ch: Channel, delivery_tag: int, properties, body, queue: str, handled: Optional[bool]):
+        """Acks a handled message, applies the failure policy to a failed one and dead-letters a poison one.
+        Runs on the connection thread."""
+        if handled:
+            ch.basic_ack(delivery_tag=delivery_tag)
+        elif handled is None or self.failure_policy == "dead-letter":
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+        elif self.failure_policy == "requeue":
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        else:
+            self._requeue(ch, delivery_tag, properties, body, queue)
+
+    def _handle_in_worker(self, ch: Channel, delivery_tag: int, properties, body, queue: str = EMAILS_QUEUE):
+        handled = self.handle(body, properties)
+        self.connection.add_callback_threadsafe(
+            functools.partial(self._settle, ch, delivery_tag, properties, body, queue, handled)
+        )
+
+    def _requeue(self, ch: Channel, delivery_tag: int, properties, body, queue: str = EMAILS_QUEUE):
+        """Republishes a failed message to the retry queue of its attempt and lane (or parks it), then acks the
+        delivery. Runs on the connection thread."""
+        headers = dict((properties and properties.headers) or {})
+        attempt = headers.get(ATTEMPT_HEADER, 0) + 1
+        if attempt >= self.max_attempts:
+            logger.error(f"Message {delivery_tag} failed {attempt} times, parking it in {PARKING_QUEUE}")
+            routing_key = PARKING_QUEUE
+        else:
+            delay = self.retry_delays[min(attempt, len(self.retry_delays)) - 1]
+            logger.warning(f"Message {delivery_tag} failed (attempt {attempt}), retrying in {delay} seconds")
+            routing_key = retry_queue_name(delay, queue)
+        headers[ATTEMPT_HEADER] = attempt
+        ch.basic_publish(
+            exchange=RETRY_EXCHANGE,
+            routing_key=routing_key,
+            body=body,
+            properties=self.topology.persist(
+                pika.BasicProperties(
+                    headers=headers,
+                    content_type=properties and properties.content_type,
+                    content_encoding=properties and properties.content_encoding,
+                    delivery_mode=properties and properties.delivery_mode,
+                )
+            ),
+        )
+        ch.basic_ack(delivery_tag=delivery_tag)
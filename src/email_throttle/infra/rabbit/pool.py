@@ -0,0 +1,109 @@
+import queue
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import pika
+from loguru import logger
+
+from email_throttle.infra.rabbit.handlers import RabbitProducer, create_connection
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import Topology
+
+
+class PoolExhausted(Exception):
+    """Raised when no producer is released before the checkout timeout."""
+
+
+class RabbitProducerPool:
+    """Long lived producers (one connection and one channel each) shared by the API requests.
+
+    pika connections are not thread safe, so a producer is checked out by a single request at a time.
+    Producers are connected lazily and each new connection declares the topology (declarations are idempotent, and
+    a broker restarted with a transient topology has lost it). A producer whose connection is closed, or that
+    failed with an AMQP error, is discarded and replaced on the next checkout.
+    """
+
+    def __init__(
+        self,
+        serializer: Callable[..., str],
+        size: int = 4,
+        create_connection_fn: Callable[[], pika.BlockingConnection] = create_connection,
+        timeout: float = 5,
+        wire_format: Optional[WireFormat] = None,
+        topology: Optional[Topology] = None,
+    ):
+        self.serializer = serializer
+        self.wire_format = wire_format
+        self.topology = topology
+        self.create_connection_fn = create_connection_fn
+        self.timeout = timeout
+        # None is a slot whose producer isn't connected yet
+        self._idle: queue.LifoQueue[Optional[RabbitProducer]] = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._idle.put(None)
+
+    def start(self):
+        """Connects one producer and declares the topology. If the broker is not reachable yet,
+        it is retried on the first checkout."""
+        try:
+            with self.acquire():
+                pass
+        except pika.exceptions.AMQPError as e:
+            logger.warning(f"RabbitMQ not available at startup, connecting on first use: {e!r}")
+
+    @contextmanager
+    def acquire(self):
+        try:
+            producer = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhausted(f"No RabbitMQ producer released in {self.timeout} seconds")
+
+        try:
+            if not self._is_healthy(producer):
+                self._discard(producer)
+                producer = None
+                producer = self._connect()
+            yield producer
+        except pika.exceptions.AMQPError:
+            self._discard(producer)
+            producer = None
+            raise
+        finally:
+            self._idle.put(producer)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def _connect(self) -> RabbitProducer:
+        return RabbitProducer(
+            self.create_connection_fn(),
+            self.serializer,
+            declare=True,
+            wire_format=self.wire_format,
+            topology=self.topology,
+        )
+
+    @staticmethod
+    def _is_healthy(producer: Optional[RabbitProducer]) -> bool:
+        if producer is None:
+            return False
+        try:
+            # services heartbeats of the idle connection and detects if the broker closed it
+            producer.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            return False
+        return producer.connection.is_open and producer.channel.is_open
+
+    @staticmethod
+    def _discard(producer: Optional[RabbitProducer]):
+        if producer is None:
+            return
+        try:
+            if producer.connection.is_open:
+                producer.connection.close()
+        except pika.exceptions.AMQPError as e:
+            logger.warning(f"Error while closing a RabbitMQ connection: {e!r}")
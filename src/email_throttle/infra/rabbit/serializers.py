@@ -0,0 +1,217 @@
+import struct
+import zlib
+from typing import Callable, NamedTuple, Optional
+
+import pika
+from pydantic import TypeAdapter
+
+from email_throttle.core.entity import EmailMessage, Priority, TemplatedEmail
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+
+try:
+    from compression import zstd  # Python 3.14
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:  # optional dependency, zstd compression is not available
+        zstd = None
+
+# built once: the validator is compiled by pydantic-core for the entity dataclass
+_email_message = TypeAdapter(EmailMessage)
+
+
+def decode_email_message(body: bytes | str) -> EmailMessage:
+    """Validates a queue body (JSON) straight into the entity, without an intermediate pydantic model."""
+    return _email_message.validate_json(body)
+
+
+def encode_email_message(message: EmailMessage) -> bytes:
+    return _email_message.dump_json(message)
+
+
+class JsonCodec:
+    content_type = "application/json"
+
+    def encode(self, message: EmailMessage) -> bytes:
+        return encode_email_message(message)
+
+    def decode(self, body: bytes) -> EmailMessage:
+        return decode_email_message(body)
+
+
+_templated_email = TypeAdapter(TemplatedEmail)
+
+
+class TemplatedJsonCodec:
+    """Templated emails (template id, recipient and variables), rendered by the consumer."""
+
+    content_type = "application/vnd.email-throttle.templated+json"
+
+    def encode(self, message: TemplatedEmail) -> bytes:
+        return _templated_email.dump_json(message)
+
+    def decode(self, body: bytes) -> TemplatedEmail:
+        return _templated_email.validate_json(body)
+
+
+# version, flags and the item counts of to, cc, bcc, attachments and links
+_HEADER = struct.Struct("!BB5H")
+_MAX_ITEMS = 0xFFFF
+_IS_HTML = 0b001
+_HAS_KEY = 0b010
+_TRANSACTIONAL = 0b100
+
+
+class BinaryCodec:
+    """Fields in a fixed order, without names: a fixed header, the length (in characters) of each field,
+    and all the fields concatenated in a single UTF-8 string, so a message costs one encode and one decode.
+
+    Layout: version, flags (is_html, has a key, transactional) and the counts of the lists (at most 65535 items
+    each), then subject, from_email, the idempotency key (if flagged), body, and the items of to, cc, bcc,
+    attachments and links. A new layout gets a new version and content type, so both can be consumed during a
+    roll over.
+    """
+
+    version = 1
+    content_type = "application/vnd.email-throttle.email.v1"
+
+    def encode(self, message: EmailMessage) -> bytes:
+        key = message.idempotency_key
+        flags = (
+            (_IS_HTML if message.is_html else 0)
+            | (_HAS_KEY if key is not None else 0)
+            | (_TRANSACTIONAL if message.priority == Priority.TRANSACTIONAL else 0)
+        )
+        lists = (message.to, message.cc, message.bcc, message.attachments, message.links)
+        counts = tuple(map(len, lists))
+        if max(counts) > _MAX_ITEMS:
+            raise ValueError(
+                f"A binary email has at most {_MAX_ITEMS} recipients, attachments or links per list, got {max(counts)}"
+            )
+        fields = [message.subject, message.from_email]
+        if key is not None:
+            fields.append(key)
+        fields.append(message.body)
+        for items in lists:
+            fields.extend(items)
+        return b"".join(
+            (
+                _HEADER.pack(self.version, flags, *counts),
+                struct.pack(f"!{len(fields)}I", *map(len, fields)),
+                "".join(fields).encode(),
+            )
+        )
+
+    def decode(self, body: bytes) -> EmailMessage:
+        try:
+            version, flags, *counts = _HEADER.unpack_from(body)
+            if version != self.version:
+                raise ValueError(f"Unsupported binary email version {version}")
+            has_key = flags & _HAS_KEY
+            size = (4 if has_key else 3) + sum(counts)
+            lengths = struct.unpack_from(f"!{size}I", body, _HEADER.size)
+        except struct.error:
+            raise ValueError("Truncated binary email")
+        text = body[_HEADER.size + 4 * size :].decode()
+        fields = []
+        position = 0
+        for length in lengths:
+            fields.append(text[position : position + length])
+            position += length
+        if position != len(text):
+            raise ValueError("Truncated binary email")
+
+        if has_key:
+            subject, from_email, key, message_body = fields[:4]
+            position = 4
+        else:
+            subject, from_email, message_body = fields[:3]
+            key, position = None, 3
+        lists = []
+        for count in counts:
+            lists.append(fields[position : position + count])
+            position += count
+        to, cc, bcc, attachments, links = lists
+        return EmailMessage(
+            subject=subject,
+            body=message_body,
+            to=to,
+            from_email=from_email,
+            cc=tuple(cc),
+            bcc=tuple(bcc),
+            attachments=tuple(attachments),
+            is_html=bool(flags & _IS_HTML),
+            links=tuple(links),
+            idempotency_key=key,
+            priority=Priority.TRANSACTIONAL if flags & _TRANSACTIONAL else Priority.BULK,
+        )
+
+
+class Compression(NamedTuple):
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+CODECS = {"json": JsonCodec(), "binary": BinaryCodec()}
+COMPRESSIONS = {"deflate": Compression("deflate", zlib.compress, zlib.decompress)}
+if zstd is not None:
+    COMPRESSIONS["zstd"] = Compression("zstd", zstd.compress, zstd.decompress)
+
+_TEMPLATED = TemplatedJsonCodec()
+_CODECS_BY_CONTENT_TYPE = {codec.content_type: codec for codec in (*CODECS.values(), _TEMPLATED)}
+
+
+class WireFormat:
+    """Encodes queued emails with one codec, and decodes whatever codec a delivery was encoded with.
+
+    The codec travels in the `content_type` property and the compression in `content_encoding`, so consumers
+    decode every known format and producers can switch format while older messages are still queued.
+    A delivery without a content type is JSON, as published before the codecs existed.
+    Bodies longer than `compress_over` bytes are compressed with `compression`, if any.
+    With a `claim_check`, large bodies and attachments are stored out of the message before encoding it, the
+    consumer reads them back (see `ClaimCheck.check_out`). Templated emails always use their own JSON codec.
+    """
+
+    def __init__(
+        self,
+        codec: str = "json",
+        compression: Optional[str] = None,
+        compress_over: int = 1024,
+        claim_check: Optional[ClaimCheck] = None,
+    ):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {sorted(CODECS)}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown or unavailable compression {compression!r}, expected one of {sorted(COMPRESSIONS)}"
+            )
+        self.codec = CODECS[codec]
+        self.compression = compression and COMPRESSIONS[compression]
+        self.compress_over = compress_over
+        self.claim_check = claim_check
+
+    def encode(self, message: EmailMessage | TemplatedEmail) -> tuple[bytes, pika.BasicProperties]:
+        codec = self.codec
+        if isinstance(message, TemplatedEmail):
+            codec = _TEMPLATED
+        elif self.claim_check is not None:
+            message = self.claim_check.check_in(message)
+        body = codec.encode(message)
+        encoding = None
+        if self.compression and len(body) > self.compress_over:
+            body = self.compression.compress(body)
+            encoding = self.compression.name
+        return body, pika.BasicProperties(content_type=codec.content_type, content_encoding=encoding)
+
+    def decode(self, body: bytes, properties: Optional[pika.BasicProperties] = None) -> EmailMessage | TemplatedEmail:
+        content_type = (properties and properties.content_type) or JsonCodec.content_type
+        encoding = properties and properties.content_encoding
+        codec = _CODECS_BY_CONTENT_TYPE.get(content_type)
+        if codec is None:
+            raise ValueError(f"Unsupported content type {content_type!r}")
+        if encoding:
+            if encoding not in COMPRESSIONS:
+                raise ValueError(f"Unsupported content encoding {encoding!r}")
+            body = COMPRESSIONS[encoding].decompress(body)
+        return codec.decode(body)
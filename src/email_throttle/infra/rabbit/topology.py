@@ -0,0 +1,70 @@
+"""
+Durability of the queues and of the messages, shared by producers and consumers.
+
+Every process declares the same exchanges and queues, and the broker refuses a declaration whose durability or
+arguments differ from the existing queue (PRECONDITION_FAILED): the API and the consumers must use the same
+`EMAIL_THROTTLE_QUEUE_TYPE` (and delivery limit). Changing it needs the queues to be deleted (or drained) first.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import pika
+from pika.channel import Channel
+
+QUEUE_TYPES = ("transient", "durable", "quorum")
+PERSISTENT = pika.DeliveryMode.Persistent.value
+
+
+@dataclass(frozen=True, slots=True)
+class Topology:
+    """How the queues and messages survive a broker restart, from the cheapest to the safest:
+
+    - transient: classic queues and messages in memory, lost on restart.
+    - durable: durable classic queues and persistent messages, written to disk before the broker takes them.
+    - quorum: quorum queues, replicated to a majority of the cluster nodes (Raft) before the broker takes a message.
+      With a `delivery_limit`, the broker dead-letters a message redelivered that many times (e.g.: requeued by
+      failing consumers, or consumers that crash while handling it).
+    """
+
+    queue_type: str = "durable"
+    delivery_limit: Optional[int] = None
+
+    def __post_init__(self):
+        if self.queue_type not in QUEUE_TYPES:
+            raise ValueError(f"Unknown queue type {self.queue_type!r}, expected one of {QUEUE_TYPES}")
+        if self.delivery_limit is not None and self.queue_type != "quorum":
+            raise ValueError("Only quorum queues count the deliveries of a message, a delivery limit needs them")
+
+    @classmethod
+    def from_env(cls) -> "Topology":
+        limit = os.getenv("EMAIL_THROTTLE_DELIVERY_LIMIT")
+        return cls(os.getenv("EMAIL_THROTTLE_QUEUE_TYPE", "durable"), int(limit) if limit else None)
+
+    @property
+    def durable(self) -> bool:
+        return self.queue_type != "transient"
+
+    def declare_exchange(self, channel: Channel, exchange: str):
+        # bindings of a durable queue to a transient exchange would be lost on restart
+        channel.exchange_declare(exchange=exchange, exchange_type="direct", durable=self.durable)
+
+    def declare_queue(self, channel: Channel, queue: str, arguments: Optional[dict] = None, consumed: bool = False):
+        """Declares a queue of this type. The delivery limit only applies to the `consumed` queues, the retry
+        queues only expire their messages."""
+        arguments = dict(arguments or {})
+        if self.queue_type == "quorum":
+            arguments["x-queue-type"] = "quorum"
+            if consumed and self.delivery_limit is not None:
+                arguments["x-delivery-limit"] = self.delivery_limit
+        channel.queue_declare(queue=queue, durable=self.durable, arguments=arguments or None)
+
+    def persist(self, properties: Optional[pika.BasicProperties]) -> Optional[pika.BasicProperties]:
+        """Marks a message persistent in durable queues (quorum queues persist every message anyway)."""
+        if not self.durable:
+            return properties
+        if properties is None:
+            return pika.BasicProperties(delivery_mode=PERSISTENT)
+        properties.delivery_mode = PERSISTENT
+        return properties
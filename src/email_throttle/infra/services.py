@@ -0,0 +1,131 @@
+"""
+Services of the vendors from their config: a dict per vendor, e.g.:
+
+    {"name": "v1", "middlewares": ["retry", "cb", "gcra"], "retry": {"retries": 3},
+     "circuit_breaker": {"threshold": 5, "reset_timeout": 10}, "rate_limiter": {"max_attempts": 10, "per_seconds": 1}}
+
+Used by the simulator, the consumer and the API. The vendors are NoOp senders.
+"""
+
+import functools
+from typing import Optional
+
+from email_throttle.core.abstract.routing import RoutingStrategy
+from email_throttle.core.middlewares.default.circuit_breaker import (
+    AsyncCircuitBreaker,
+    CircuitBreaker,
+)
+from email_throttle.core.middlewares.default.rate_limiter import (
+    AsyncRateLimiter,
+    GCRARateLimiter,
+    RateLimiter,
+    TokenBucketRateLimiter,
+)
+from email_throttle.core.middlewares.default.retry import (
+    AdaptiveBackoff,
+    AsyncRetry,
+    DecorrelatedJitterBackoff,
+    ExponentialBackoff,
+    FullJitterBackoff,
+    Retry,
+    RetryBudget,
+)
+from email_throttle.core.routing import (
+    EwmaLatency,
+    LeastInFlight,
+    OrderedRouting,
+    WeightedRoundRobin,
+)
+from email_throttle.core.service import AsyncEmailService, EmailService
+from email_throttle.infra.shared.middlewares import (
+    AsyncSharedCircuitBreaker,
+    SharedCircuitBreaker,
+    SharedGCRAEngine,
+)
+from email_throttle.vendors.noop import AsyncNoOpEmailSender, NoOpEmailSender
+
+# rl: sliding window log, tb: token bucket, gcra: generic cell rate algorithm
+RATE_LIMITERS = {
+    "rl": RateLimiter,
+    "tb": TokenBucketRateLimiter,
+    "gcra": GCRARateLimiter,
+}
+
+BACKOFFS = {
+    "exponential": ExponentialBackoff,
+    "full": FullJitterBackoff,
+    "decorrelated": DecorrelatedJitterBackoff,
+    "adaptive": AdaptiveBackoff,
+}
+
+ROUTINGS = {
+    "ordered": OrderedRouting,
+    "wrr": WeightedRoundRobin,
+    "least": LeastInFlight,
+    "ewma": EwmaLatency,
+}
+
+
+def create_services(vendors_config: list[dict], asynchronous: bool = False) -> list[EmailService | AsyncEmailService]:
+    """Creates a service per vendor config.
+
+    If the config has a `state_dir`, rate limiters and circuit breakers keep their state there, shared with
+    every process of the node using the same directory (rate limiters use the GCRA engine in that case).
+    With `asynchronous`, it creates the asyncio pipeline (`AsyncEmailService` and the async middlewares).
+    """
+    services = []
+    for config in vendors_config:
+        vendor = (AsyncNoOpEmailSender if asynchronous else NoOpEmailSender)(config["name"])
+        state_dir = config.get("state_dir")
+        middlewares = []
+        for middleware in config.get("middlewares", []):
+            if middleware in RATE_LIMITERS:
+                max_attempts = config["rate_limiter"]["max_attempts"]
+                per_seconds = config["rate_limiter"]["per_seconds"]
+                if state_dir:
+                    engine = SharedGCRAEngine.for_vendor(state_dir, config["name"], max_attempts, per_seconds)
+                elif asynchronous:
+                    engine = RATE_LIMITERS[middleware].engine_class(max_attempts, per_seconds)
+                else:
+                    engine = None
+                m = (AsyncRateLimiter if asynchronous else RATE_LIMITERS[middleware])(
+                    max_attempts,
+                    per_seconds,
+                    engine=engine,
+                    wait="max_wait" in config["rate_limiter"],
+                    max_wait=config["rate_limiter"].get("max_wait"),
+                )
+            elif middleware == "cb":
+                if state_dir:
+                    cb_class = functools.partial(
+                        (AsyncSharedCircuitBreaker if asynchronous else SharedCircuitBreaker).for_vendor,
+                        state_dir,
+                        config["name"],
+                    )
+                else:
+                    cb_class = AsyncCircuitBreaker if asynchronous else CircuitBreaker
+                m = cb_class(
+                    config["circuit_breaker"]["threshold"],
+                    config["circuit_breaker"]["reset_timeout"],
+                )
+            elif middleware == "retry":
+                budget = config["retry"].get("budget")
+                m = (AsyncRetry if asynchronous else Retry)(
+                    config["retry"]["retries"],
+                    backoff=BACKOFFS[config["retry"].get("backoff", "exponential")](),
+                    budget=RetryBudget(budget) if budget else None,
+                )
+            middlewares.append(m)
+        service = (AsyncEmailService if asynchronous else EmailService)(vendor, middlewares)
+        services.append(service)
+    return services
+
+
+def create_routing(name: str, size: int, weights: Optional[list[int]] = None) -> RoutingStrategy:
+    if name == "wrr":
+        if weights and len(weights) != size:
+            raise ValueError(f"{len(weights)} weights for {size} vendors, expected a weight per vendor")
+        return WeightedRoundRobin(weights or [1] * size)
+    if name == "ordered":
+        return OrderedRouting()
+    return ROUTINGS[name](size)
@@ -0,0 +1,57 @@
+"""
+Idempotency keys shared by every process of the node.
+
+The time windowed Bloom filter keeps its two bit arrays, the current filter and the rotation time in a
+`SharedRecord`, so a key sent by a consumer is found by the others. Every operation runs under its lock.
+"""
+
+from email_throttle.core.dedup import BloomFilter, TimeWindowBloomFilter
+from email_throttle.infra.shared.mmap_state import SharedRecord, shared_state_path
+
+
+class SharedTimeWindowBloomFilter(TimeWindowBloomFilter):
+    """Every process must use the same capacity and error rate, they set the layout of the file."""
+
+    def __init__(self, path: str, capacity: int, error_rate: float, window: float):
+        # super().__init__ is not called: it would reset the rotation of the other processes
+        size = BloomFilter.byte_size(capacity, error_rate)
+        # current filter index, rotation time (0: a new file, rotated on first use)
+        self.record = SharedRecord(path, "qd", extra=2 * size)
+        self.window = window
+        self.filters = [
+            BloomFilter(capacity, error_rate, bits) for bits in (self.record.extra[:size], self.record.extra[size:])
+        ]
+
+    @classmethod
+    def for_node(cls, state_dir: str, capacity: int, error_rate: float, window: float) -> "SharedTimeWindowBloomFilter":
+        return cls(shared_state_path(state_dir, "emails", "idempotency"), capacity, error_rate, window)
+
+    @property
+    def current(self) -> int:
+        return self.record.read()[0]
+
+    @current.setter
+    def current(self, value: int):
+        self.record.write(value, self.rotated_at)
+
+    @property
+    def rotated_at(self) -> float:
+        return self.record.read()[1]
+
+    @rotated_at.setter
+    def rotated_at(self, value: float):
+        self.record.write(self.current, value)
+
+    def add(self, key: str):
+        with self.record.lock():
+            super().add(key)
+
+    def __contains__(self, key: str) -> bool:
+        with self.record.lock():
+            return super().__contains__(key)
+
+    def close(self):
+        # the filters hold slices of the record's memory map, it can't be closed while they are exported
+        for bloom_filter in self.filters:
+            bloom_filter.bits.release()
+        self.record.close()
@@ -0,0 +1,130 @@
+"""
+Middleware state shared by every process of a node.
+
+The in-process middlewares keep their state in instance attributes, so N consumers mean N quotas
+and N breakers per vendor. These subclasses keep the same logic but move the state to a `SharedRecord`,
+and run every read-modify-write under its lock.
+"""
+
+import threading
+from datetime import datetime
+from typing import Optional
+
+from email_throttle.core.middlewares.default.circuit_breaker import AsyncCircuitBreaker, CircuitBreaker
+from email_throttle.core.middlewares.default.rate_limit_engines import GCRAEngine
+from email_throttle.infra.shared.mmap_state import SharedRecord, shared_state_path
+
+
+class SharedGCRAEngine(GCRAEngine):
+    """GCRA engine whose theoretical arrival time lives in a shared record.
+
+    GCRA state is a single float, so an admit is one locked read and one write.
+    Time is `time.monotonic()`, which is system wide on Linux, so every process compares the same clock.
+    """
+
+    def __init__(self, path: str, max_requests: int, per_second: float):
+        # super().__init__ is not called: it would reset the shared TAT every time a process starts
+        self.period = per_second
+        self.interval = per_second / max_requests
+        self.record = SharedRecord(path, "d")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_vendor(cls, state_dir: str, name: str, max_requests: int, per_second: float) -> "SharedGCRAEngine":
+        return cls(shared_state_path(state_dir, name, "rate_limiter"), max_requests, per_second)
+
+    @property
+    def tat(self) -> float:
+        return self.record.read()[0]
+
+    @tat.setter
+    def tat(self, value: float):
+        self.record.write(value)
+
+    def try_acquire(self, permits: int = 1) -> bool:
+        with self.record.lock():
+            return super().try_acquire(permits)
+
+    def wait_time(self, permits: int = 1) -> float:
+        with self.record.lock():
+            return super().wait_time(permits)
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """Circuit breaker whose failure count, state and last failure time live in a shared record,
+    so a vendor trips (and recovers) once for every process of the node."""
+
+    STATES = ("CLOSED", "OPEN", "HALF-OPEN")
+
+    def __init__(self, path: str, failure_threshold: int, reset_timeout: int):
+        # super().__init__ is not called: it would close a breaker opened by another process
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # failure_count, state index, last failure timestamp (0: never failed), half-open probe start (0: none)
+        self.record = SharedRecord(path, "qqdd")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_vendor(
+        cls, state_dir: str, name: str, failure_threshold: int, reset_timeout: int
+    ) -> "SharedCircuitBreaker":
+        return cls(shared_state_path(state_dir, name, "circuit_breaker"), failure_threshold, reset_timeout)
+
+    def _update(self, index: int, value):
+        values = list(self.record.read())
+        values[index] = value
+        self.record.write(*values)
+
+    @property
+    def failure_count(self) -> int:
+        return self.record.read()[0]
+
+    @failure_count.setter
+    def failure_count(self, value: int):
+        self._update(0, value)
+
+    @property
+    def state(self) -> str:
+        return self.STATES[self.record.read()[1]]
+
+    @state.setter
+    def state(self, value: str):
+        self._update(1, self.STATES.index(value))
+
+    @property
+    def last_failure_time(self) -> Optional[datetime]:
+        timestamp = self.record.read()[2]
+        return datetime.fromtimestamp(timestamp) if timestamp else None
+
+    @last_failure_time.setter
+    def last_failure_time(self, value: Optional[datetime]):
+        self._update(2, value.timestamp() if value else 0.0)
+
+    @property
+    def _probe_started(self) -> Optional[datetime]:
+        timestamp = self.record.read()[3]
+        return datetime.fromtimestamp(timestamp) if timestamp else None
+
+    @_probe_started.setter
+    def _probe_started(self, value: Optional[datetime]):
+        self._update(3, value.timestamp() if value else 0.0)
+
+    def allow_request(self) -> bool:
+        with self.record.lock():
+            return super().allow_request()
+
+    def is_available(self) -> bool:
+        with self.record.lock():
+            return super().is_available()
+
+    def reset(self):
+        with self.record.lock():
+            super().reset()
+
+    def record_failure(self):
+        with self.record.lock():
+            super().record_failure()
+
+
+class AsyncSharedCircuitBreaker(SharedCircuitBreaker, AsyncCircuitBreaker):
+    """Shared circuit breaker for the asyncio pipeline, the locked sections are a few microseconds long."""
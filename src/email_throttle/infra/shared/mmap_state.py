@@ -0,0 +1,57 @@
+import fcntl
+import mmap
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+
+
+def shared_state_path(state_dir: str, name: str, kind: str) -> str:
+    """Path of the record `kind` (e.g.: rate_limiter, circuit_breaker) of the vendor `name`."""
+    os.makedirs(state_dir, exist_ok=True)
+    safe_name = re.sub(r"[^\w.-]", "_", name)
+    return os.path.join(state_dir, f"{safe_name}.{kind}")
+
+
+class SharedRecord:
+    """A fixed layout record (`struct` format) stored in a memory mapped file.
+
+    Every process of the node that opens the same path sees the same values. A new file is zero
+    filled, so all the fields start at 0. Read-modify-write sequences must run inside `lock()`,
+    which excludes other threads (threading.Lock) and other processes (flock on the file).
+
+    Prefer a tmpfs path (/dev/shm) or a tmpfs volume: the state is meant to live as long as the node.
+    `extra` bytes after the record are mapped as a raw buffer (`self.extra`), e.g. for bit arrays.
+    """
+
+    def __init__(self, path: str, fmt: str, extra: int = 0):
+        self.path = path
+        self.struct = struct.Struct(fmt)
+        size = self.struct.size + extra
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.buffer = mmap.mmap(self.fd, size)
+        self.extra = memoryview(self.buffer)[self.struct.size :]
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def lock(self):
+        with self._thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def read(self) -> tuple:
+        return self.struct.unpack_from(self.buffer)
+
+    def write(self, *values):
+        self.struct.pack_into(self.buffer, 0, *values)
+
+    def close(self):
+        self.extra.release()
+        self.buffer.close()
+        os.close(self.fd)
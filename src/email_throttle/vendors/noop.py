@@ -1,6 +1,10 @@
+import threading
+import time
+from typing import Callable, Sequence
+
 from loguru import logger
 
-from email_throttle.core.abstract.sender import EmailSender
+from email_throttle.core.abstract.sender import AsyncEmailSender, EmailSender
 from email_throttle.core.entity import EmailMessage
 
 
@@ -11,3 +15,42 @@ class NoOpEmailSender(EmailSender):
     def send_email(self, message: EmailMessage):
         logger.debug(f"Sending email from {self.name}: {message.subject}")
         return f"Email sent from {self.name}"
+
+    def send_many(self, messages: Sequence[EmailMessage]):
+        logger.debug(f"Sending {len(messages)} emails from {self.name}")
+        return [(True, f"Email sent from {self.name}")] * len(messages)
+
+
+class LatencyNoOpEmailSender(NoOpEmailSender):
+    """NoOp sender that takes `latency` seconds to answer (a number or a function returning one per send,
+    e.g. `lambda: random.expovariate(10)`), to simulate slow vendors.
+
+    Like real vendors with idempotency support, a message whose `idempotency_key` was already delivered
+    is not delivered again. `delivered` counts the delivered messages.
+    """
+
+    def __init__(self, name: str, latency: float | Callable[[], float] = 0.0):
+        super().__init__(name)
+        self.latency = latency if callable(latency) else (lambda: latency)
+        self.delivered = 0
+        self.keys: set[str] = set()
+        self._lock = threading.Lock()
+
+    def send_email(self, message: EmailMessage):
+        time.sleep(self.latency())
+        with self._lock:
+            if message.idempotency_key is not None:
+                if message.idempotency_key in self.keys:
+                    return f"Email already sent from {self.name}"
+                self.keys.add(message.idempotency_key)
+            self.delivered += 1
+        return super().send_email(message)
+
+
+class AsyncNoOpEmailSender(AsyncEmailSender):
+    def __init__(self, name: str):
+        super().__init__(name)
+
+    async def send_email(self, message: EmailMessage):
+        logger.debug(f"Sending email from {self.name}: {message.subject}")
+        return f"Email sent from {self.name}"
@@ -0,0 +1,28 @@
+"""
+Tables printed by the benchmarks: a row per measured case, a column per measure.
+"""
+
+from typing import Iterable, Sequence
+
+
+def cell(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.0f}" if abs(value) >= 10_000 else f"{value:.4g}"
+    return str(value)
+
+
+def print_table(header: Sequence[str], rows: Iterable[Sequence]):
+    """Prints the rows under the header, the text columns aligned to the left and the numbers to the right."""
+    rows = [list(row) for row in rows]
+    cells = [[cell(value) for value in row] for row in rows]
+    widths = [max([len(name), *(len(row[column]) for row in cells)]) + 2 for column, name in enumerate(header)]
+    text = [all(isinstance(row[column], str) for row in rows) for column in range(len(header))]
+    print()
+    for line in [list(header), *cells]:
+        print("".join(v.ljust(w) if t else v.rjust(w) for v, w, t in zip(line, widths, text)).rstrip())
+
+
+def print_results(results: dict, label: str = ""):
+    """Prints `{case: {measure: value}}`."""
+    measures = list(next(iter(results.values())))
+    print_table([label, *measures], ([case, *values.values()] for case, values in results.items()))
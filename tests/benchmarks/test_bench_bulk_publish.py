@@ -0,0 +1,141 @@
+"""
+Latency of POST /email/bulk against a local broker stand-in.
+
+The stand-in is a thread on the other end of a socket pair: publishes are written to the socket and every
+synchronous request (a commit, or a per message confirm) waits for a one byte answer, so the measures include
+the real syscalls and the loopback round trips, but not the broker work.
+
+- per message: the previous endpoint, one publish per email, no confirms.
+- per message + confirm: one publish and one broker confirmation per email.
+- batched + confirm: `RabbitProducer.send_many`, one commit per batch of 500.
+
+Full run: python -m tests.benchmarks.test_bench_bulk_publish
+"""
+
+import socket
+import struct
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from email_throttle.api.endpoints.emails.router import send_email_bulk
+from email_throttle.core.entity import EmailMessage
+from email_throttle.infra.rabbit.handlers import RabbitProducer
+from email_throttle.infra.rabbit.serializers import WireFormat
+from tests.benchmarks.report import print_table
+
+SIZES = [100, 1_000, 10_000]
+
+
+class BrokerStandIn:
+    def __init__(self):
+        self.client, server = socket.socketpair()
+        self.thread = threading.Thread(target=self._serve, args=(server,), daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _serve(server: socket.socket):
+        stream = server.makefile("rb")
+        while kind := stream.read(1):
+            if kind == b"P":
+                (length,) = struct.unpack("!I", stream.read(4))
+                stream.read(length)
+            else:
+                server.sendall(b"k")
+
+    def close(self):
+        self.client.close()
+
+
+class StandInChannel:
+    """The subset of the pika BlockingChannel used by the producer."""
+
+    is_open = True
+
+    def __init__(self, broker: BrokerStandIn):
+        self.socket = broker.client
+        self.confirm_each = False
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def queue_declare(self, **kwargs):
+        pass
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def confirm_delivery(self):
+        self.confirm_each = True
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        self._sync()
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        body = body.encode() if isinstance(body, str) else body
+        self.socket.sendall(b"P" + struct.pack("!I", len(body)) + body)
+        if self.confirm_each:
+            self._sync()
+
+    def _sync(self):
+        self.socket.sendall(b"C")
+        self.socket.recv(1)
+
+
+def create_producer(broker: BrokerStandIn, transactional: bool, confirm_each: bool) -> RabbitProducer:
+    connection = MagicMock()
+    connection.channel.return_value = StandInChannel(broker)
+    producer = RabbitProducer(connection, str, confirm=transactional, wire_format=WireFormat())
+    if confirm_each:
+        producer.channel.confirm_delivery()
+    return producer
+
+
+def per_message(emails, producer):
+    for email in emails:
+        producer.send(email)
+
+
+def milliseconds(endpoint, emails, producer) -> float:
+    start = time.perf_counter()
+    endpoint(emails, producer)
+    return (time.perf_counter() - start) * 1e3
+
+
+def run_benchmark(sizes: list[int]) -> dict[tuple[str, int], float]:
+    email = EmailMessage(subject="subject", body="body", to=["to@example.com"], from_email="from@example.com")
+    broker = BrokerStandIn()
+    scenarios = [
+        ("per message", per_message, False, False),
+        ("per message + confirm", per_message, False, True),
+        ("batched + confirm", send_email_bulk, True, False),
+    ]
+    try:
+        return {
+            (name, size): milliseconds(endpoint, [email] * size, create_producer(broker, transactional, confirm_each))
+            for name, endpoint, transactional, confirm_each in scenarios
+            for size in sizes
+        }
+    finally:
+        broker.close()
+
+
+def print_report(results: dict[tuple[str, int], float]):
+    print_table(["publish", "emails", "ms"], [(*case, ms) for case, ms in results.items()])
+
+
+@pytest.mark.benchmark
+def test_batched_publish_latency():
+    results = run_benchmark([100, 1_000])
+    print_report(results)
+
+    assert results[("batched + confirm", 1_000)] < results[("per message + confirm", 1_000)]
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(SIZES))
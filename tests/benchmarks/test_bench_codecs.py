@@ -0,0 +1,83 @@
+"""
+Bytes on the wire and encode/decode cost per message of each wire format.
+
+A typical email (short body, one recipient) and a large one (about 8 KB of HTML, several recipients and links)
+are encoded with every codec, with and without compression (zstd only when it is installed).
+The large message is compressed by every compressed format (`compress_over` is 1 KB).
+
+Full run: python -m tests.benchmarks.test_bench_codecs
+"""
+
+import time
+
+import pytest
+
+from email_throttle.core.entity import EmailMessage
+from email_throttle.infra.rabbit.serializers import CODECS, COMPRESSIONS, WireFormat
+from tests.benchmarks.report import print_table
+
+MESSAGES = {
+    "typical": EmailMessage(
+        subject="Welcome", body="Hello, this is a test email", to=["to@example.com"], from_email="from@example.com"
+    ),
+    "large": EmailMessage(
+        subject="Your monthly report",
+        body="<p>" + "Your usage this month, the invoices and the upcoming changes of the plan. " * 110 + "</p>",
+        to=[f"team-{n}@example.com" for n in range(5)],
+        from_email="reports@example.com",
+        cc=("manager@example.com",),
+        is_html=True,
+        links=tuple(f"https://example.com/reports/{n}" for n in range(10)),
+        idempotency_key="report-2024-08",
+    ),
+}
+
+FORMATS = {
+    f"{codec}+{compression}" if compression else codec: WireFormat(codec, compression=compression)
+    for codec in CODECS
+    for compression in (None, *COMPRESSIONS)
+}
+
+
+def microseconds(fn, count: int, repeat: int = 3) -> float:
+    """Best of `repeat` runs, per call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) / count * 1e6
+
+
+def run_benchmark(count: int) -> dict[tuple[str, str], tuple[int, float, float]]:
+    results = {}
+    for message_name, message in MESSAGES.items():
+        for name, wire_format in FORMATS.items():
+            body, properties = wire_format.encode(message)
+            assert wire_format.decode(body, properties) == message
+            results[message_name, name] = (
+                len(body),
+                microseconds(lambda: wire_format.encode(message), count),
+                microseconds(lambda: wire_format.decode(body, properties), count),
+            )
+    return results
+
+
+def print_report(results: dict[tuple[str, str], tuple[int, float, float]]):
+    header = ["message", "format", "bytes", "encode us", "decode us"]
+    print_table(header, [(*case, *values) for case, values in results.items()])
+
+
+@pytest.mark.benchmark
+def test_wire_formats():
+    results = run_benchmark(count=2_000)
+    print_report(results)
+
+    # sizes are deterministic, timings are only reported
+    assert results["typical", "binary"][0] < results["typical", "json"][0]
+    assert results["large", "binary+deflate"][0] < results["large", "binary"][0] / 4
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(count=100_000))
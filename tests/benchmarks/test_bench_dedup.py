@@ -0,0 +1,65 @@
+"""
+Idempotency index: cost per email, false positive rate and memory, against an exact set of every key.
+
+`count` keys are sent (claimed and released) with a filter sized for them. Then as many new keys are checked
+against the filter alone: the ones it finds are false positives. Memory of the exact set is measured with
+tracemalloc, the filter is a fixed size bit array.
+
+Full run: python -m tests.benchmarks.test_bench_dedup
+"""
+
+import time
+import tracemalloc
+
+import pytest
+
+from email_throttle.core.dedup import IdempotencyIndex
+from tests.benchmarks.report import print_table
+
+
+def exact_set_bytes(count: int) -> int:
+    tracemalloc.start()
+    keys = {f"campaign-42:customer-{n}@example.com" for n in range(count)}
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keys
+    return held
+
+
+def run_benchmark(count: int, error_rate: float) -> dict[str, float]:
+    # an LRU of 1% of the keys: most of them are only remembered by the filter
+    index = IdempotencyIndex.create(capacity=count, error_rate=error_rate, exact_size=count // 100)
+    start = time.perf_counter()
+    for n in range(count):
+        key = f"campaign-42:customer-{n}@example.com"
+        index.claim(key)
+        index.release(key, sent=True)
+    elapsed = time.perf_counter() - start
+
+    false_positives = sum(f"campaign-43:customer-{n}@example.com" in index.bloom for n in range(count))
+    stats = index.stats()
+    return {
+        "claim + release us": elapsed / count * 1e6,
+        "false positive rate (configured)": error_rate,
+        "false positive rate (estimated)": stats["false_positive_rate"],
+        "false positive rate (observed)": false_positives / count,
+        "filter MB": stats["filter_bytes"] / 2**20,
+        "exact set MB": exact_set_bytes(count) / 2**20,
+    }
+
+
+def print_report(results: dict[str, float]):
+    print_table(["measure", "value"], results.items())
+
+
+@pytest.mark.benchmark
+def test_idempotency_index():
+    results = run_benchmark(count=20_000, error_rate=1e-3)
+    print_report(results)
+
+    assert results["false positive rate (observed)"] < 3e-3
+    assert results["filter MB"] * 5 < results["exact set MB"]
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(count=1_000_000, error_rate=1e-6))
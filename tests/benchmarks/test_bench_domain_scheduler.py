@@ -0,0 +1,97 @@
+"""
+Campaign to a single domain ahead of a few transactional emails to small domains: FIFO vs the domain scheduler.
+
+A consumer sends `send_rate` emails per second. A campaign of `campaign` emails to gmail.com is queued first,
+then one email to each of `small` other domains. gmail.com accepts `domain_rate` emails per second, the ones
+over it are deferred by the domain (counted, a real vendor would bounce or retry them).
+FIFO sends in arrival order: the small domains wait for the whole campaign and most of the campaign is deferred.
+The scheduler interleaves the domains and paces gmail.com to its rate, the other domains use the rest.
+Time is virtual: the clock only moves when an email is sent or the scheduler waits for a paced domain.
+
+Full run: python -m tests.benchmarks.test_bench_domain_scheduler
+"""
+
+from statistics import quantiles
+from unittest.mock import patch
+
+import pytest
+
+from email_throttle.core.middlewares.default.rate_limit_engines import TokenBucketEngine
+from email_throttle.core.scheduling import DomainScheduler
+from tests.benchmarks.report import print_results
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def arrivals(campaign: int, small: int) -> list[str]:
+    return ["gmail.com"] * campaign + [f"shop-{n}.example.com" for n in range(small)]
+
+
+def send_fifo(domains: list[str], clock: VirtualClock, send_rate: float):
+    for domain in domains:
+        yield domain
+        clock.now += 1 / send_rate
+
+
+def send_scheduled(domains: list[str], clock: VirtualClock, send_rate: float, domain_rate: float):
+    scheduler = DomainScheduler(rate=send_rate, burst=int(send_rate), limits={"gmail.com": (domain_rate, 1)})
+    for domain in domains:
+        scheduler.push(domain, domain)
+    while len(scheduler):
+        domain = scheduler.pop()
+        if domain is None:
+            # a wait shorter than the clock resolution would leave the bucket a rounding error short forever
+            clock.now += max(scheduler.wait_time(), 1e-9)
+            continue
+        yield domain
+        clock.now += 1 / send_rate
+
+
+def measure(send, clock: VirtualClock, domain_rate: float) -> dict[str, float]:
+    accepted = TokenBucketEngine(1, 1 / domain_rate)
+    small_latencies, deferred = [], 0
+    for domain in send:
+        if domain != "gmail.com":
+            small_latencies.append(clock.now)
+        elif not accepted.try_acquire():
+            deferred += 1
+    percentiles = quantiles(small_latencies, n=100)
+    p50, p99 = percentiles[49], percentiles[98]
+    return {"small domains p50 s": p50, "small domains p99 s": p99, "deferred": deferred, "total s": clock.now}
+
+
+def run_benchmark(campaign: int, small: int, send_rate: float, domain_rate: float) -> dict[str, dict[str, float]]:
+    domains = arrivals(campaign, small)
+    results = {}
+    for name in ("fifo", "scheduler"):
+        clock = VirtualClock()
+        with patch("time.monotonic", clock):
+            if name == "fifo":
+                send = send_fifo(domains, clock, send_rate)
+            else:
+                send = send_scheduled(domains, clock, send_rate, domain_rate)
+            results[name] = measure(send, clock, domain_rate)
+    return results
+
+
+@pytest.mark.benchmark
+def test_domain_scheduler():
+    results = run_benchmark(campaign=2_000, small=100, send_rate=200, domain_rate=50)
+    print_results(results)
+
+    fifo, scheduler = results["fifo"], results["scheduler"]
+    # the small domains no longer wait for the campaign
+    assert scheduler["small domains p99 s"] * 10 < fifo["small domains p50 s"]
+    # gmail.com is never sent over its rate
+    assert scheduler["deferred"] == 0
+    assert fifo["deferred"] > 1_000
+
+
+if __name__ == "__main__":
+    print_results(run_benchmark(campaign=100_000, small=1_000, send_rate=200, domain_rate=50))
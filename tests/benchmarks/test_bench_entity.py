@@ -0,0 +1,124 @@
+"""
+Decode + construct cost of an `EmailMessage` from a queue body, and resident memory of queued entities.
+
+Compares the previous path (JSON -> `EmailDto` pydantic model -> `EmailMessage` field by field, with a `__dict__`
+per instance) against validating the body straight into the slotted entity dataclass. Memory is measured with
+tracemalloc for `count` messages and reported per 1M messages.
+
+Full run: python -m tests.benchmarks.test_bench_entity
+"""
+
+import json
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import pytest
+from pydantic import BaseModel
+from pydantic_core import from_json
+
+from email_throttle.infra.rabbit.serializers import decode_email_message
+from tests.benchmarks.report import print_table
+
+BODY = json.dumps(
+    {
+        "subject": "Welcome",
+        "body": "Hello, this is a test email",
+        "to": ["to@example.com"],
+        "from_email": "from@example.com",
+    }
+).encode()
+
+
+class EmailDto(BaseModel):
+    """The previous intermediate model of the queue body."""
+
+    subject: str
+    body: str
+    to: list[str]
+    from_email: str
+
+
+class DictEmailMessage:
+    """The previous entity: a plain class, with a `__dict__` per instance."""
+
+    def __init__(
+        self,
+        subject: str,
+        body: str,
+        to: list[str],
+        from_email: str,
+        cc: Optional[list[str]] = None,
+        bcc: Optional[list[str]] = None,
+        attachments: Optional[list[str]] = None,
+        is_html: bool = False,
+        links: Optional[list[str]] = None,
+        idempotency_key: Optional[str] = None,
+    ):
+        self.subject = subject
+        self.body = body
+        self.to = to
+        self.from_email = from_email
+        self.cc = cc or []
+        self.bcc = bcc or []
+        self.attachments = attachments or []
+        self.is_html = is_html
+        self.links = links or []
+        self.idempotency_key = idempotency_key
+
+
+def decode_through_dto(body: bytes) -> DictEmailMessage:
+    dto = EmailDto.model_validate(from_json(body))
+    return DictEmailMessage(to=dto.to, subject=dto.subject, body=dto.body, from_email=dto.from_email)
+
+
+DECODERS: dict[str, Callable[[bytes], object]] = {
+    "dto + dict entity": decode_through_dto,
+    "direct + slots": decode_email_message,
+}
+
+
+def microseconds_per_decode(decode: Callable[[bytes], object], count: int, repeat: int = 3) -> float:
+    """Best of `repeat` runs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            decode(BODY)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / count * 1e6
+
+
+def megabytes_per_million(decode: Callable[[bytes], object], count: int) -> float:
+    """Memory held by `count` decoded messages (queued in a list), scaled to 1M messages."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    queued = [decode(BODY) for _ in range(count)]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del queued
+    return held / count * 1_000_000 / 2**20
+
+
+def run_benchmark(count: int) -> dict[str, tuple[float, float]]:
+    return {
+        name: (microseconds_per_decode(decode, count), megabytes_per_million(decode, count))
+        for name, decode in DECODERS.items()
+    }
+
+
+def print_report(results: dict[str, tuple[float, float]]):
+    print_table(["decode path", "us/message", "MB per 1M"], [(name, *values) for name, values in results.items()])
+
+
+@pytest.mark.benchmark
+def test_direct_decode_into_slotted_entity():
+    results = run_benchmark(count=10_000)
+    print_report(results)
+
+    # memory is deterministic, timings are only reported
+    assert results["direct + slots"][1] < results["dto + dict entity"][1]
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(count=1_000_000))
@@ -0,0 +1,101 @@
+"""
+Failover throughput during a full outage: every vendor has its circuit breaker open.
+
+Compares the admission pre-check (the service returns a `Rejected` sentinel and the failover skips it,
+both with sampled logs) against running the pipeline until the open breaker raises, logged on every message
+(the previous implementation). Logs go to a sink that discards them, so formatting is paid but not the terminal.
+
+Full run: python -m tests.benchmarks.test_bench_outage
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from loguru import logger
+
+from email_throttle.core.entity import EmailMessage
+from email_throttle.core.failover import EmailFailover
+from email_throttle.core.middlewares.default.circuit_breaker import CircuitBreaker
+from email_throttle.core.middlewares.default.retry import ConstantBackoff, Retry
+from email_throttle.core.service import EmailService
+from email_throttle.vendors.noop import NoOpEmailSender
+from tests.benchmarks.report import print_table
+
+VENDORS = 3
+
+
+class UncheckedEmailService(EmailService):
+    """Previous behaviour: the pipeline always runs, an open breaker raises."""
+
+    def _rejected(self):
+        return None
+
+
+class UncheckedEmailFailover(EmailFailover):
+    """Previous behaviour: every service is tried."""
+
+    def _routed(self):
+        return enumerate(self.services)
+
+
+@contextmanager
+def logs_discarded():
+    logger.remove()
+    logger.add(lambda _: None)
+    try:
+        yield
+    finally:
+        logger.remove()
+        logger.add(sys.stderr)
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=3600)
+    breaker.record_failure()
+    breaker.last_failure_time = datetime.now()
+    return breaker
+
+
+def messages_per_second(service_class, failover_class, messages: int, repeat: int = 3) -> float:
+    """Best of `repeat` runs."""
+    services = [
+        service_class(NoOpEmailSender(f"vendor{i}"), [Retry(3, ConstantBackoff(0)), open_breaker()])
+        for i in range(VENDORS)
+    ]
+    send_email = failover_class(services).send_email
+    message = EmailMessage(subject="subject", body="body", to=["to@example.com"], from_email="from@example.com")
+
+    timings = []
+    with logs_discarded():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(messages):
+                send_email(message)
+            timings.append(time.perf_counter() - start)
+    return messages / min(timings)
+
+
+def run_benchmark(messages: int) -> dict[str, float]:
+    return {
+        "raise and log": messages_per_second(UncheckedEmailService, UncheckedEmailFailover, messages),
+        "pre-check": messages_per_second(EmailService, EmailFailover, messages),
+    }
+
+
+def print_report(results: dict[str, float]):
+    print_table(["outage path", "messages/s"], results.items())
+
+
+@pytest.mark.benchmark
+def test_outage_rejections_are_cheap():
+    results = run_benchmark(messages=300)
+    print_report(results)
+
+    assert results["pre-check"] > results["raise and log"]
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(messages=5_000))
@@ -0,0 +1,92 @@
+"""
+Transactional emails during a bulk campaign: time to send with a single queue vs the priority lanes.
+
+A bulk backlog of `backlog` simulator emails is queued, then transactional emails arrive every
+1 / `transactional_rate` seconds while it drains. The consumer sends `send_rate` emails per second through the
+simulator failover (NoOp vendors). With a single queue, a transactional email waits for every bulk email queued
+before it. With the lanes (transactional 4, bulk 1), it waits at most for the transactional emails ahead of it:
+its p99 stays flat however large the backlog, and the backlog still drains at the rate left by them.
+Time is virtual: the clock moves 1 / `send_rate` per email sent.
+
+Full run: python -m tests.benchmarks.test_bench_priority_lanes
+"""
+
+import dataclasses
+from statistics import quantiles
+
+import pytest
+from loguru import logger
+
+from email_throttle.cli.simulator import generate_emails
+from email_throttle.core.entity import Priority
+from email_throttle.core.failover import EmailFailover
+from email_throttle.core.scheduling import FifoScheduler, PriorityLanes
+from email_throttle.infra.services import create_services
+from tests.benchmarks.report import print_results
+
+WEIGHTS = {Priority.TRANSACTIONAL: 4, Priority.BULK: 1}
+
+
+def arrivals(backlog: int, transactional: int, transactional_rate: float):
+    """(arrival time, email) in arrival order: the campaign at once, then the transactional emails."""
+    emails = [(0.0, email) for email in generate_emails(backlog)]
+    for n, email in enumerate(generate_emails(transactional)):
+        emails.append((n / transactional_rate, dataclasses.replace(email, priority=Priority.TRANSACTIONAL)))
+    emails.sort(key=lambda arrival: arrival[0])
+    return emails
+
+
+def drain(scheduler, emails: list, send_rate: float) -> dict[str, float]:
+    failover = EmailFailover(create_services([{"name": name} for name in ("v1", "v2")]))
+    waits, now, position = [], 0.0, 0
+    while position < len(emails) or len(scheduler):
+        while position < len(emails) and emails[position][0] <= now:
+            arrived_at, email = emails[position]
+            if isinstance(scheduler, PriorityLanes):
+                scheduler.push(email.priority, "", (arrived_at, email))
+            else:
+                scheduler.push("", (arrived_at, email))
+            position += 1
+        scheduled = scheduler.pop()
+        if scheduled is None:
+            now = emails[position][0]
+            continue
+        arrived_at, email = scheduled
+        failover.send_email(email)
+        if email.priority == Priority.TRANSACTIONAL:
+            waits.append(now - arrived_at)
+        now += 1 / send_rate
+    percentiles = quantiles(waits, n=100)
+    p50, p99 = percentiles[49], percentiles[98]
+    return {"transactional p50 s": p50, "transactional p99 s": p99, "drained s": now}
+
+
+def run_benchmark(backlogs: list[int], transactional_rate: float, send_rate: float) -> dict[str, dict[str, float]]:
+    results = {}
+    logger.disable("email_throttle")
+    try:
+        for backlog in backlogs:
+            # transactional emails keep arriving while the single queue drains
+            emails = arrivals(backlog, int(backlog / send_rate * transactional_rate), transactional_rate)
+            results[f"single queue {backlog}"] = drain(FifoScheduler(), emails, send_rate)
+            results[f"lanes {backlog}"] = drain(PriorityLanes(WEIGHTS), emails, send_rate)
+    finally:
+        logger.enable("email_throttle")
+    return results
+
+
+@pytest.mark.benchmark
+def test_priority_lanes():
+    results = run_benchmark(backlogs=[2_000, 8_000], transactional_rate=20, send_rate=200)
+    print_results(results)
+
+    # the transactional p99 doesn't grow with the backlog
+    assert results["lanes 8000"]["transactional p99 s"] < 0.1
+    assert results["lanes 8000"]["transactional p99 s"] <= results["lanes 2000"]["transactional p99 s"] * 2
+    assert results["single queue 8000"]["transactional p99 s"] > 10
+    # the campaign still drains at the same pace
+    assert results["lanes 8000"]["drained s"] == pytest.approx(results["single queue 8000"]["drained s"], rel=0.01)
+
+
+if __name__ == "__main__":
+    print_results(run_benchmark(backlogs=[10_000, 100_000, 1_000_000], transactional_rate=20, send_rate=200))
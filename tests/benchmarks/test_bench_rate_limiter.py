@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of the rate limiter engines.
+
+Measures admission decisions per second (`allow_request` calls) at different limits.
+The window is long enough for every call to be admitted, so the engines have to keep all the permits.
+
+Full run: python -m tests.benchmarks.test_bench_rate_limiter
+"""
+
+import time
+
+import pytest
+
+from email_throttle.core.middlewares.default.rate_limiter import (
+    GCRARateLimiter,
+    RateLimiter,
+    TokenBucketRateLimiter,
+)
+from tests.benchmarks.report import print_table
+
+LIMITERS = [RateLimiter, TokenBucketRateLimiter, GCRARateLimiter]
+LIMITS = [10, 1_000, 100_000]
+
+
+def admits_per_second(limiter_class, limit: int, calls: int, repeat: int = 3) -> float:
+    """Best of `repeat` runs, each one with a new limiter."""
+    timings = []
+    for _ in range(repeat):
+        allow_request = limiter_class(max_requests=limit, per_second=3600).allow_request
+        start = time.perf_counter()
+        for _ in range(calls):
+            allow_request()
+        timings.append(time.perf_counter() - start)
+    return calls / min(timings)
+
+
+def run_benchmark(calls: int) -> dict[tuple[str, int], float]:
+    return {
+        (limiter_class.__name__, limit): admits_per_second(limiter_class, limit, calls)
+        for limiter_class in LIMITERS
+        for limit in LIMITS
+    }
+
+
+def print_report(results: dict[tuple[str, int], float]):
+    print_table(["limiter", "limit", "decisions/s"], [(*case, ops) for case, ops in results.items()])
+
+
+@pytest.mark.benchmark
+def test_admission_cost_does_not_grow_with_the_limit():
+    results = run_benchmark(calls=20_000)
+    print_report(results)
+
+    for limiter_class in LIMITERS:
+        name = limiter_class.__name__
+        # constant time engines, generous margin for noisy machines
+        assert results[(name, 100_000)] > results[(name, 10)] * 0.2
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(calls=200_000))
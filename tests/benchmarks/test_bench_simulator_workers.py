@@ -0,0 +1,63 @@
+"""
+Scaling of the `simulate` command with its workers: emails per second sent with 1, 2, 4... processes.
+
+`count` emails are sent through three NoOp vendors with retries and circuit breakers (no rate limiter, which
+would cap the throughput whatever the workers). Each run spawns its workers, their startup is part of the time.
+The per email debug logs are silenced (LOGURU_LEVEL for the workers), otherwise writing them dominates.
+The speedup only holds up to the cores of the machine: on a single core every run is as fast as the serial one.
+
+Full run: python -m tests.benchmarks.test_bench_simulator_workers
+"""
+
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from loguru import logger
+
+from email_throttle.cli.simulator import run_simulation
+from tests.benchmarks.report import print_results
+
+VENDORS = [
+    {
+        "name": name,
+        "middlewares": ["retry", "cb"],
+        "retry": {"retries": 2},
+        "circuit_breaker": {"threshold": 5, "reset_timeout": 10},
+    }
+    for name in ("v1", "v2", "v3")
+]
+
+
+def run_benchmark(count: int, workers: list[int]) -> dict[int, dict[str, float]]:
+    results = {}
+    logger.disable("email_throttle")
+    try:
+        with patch.dict(os.environ, {"LOGURU_LEVEL": "WARNING"}):
+            for size in workers:
+                start = time.perf_counter()
+                report = run_simulation(VENDORS, count, workers=size)
+                elapsed = time.perf_counter() - start
+                results[size] = {"emails/s": count / elapsed, "errors": report.errors}
+    finally:
+        logger.enable("email_throttle")
+    serial = results[workers[0]]["emails/s"]
+    for values in results.values():
+        values["speedup"] = values["emails/s"] / serial
+    return results
+
+
+@pytest.mark.benchmark
+def test_simulator_workers():
+    cores = os.process_cpu_count() or 1
+    results = run_benchmark(count=100_000, workers=[1, 2])
+    print_results(results, "workers")
+
+    assert all(values["errors"] == 0 for values in results.values())
+    if cores >= 2:
+        assert results[2]["speedup"] > 1.4
+
+
+if __name__ == "__main__":
+    print_results(run_benchmark(count=2_000_000, workers=[1, 2, 4, 8]), "workers")
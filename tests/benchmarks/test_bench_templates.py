@@ -0,0 +1,82 @@
+"""
+Campaign of one template for many recipients: bytes sent to the API and queued, rendered emails vs templated ones.
+
+The rendered campaign posts (and queues) every email with its subject and body, the templated one registers
+the template once and posts (and queues) only the recipients with their variables. Rendering is measured
+on the consumer side, with the compiled template cache warm.
+
+Full run: python -m tests.benchmarks.test_bench_templates
+"""
+
+import dataclasses
+import json
+import time
+
+import pytest
+
+from email_throttle.core.entity import EmailTemplate, TemplatedEmail
+from email_throttle.core.templates import CompiledTemplate, TemplateRenderer
+from email_throttle.infra.rabbit.serializers import WireFormat
+from tests.benchmarks.report import print_table
+
+TEMPLATE = EmailTemplate(
+    subject="$name, your order $order has shipped",
+    body="<html><body><p>Hi $name,</p>"
+    + "<p>Your order $order is on its way, track it in your account. Thanks for shopping with us.</p>" * 30
+    + "</body></html>",
+    from_email="shop@example.com",
+    is_html=True,
+)
+TEMPLATE_ID = "0" * 64
+
+
+def recipients(count: int) -> list[TemplatedEmail]:
+    return [
+        TemplatedEmail(TEMPLATE_ID, [f"customer-{n}@example.com"], {"name": f"Customer {n}", "order": f"#{n:08}"})
+        for n in range(count)
+    ]
+
+
+def run_benchmark(count: int) -> dict[str, float]:
+    templated = recipients(count)
+    compiled = CompiledTemplate(TEMPLATE)
+    rendered = [compiled.render(email) for email in templated]
+    wire_format = WireFormat()
+
+    # request bodies of /email/bulk, and of /email/templates plus /email/templates/{id}/bulk
+    ingress_rendered = len(b"[" + b",".join(wire_format.codec.encode(email) for email in rendered) + b"]")
+    ingress_templated = len(json.dumps(dataclasses.asdict(TEMPLATE))) + len(
+        json.dumps([{"to": email.to, "variables": email.variables} for email in templated])
+    )
+    renderer = TemplateRenderer(lambda _: TEMPLATE)
+    renderer.render(templated[0])
+    start = time.perf_counter()
+    for email in templated:
+        renderer.render(email)
+    render_us = (time.perf_counter() - start) / count * 1e6
+
+    return {
+        "ingress rendered (KB)": ingress_rendered / 1024,
+        "ingress templated (KB)": ingress_templated / 1024,
+        "queued rendered (KB)": sum(len(wire_format.encode(email)[0]) for email in rendered) / 1024,
+        "queued templated (KB)": sum(len(wire_format.encode(email)[0]) for email in templated) / 1024,
+        "render us/message": render_us,
+    }
+
+
+def print_report(results: dict[str, float]):
+    print_table(["measure", "value"], results.items())
+
+
+@pytest.mark.benchmark
+def test_templated_campaign():
+    results = run_benchmark(count=1_000)
+    print_report(results)
+
+    # an order of magnitude less to post and to queue
+    assert results["ingress templated (KB)"] * 10 < results["ingress rendered (KB)"]
+    assert results["queued templated (KB)"] * 10 < results["queued rendered (KB)"]
+
+
+if __name__ == "__main__":
+    print_report(run_benchmark(count=100_000))
@@ -0,0 +1,116 @@
+"""
+Throughput cost of each durability level: transient, durable (persistent messages) and quorum queues.
+
+For each level, `count` emails are published in transactions of `batch_size` (as the producer does), then consumed
+with a prefetch of `prefetch` and acked one by one (as the consumer does), on a queue of its own that is deleted
+afterwards: the queues of the application are not touched. Needs a RabbitMQ broker (RABBITMQ_HOST and the other
+connection variables), skipped without one. Results depend on the disks and the cluster: use it to choose the
+level of each priority lane on the target deployment.
+
+Full run: python -m tests.benchmarks.test_bench_topology
+"""
+
+import itertools
+import time
+
+import pika
+import pytest
+
+from email_throttle.core.entity import EmailMessage
+from email_throttle.infra.rabbit.handlers import create_connection
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import QUEUE_TYPES, Topology
+from tests.benchmarks.report import print_results
+
+EMAIL = EmailMessage(
+    subject="Your order has shipped",
+    body="<p>Your order is on its way.</p>" * 20,
+    to=["customer@example.com"],
+    from_email="shop@example.com",
+)
+
+
+def connect() -> pika.BlockingConnection | None:
+    try:
+        return create_connection()
+    except pika.exceptions.AMQPError:
+        return None
+
+
+def publish(connection: pika.BlockingConnection, topology: Topology, queue: str, count: int, batch_size: int):
+    channel = connection.channel()
+    channel.tx_select()
+    body, properties = WireFormat().encode(EMAIL)
+    properties = topology.persist(properties)
+    for batch in itertools.batched(range(count), batch_size):
+        for _ in batch:
+            channel.basic_publish(exchange="", routing_key=queue, body=body, properties=properties)
+        channel.tx_commit()
+    channel.close()
+
+
+def consume(connection: pika.BlockingConnection, queue: str, count: int, prefetch: int) -> int:
+    channel = connection.channel()
+    channel.basic_qos(prefetch_count=prefetch)
+    received = 0
+    for method, _, _ in channel.consume(queue, inactivity_timeout=5):
+        if method is None:
+            break
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        received += 1
+        if received == count:
+            break
+    channel.cancel()
+    channel.close()
+    return received
+
+
+def run_benchmark(
+    connection: pika.BlockingConnection, count: int, batch_size: int = 500, prefetch: int = 64
+) -> dict[str, dict[str, float]]:
+    results = {}
+    for queue_type in QUEUE_TYPES:
+        topology = Topology(queue_type)
+        queue = f"bench.topology.{queue_type}"
+        channel = connection.channel()
+        channel.queue_delete(queue=queue)
+        topology.declare_queue(channel, queue)
+        try:
+            start = time.perf_counter()
+            publish(connection, topology, queue, count, batch_size)
+            published = time.perf_counter()
+            received = consume(connection, queue, count, prefetch)
+            consumed = time.perf_counter()
+        finally:
+            channel.queue_delete(queue=queue)
+            channel.close()
+        results[queue_type] = {
+            "publish msg/s": count / (published - start),
+            "consume msg/s": received / (consumed - published),
+            "received": received,
+        }
+    return results
+
+
+@pytest.mark.benchmark
+def test_topology_durability():
+    connection = connect()
+    if connection is None:
+        pytest.skip("Needs a RabbitMQ broker")
+    try:
+        results = run_benchmark(connection, count=5_000)
+    finally:
+        connection.close()
+    print_results(results, "queue type")
+
+    assert all(values["received"] == 5_000 for values in results.values())
+
+
+if __name__ == "__main__":
+    broker = connect()
+    if broker is None:
+        raise SystemExit("Needs a RabbitMQ broker, see RABBITMQ_HOST")
+    try:
+        print_results(run_benchmark(broker, count=100_000), "queue type")
+    finally:
+        broker.close()
@@ -0,0 +1,153 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from email_throttle.api.core.app import create_api
+from email_throttle.api.endpoints.emails.dependencies import async_email_failover_with_state, rabbit_producer
+from email_throttle.core.entity import Priority, TemplatedEmail
+
+VENDORS = json.dumps(
+    [
+        {"name": name, "middlewares": ["rl"], "rate_limiter": {"max_attempts": 1, "per_seconds": 60}}
+        for name in ("v1", "v2")
+    ]
+)
+EMAIL = {"subject": "test", "body": "test", "to": ["to@example.com"], "from_email": "from@example.com"}
+
+
+class TestEmailsRouter:
+
+    def test_send_email_awaits_the_failover(self):
+        api = create_api()
+        failover = AsyncMock()
+        failover.send_email.return_value = True
+        api.dependency_overrides[async_email_failover_with_state] = lambda: failover
+
+        response = TestClient(api).post("/email/", json=EMAIL)
+
+        assert response.status_code == 200
+        assert response.json() is True
+        message = failover.send_email.await_args.args[0]
+        assert message.to == EMAIL["to"]
+        assert message.subject == EMAIL["subject"]
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    def test_send_email_with_default_vendors(self):
+        with TestClient(create_api()) as client:
+            response = client.post("/email/", json=EMAIL)
+
+        assert response.status_code == 200
+        assert response.json() is True
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    @patch.dict("os.environ", {"EMAIL_THROTTLE_VENDORS": VENDORS})
+    def test_vendor_state_persists_between_requests(self):
+        api = create_api()
+
+        with TestClient(api, raise_server_exceptions=False) as client:
+            responses = [client.post("/email/", json=EMAIL).status_code for _ in range(3)]
+            services = api.state.vendors.services
+
+        # one permit per vendor for the whole application, not per request
+        assert responses == [200, 200, 500]
+        assert [s.name for s in services] == ["v1", "v2"]
+
+    def test_send_email_bulk_returns_accepted_and_rejected(self):
+        api = create_api()
+        producer = MagicMock()
+        producer.send_many.return_value = (2, 1)
+        api.dependency_overrides[rabbit_producer] = lambda: producer
+
+        response = TestClient(api).post("/email/bulk", json=[EMAIL] * 3)
+
+        assert response.status_code == 200
+        assert response.json() == {"accepted": 2, "rejected": 1}
+        assert len(producer.send_many.call_args.args[0]) == 3
+
+    def test_send_email_bulk_keeps_the_priority_of_each_email(self):
+        api = create_api()
+        producer = MagicMock()
+        producer.send_many.return_value = (2, 0)
+        api.dependency_overrides[rabbit_producer] = lambda: producer
+
+        TestClient(api).post("/email/bulk", json=[{**EMAIL, "priority": "transactional"}, EMAIL])
+
+        queued = producer.send_many.call_args.args[0]
+        assert [email.priority for email in queued] == [Priority.TRANSACTIONAL, Priority.BULK]
+
+    def test_bulk_producers_come_from_the_application_pool(self):
+        api = create_api()
+        pool = MagicMock()
+        producer = pool.acquire.return_value.__enter__.return_value
+        producer.send_many.return_value = (1, 0)
+
+        with patch("email_throttle.api.core.app.rabbit_producer_pool", return_value=pool):
+            with TestClient(api) as client:
+                client.post("/email/bulk", json=[EMAIL])
+                client.post("/email/bulk", json=[EMAIL])
+
+        pool.start.assert_called_once()
+        assert pool.acquire.call_count == 2
+        assert producer.send_many.call_count == 2
+        pool.close.assert_called_once()
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    def test_templated_bulk_queues_the_recipients_only(self, tmp_path):
+        api = create_api()
+        queued = []
+
+        def send_many(emails):
+            queued.extend(emails)
+            return len(queued), 0
+
+        producer = MagicMock()
+        producer.send_many.side_effect = send_many
+        api.dependency_overrides[rabbit_producer] = lambda: producer
+        template = {"subject": "Hi $name", "body": "Hello $name", "from_email": "from@example.com"}
+        recipients = [{"to": [f"{n}@example.com"], "variables": {"name": str(n)}} for n in range(3)]
+
+        with patch.dict("os.environ", {"EMAIL_THROTTLE_BLOB_DIR": str(tmp_path)}), TestClient(api) as client:
+            template_id = client.post("/email/templates", json=template).json()["template_id"]
+            response = client.post(f"/email/templates/{template_id}/bulk", json=recipients)
+            missing = client.post(f"/email/templates/{'0' * 64}/bulk", json=recipients)
+
+        assert response.json() == {"accepted": 3, "rejected": 0}
+        assert queued[0] == TemplatedEmail(template_id, ["0@example.com"], {"name": "0"})
+        assert missing.status_code == 404
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    def test_templates_need_a_blob_store(self):
+        with patch.dict("os.environ", {"EMAIL_THROTTLE_BLOB_DIR": ""}), TestClient(create_api()) as client:
+            response = client.post("/email/templates", json={"subject": "s", "body": "b", "from_email": "f"})
+
+        assert response.status_code == 503
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    def test_invalid_templates_are_rejected(self, tmp_path):
+        with patch.dict("os.environ", {"EMAIL_THROTTLE_BLOB_DIR": str(tmp_path)}), TestClient(create_api()) as client:
+            response = client.post("/email/templates", json={"subject": "Hi $", "body": "b", "from_email": "f"})
+
+        assert response.status_code == 422
+        assert "Invalid placeholder" in response.json()["detail"]
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    def test_send_email_drops_client_retries(self):
+        api = create_api()
+        failover = AsyncMock()
+        failover.send_email.return_value = True
+        api.dependency_overrides[async_email_failover_with_state] = lambda: failover
+
+        with TestClient(api) as client:
+            responses = [client.post("/email/", json={**EMAIL, "idempotency_key": "key"}).json() for _ in range(2)]
+            stats = client.get("/email/idempotency").json()
+
+        assert responses == [True, True]
+        failover.send_email.assert_awaited_once()
+        assert stats["duplicates"] == 1
+
+    @patch("email_throttle.api.core.app.rabbit_producer_pool", MagicMock())
+    @patch.dict("os.environ", {"EMAIL_THROTTLE_DEDUP_WINDOW": "0"})
+    def test_idempotency_index_can_be_disabled(self):
+        with TestClient(create_api()) as client:
+            assert client.get("/email/idempotency").status_code == 404
@@ -1,12 +1,25 @@
+import dataclasses
 from unittest.mock import MagicMock, patch
 
-from email_throttle.api.endpoints.emails.dtos import EmailDto
+import pytest
+
 from email_throttle.cli.consumer import (
     consumer_command,
+    create_scheduler,
     create_services,
     factory_handler_message,
+    parse_domain_limits,
+    parse_lane_weights,
     send_emails,
 )
+from email_throttle.core.dedup import IdempotencyIndex
+from email_throttle.core.entity import EmailMessage, EmailTemplate, Priority, TemplatedEmail
+from email_throttle.core.exceptions import PoisonMessage
+from email_throttle.core.scheduling import DomainScheduler, FifoScheduler, PriorityLanes
+from email_throttle.core.templates import TemplateRenderer
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+from email_throttle.infra.blobs.store import FileBlobStore
+from email_throttle.infra.rabbit.topology import Topology
 
 
 class TestConsumer:
@@ -26,17 +39,177 @@ class TestConsumer:
         mock_create_consumer.assert_called_once()
         assert result == mock_consumer
 
+    @patch("email_throttle.cli.consumer.create_consumer")
+    @patch("email_throttle.cli.consumer.create_services_from_config")
+    def test_create_services_with_concurrency(self, mock_create_services_from_config, mock_create_consumer):
+        mock_create_services_from_config.return_value = [MagicMock()]
+
+        create_services(concurrency=8)
+        assert mock_create_consumer.call_args.kwargs["concurrency"] == 8
+        # prefetch defaults to the concurrency
+        assert mock_create_consumer.call_args.kwargs["prefetch"] == 8
+
+        create_services(prefetch=32, concurrency=8)
+        assert mock_create_consumer.call_args.kwargs["prefetch"] == 32
+
+    @patch("email_throttle.cli.consumer.create_consumer")
+    @patch("email_throttle.cli.consumer.create_services_from_config")
+    def test_create_services_only_waits_for_the_rate_limiter_in_the_workers(
+        self, mock_create_services_from_config, mock_create_consumer
+    ):
+        mock_create_services_from_config.return_value = [MagicMock()]
+
+        create_services()
+        assert "max_wait" not in mock_create_services_from_config.call_args.args[0][0]["rate_limiter"]
+
+        create_services(concurrency=8)
+        assert mock_create_services_from_config.call_args.args[0][0]["rate_limiter"]["max_wait"] == 5
+
+        create_services(scheduler=create_scheduler(10, None, []))
+        assert mock_create_services_from_config.call_args.args[0][0]["rate_limiter"]["max_wait"] == 5
+
+    @patch("email_throttle.cli.consumer.create_consumer")
+    @patch("email_throttle.cli.consumer.create_services_from_config")
+    def test_create_services_retries_through_the_broker(self, mock_create_services_from_config, mock_create_consumer):
+        mock_create_services_from_config.return_value = [MagicMock()]
+
+        create_services(retry_delays=[2, 10], max_attempts=3)
+
+        assert "retry" not in mock_create_services_from_config.call_args.args[0][0]["middlewares"]
+        assert mock_create_consumer.call_args.kwargs["retry_delays"] == [2, 10]
+        assert mock_create_consumer.call_args.kwargs["max_attempts"] == 3
+
+    @patch("email_throttle.cli.consumer.create_consumer")
+    @patch("email_throttle.cli.consumer.create_services_from_config")
+    def test_create_services_with_a_durability_and_failure_policy(
+        self, mock_create_services_from_config, mock_create_consumer
+    ):
+        mock_create_services_from_config.return_value = [MagicMock()]
+
+        create_services(failure_policy="requeue", queue_type="quorum", delivery_limit=10)
+
+        assert mock_create_consumer.call_args.kwargs["failure_policy"] == "requeue"
+        assert mock_create_consumer.call_args.kwargs["topology"] == Topology("quorum", 10)
+
+    @patch("email_throttle.cli.consumer.create_consumer")
+    @patch("email_throttle.cli.consumer.create_services_from_config")
+    def test_create_services_with_a_scheduler(self, mock_create_services_from_config, mock_create_consumer):
+        mock_create_services_from_config.return_value = [MagicMock()]
+        scheduler = create_scheduler(10, None, [])
+
+        create_services(concurrency=4, scheduler=scheduler)
+
+        assert mock_create_consumer.call_args.kwargs["scheduler"] is scheduler
+        # more messages at hand than workers, to interleave the domains
+        assert mock_create_consumer.call_args.kwargs["prefetch"] == 32
+
+    def test_parse_domain_limits(self):
+        assert parse_domain_limits(["gmail.com=50:100", "Outlook.com=20"]) == {
+            "gmail.com": (50.0, 100),
+            "outlook.com": (20.0, 20),
+        }
+
+    def test_create_scheduler(self):
+        assert create_scheduler(None, None, []) is None
+
+        scheduler = create_scheduler(10, 20, ["gmail.com=50"])
+        assert (scheduler.rate, scheduler.burst) == (10, 20)
+        assert scheduler.limits == {"gmail.com": (50.0, 50)}
+
+    def test_create_scheduler_with_priority_lanes(self):
+        assert parse_lane_weights(["transactional=4", "Bulk=1"]) == {Priority.TRANSACTIONAL: 4, Priority.BULK: 1}
+
+        lanes = create_scheduler(None, None, [], ["transactional=4", "bulk=1"])
+        assert isinstance(lanes, PriorityLanes)
+        assert isinstance(lanes.lanes[Priority.BULK].scheduler, FifoScheduler)
+
+        # each lane paces its own domains
+        lanes = create_scheduler(10, None, [], ["transactional=4", "bulk=1"])
+        assert isinstance(lanes.lanes[Priority.TRANSACTIONAL].scheduler, DomainScheduler)
+
+    def test_factory_handler_message_raises_when_not_sent(self):
+        mock_failover = MagicMock()
+        mock_failover.send_email.return_value = False
+        mock_msg = EmailMessage(subject="test", body="test", to=["<EMAIL>"], from_email="<EMAIL>")
+
+        with pytest.raises(Exception, match="could not be sent"):
+            factory_handler_message(mock_failover)(mock_msg)
+
     def test_factory_handler_message(self):
         mock_failover = MagicMock()
-        mock_msg = EmailDto(subject="test", body="test", to=["<EMAIL>"], from_email="<EMAIL>")
+        mock_msg = EmailMessage(subject="test", body="test", to=["<EMAIL>"], from_email="<EMAIL>")
         handler = factory_handler_message(mock_failover)
 
         with patch("email_throttle.cli.consumer.logger") as mock_logger:
             handler(mock_msg)
 
-            mock_failover.send_email.assert_called_once()
+            # the decoded entity is sent as is
+            mock_failover.send_email.assert_called_once_with(mock_msg)
             mock_logger.info.assert_called()
 
+    def test_factory_handler_message_reads_the_offloaded_body(self, tmp_path):
+        mock_failover = MagicMock()
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=10)
+        msg = EmailMessage(subject="test", body="a long body", to=["<EMAIL>"], from_email="<EMAIL>")
+
+        factory_handler_message(mock_failover, claim_check)(claim_check.check_in(msg))
+
+        mock_failover.send_email.assert_called_once_with(msg)
+
+    @pytest.mark.parametrize("offloaded", ["body", "attachments"])
+    def test_factory_handler_message_without_the_blob_store(self, tmp_path, offloaded):
+        mock_failover = MagicMock()
+        reference = FileBlobStore(str(tmp_path)).put(b"a long body")
+        msg = EmailMessage(subject="test", body="test", to=["<EMAIL>"], from_email="<EMAIL>")
+        msg = dataclasses.replace(msg, **{offloaded: reference if offloaded == "body" else (reference,)})
+
+        with pytest.raises(PoisonMessage, match="blob store of their data"):
+            factory_handler_message(mock_failover)(msg)
+
+        mock_failover.send_email.assert_not_called()
+
+    def test_factory_handler_message_renders_templated_emails(self):
+        mock_failover = MagicMock()
+        renderer = TemplateRenderer(lambda _: EmailTemplate("Hi $name", "Hello $name", "<FROM>"))
+        handler = factory_handler_message(mock_failover, renderer=renderer)
+
+        handler(TemplatedEmail("welcome", ["<EMAIL>"], {"name": "Ann"}))
+
+        mock_failover.send_email.assert_called_once_with(
+            EmailMessage(subject="Hi Ann", body="Hello Ann", to=["<EMAIL>"], from_email="<FROM>")
+        )
+
+    @pytest.mark.parametrize("variables", [{}, {"other": "Ann"}])
+    def test_factory_handler_message_templated_emails_that_cant_be_rendered_are_poison(self, variables):
+        mock_failover = MagicMock()
+        renderer = TemplateRenderer(lambda _: EmailTemplate("Hi $name", "Hello $name", "<FROM>"))
+        handler = factory_handler_message(mock_failover, renderer=renderer)
+
+        with pytest.raises(PoisonMessage, match="name"):
+            handler(TemplatedEmail("welcome", ["<EMAIL>"], variables))
+
+        mock_failover.send_email.assert_not_called()
+
+    def test_factory_handler_message_without_templates(self):
+        with pytest.raises(PoisonMessage, match="blob store of the templates"):
+            factory_handler_message(MagicMock())(TemplatedEmail("welcome", ["<EMAIL>"]))
+
+    def test_factory_handler_message_drops_duplicates(self):
+        mock_failover = MagicMock()
+        mock_failover.send_email.side_effect = [False, True]
+        index = IdempotencyIndex.create()
+        handler = factory_handler_message(mock_failover, index=index)
+        msg = EmailMessage(subject="test", body="test", to=["<EMAIL>"], from_email="<EMAIL>", idempotency_key="key")
+
+        with pytest.raises(Exception, match="could not be sent"):
+            handler(msg)
+        # a failed email is retried, once sent its redeliveries are dropped
+        handler(msg)
+        handler(msg)
+
+        assert mock_failover.send_email.call_count == 2
+        assert index.stats()["duplicates"] == 1
+
     def test_send_emails_success(self):
         mock_failover = MagicMock()
         mock_failover.send_email.return_value = True
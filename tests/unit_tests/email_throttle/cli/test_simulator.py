@@ -1,17 +1,20 @@
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 from email_throttle.cli.simulator import (
+    SimulationReport,
     command_simulate,
-    create_services,
     generate_emails,
     parse_args,
+    run_simulation,
     send_emails,
+    shard,
 )
 from email_throttle.core.entity import EmailMessage
-from email_throttle.core.middlewares.default.circuit_breaker import CircuitBreaker
-from email_throttle.core.middlewares.default.rate_limiter import RateLimiter
-from email_throttle.core.middlewares.default.retry import Retry
-from email_throttle.vendors.noop import NoOpEmailSender
+from email_throttle.core.middlewares.default.rate_limiter import GCRARateLimiter
+from email_throttle.core.middlewares.default.retry import AdaptiveBackoff
+from email_throttle.infra.services import create_services
 
 
 class TestSimulator:
@@ -40,27 +43,38 @@ class TestSimulator:
 
         assert parse_args(args) == expected_output
 
-    def test_create_services(self):
-        vendors_config = [
+    def test_parse_args_with_rate_limiter_max_wait(self):
+        args = MagicMock()
+        args.vendor_count = 1
+        args.vendors = ["vendor1"]
+        args.middlewares = ["gcra"]
+        args.rate_limiters = ["3,20,5"]
+
+        assert parse_args(args) == [
             {
                 "name": "vendor1",
-                "middlewares": ["cb", "rl"],
-                "circuit_breaker": {"threshold": 2, "reset_timeout": 10},
-                "rate_limiter": {"max_attempts": 3, "per_seconds": 20},
-            },
-            {
-                "name": "vendor2",
-                "middlewares": ["retry"],
-                "retry": {"retries": 5},
-            },
+                "middlewares": ["gcra"],
+                "rate_limiter": {"max_attempts": 3, "per_seconds": 20, "max_wait": 5.0},
+            }
         ]
 
-        services = create_services(vendors_config)
-        assert len(services) == 2
-        assert isinstance(services[0].service, NoOpEmailSender)
-        assert isinstance(services[0].middlewares[0], CircuitBreaker)
-        assert isinstance(services[0].middlewares[1], RateLimiter)
-        assert isinstance(services[1].middlewares[0], Retry)
+        services = create_services(parse_args(args))
+        limiter = services[0].middlewares[0]
+        assert isinstance(limiter, GCRARateLimiter)
+        assert limiter.wait and limiter.max_wait == 5.0
+
+    def test_parse_args_with_retry_backoff_and_budget(self):
+        args = MagicMock()
+        args.vendor_count = 1
+        args.vendors = ["vendor1"]
+        args.middlewares = ["retry"]
+        args.retries = ["3,adaptive,0.1"]
+
+        assert parse_args(args)[0]["retry"] == {"retries": 3, "backoff": "adaptive", "budget": 0.1}
+
+        retry = create_services(parse_args(args))[0].middlewares[0]
+        assert isinstance(retry.backoff, AdaptiveBackoff)
+        assert retry.budget.ratio == 0.1
 
     def test_generate_emails(self):
         emails = list(generate_emails(2))
@@ -68,19 +82,49 @@ class TestSimulator:
         assert isinstance(emails[0], EmailMessage)
         assert emails[0].subject == "Test Email 0"
         assert emails[1].subject == "Test Email 1"
+        assert emails[0].to == ["email"]
+
+    def test_generate_emails_from_start(self):
+        assert [email.subject for email in generate_emails(2, start=5)] == ["Test Email 5", "Test Email 6"]
+
+    def test_shard(self):
+        assert shard(10, 3) == [(0, 4), (4, 3), (7, 3)]
+        assert shard(10, 1) == [(0, 10)]
+        assert shard(2, 4) == [(0, 1), (1, 1)]
+
+    def test_merge_reports(self):
+        report = SimulationReport(10, 1, 2.0).merge(SimulationReport(10, 3, 4.0))
+        assert report == SimulationReport(20, 4, 4.0)
+        assert report.rate == 5.0
+        assert SimulationReport().rate == 0.0
+
+    def test_run_simulation_with_workers(self, tmp_path):
+        vendors_config = [
+            {
+                "name": "vendor1",
+                "middlewares": ["rl"],
+                "rate_limiter": {"max_attempts": 5, "per_seconds": 60},
+            },
+        ]
+
+        # each worker has a quota of its own
+        report = run_simulation(vendors_config, 20, workers=2)
+        assert (report.emails, report.errors) == (20, 10)
+
+        # the workers share the quota, as the processes of a node
+        shared = [{**config, "state_dir": str(tmp_path)} for config in vendors_config]
+        report = run_simulation(shared, 20, workers=2)
+        assert (report.emails, report.errors) == (20, 15)
 
     @patch("email_throttle.cli.simulator.EmailFailoverWithState")
     @patch("email_throttle.cli.simulator.EmailFailover")
     def test_send_emails(self, mock_failover, mock_failover_with_state):
         services = [MagicMock(), MagicMock()]
         mock_failover.return_value.send_email.return_value = True
-        mock_failover_with_state.return_value.send_email.return_value = True
+        mock_failover_with_state.return_value.send_email.side_effect = [True, False, False]
 
-        errors = send_emails(services, 2, with_state_failover=False)
-        assert len(errors) == 0
-
-        errors = send_emails(services, 2, with_state_failover=True)
-        assert len(errors) == 0
+        assert send_emails(services, 2, with_state_failover=False) == 0
+        assert send_emails(services, 3, with_state_failover=True) == 2
 
     @patch("email_throttle.cli.simulator.logger")
     @patch("email_throttle.cli.simulator.send_emails")
@@ -91,14 +135,83 @@ class TestSimulator:
         args.vendor_count = 2
         args.middlewares = ["cb,rl", "retry"]
         args.circuit_breakers = ["2,3", "0,0"]
-        args.retry = ["3", "3"]
+        args.retries = ["3", "3"]
         args.rate_limiters = ["3,10", "2"]
         args.email_count = 100
         args.with_state_failover = False
-        mock_send_emails.return_value = []
+        args.routing = "ordered"
+        args.weights = None
+        args.workers = 1
+        args.shared_vendor_state = False
+        mock_send_emails.return_value = 0
 
         command_simulate(args)
 
         mock_create_services.assert_called_once()
         mock_send_emails.assert_called_once()
         mock_logger.info.assert_called()
+
+    @patch("email_throttle.cli.simulator.logger")
+    @patch("email_throttle.cli.simulator.run_simulation")
+    def test_command_simulate_with_shared_vendor_state(self, mock_run_simulation, mock_logger):
+        args = MagicMock()
+        args.vendors = ["vendor1"]
+        args.vendor_count = 1
+        args.middlewares = ["cb"]
+        args.circuit_breakers = ["2,3"]
+        args.email_count = 100
+        args.with_state_failover = False
+        args.routing = "ordered"
+        args.weights = None
+        args.workers = 4
+        args.shared_vendor_state = True
+        mock_run_simulation.return_value = SimulationReport(100, 0, 1.0)
+
+        command_simulate(args)
+
+        vendors_config, email_count, workers = mock_run_simulation.call_args.args[:3]
+        assert vendors_config[0]["state_dir"]
+        assert (email_count, workers) == (100, 4)
+        mock_logger.info.assert_any_call("Errors 0")
+
+    @patch("email_throttle.cli.simulator.logger")
+    @patch("email_throttle.cli.simulator.time")
+    @patch("email_throttle.cli.simulator.run_simulation")
+    def test_command_simulate_reports_the_wall_time(self, mock_run_simulation, mock_time, mock_logger):
+        args = MagicMock()
+        args.vendors = ["vendor1"]
+        args.vendor_count = 1
+        args.middlewares = ["cb"]
+        args.circuit_breakers = ["2,3"]
+        args.email_count = 100
+        args.weights = None
+        args.workers = 4
+        args.shared_vendor_state = False
+        # the slowest worker sent for 1s, the run lasted 2s
+        mock_run_simulation.return_value = SimulationReport(100, 0, 1.0)
+        mock_time.perf_counter.side_effect = [10.0, 12.0]
+
+        command_simulate(args)
+
+        mock_logger.info.assert_any_call("Sent in 2.000s (50 emails/s) by 4 workers")
+
+    def test_command_simulate_with_a_weight_per_vendor(self):
+        args = MagicMock()
+        args.vendors = ["vendor1", "vendor2"]
+        args.vendor_count = 2
+        args.middlewares = ["cb", "cb"]
+        args.weights = [5, 1, 1]
+
+        with pytest.raises(ValueError, match="weights"):
+            command_simulate(args)
+
+    def test_command_simulate_without_workers(self):
+        args = MagicMock()
+        args.vendors = ["vendor1"]
+        args.vendor_count = 1
+        args.middlewares = ["cb"]
+        args.weights = None
+        args.workers = 0
+
+        with pytest.raises(ValueError, match="workers"):
+            command_simulate(args)
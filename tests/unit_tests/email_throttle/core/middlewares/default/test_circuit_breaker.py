@@ -1,13 +1,15 @@
-from datetime import datetime
-from unittest.mock import MagicMock
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 # from email_sender.core.failover import EmailFailover
 from freezegun import freeze_time
 
 from email_throttle.core.abstract.sender import EmailSender
-from email_throttle.core.middlewares.default.circuit_breaker import \
-    CircuitBreaker
+from email_throttle.core.middlewares.default.circuit_breaker import (
+    AsyncCircuitBreaker, CircuitBreaker)
 
 
 class TestCircuitBreaker:
@@ -61,3 +63,111 @@ class TestCircuitBreaker:
 
         assert middleware.state == "CLOSED"
         mock_sender.send_email.assert_called_once()
+
+    def test_is_available__should_not_change_the_state(self):
+        middleware = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        middleware.failure_count = 3
+        middleware.state = "OPEN"
+        middleware.last_failure_time = datetime(2019, 3, 18, 20, 00)
+
+        with freeze_time("2019-03-18 20:00:30"):
+            assert middleware.is_available() is False
+
+        with freeze_time("2019-03-18 20:02:00"):
+            assert middleware.is_available() is True
+            assert middleware.state == "OPEN"
+
+    def test_when_half_open__should_admit_a_single_probe(self):
+        middleware = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        middleware.failure_count = 1
+        middleware.state = "OPEN"
+        middleware.last_failure_time = datetime.now() - timedelta(seconds=120)
+        probe_started, release = threading.Event(), threading.Event()
+        calls, rejected = [], []
+
+        def probe():
+            calls.append(1)
+            probe_started.set()
+            release.wait(5)
+            return "Success"
+
+        def send():
+            try:
+                middleware.call(probe)
+            except Exception:
+                rejected.append(1)
+
+        threads = [threading.Thread(target=send) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        assert probe_started.wait(5)
+        # the other senders are rejected while the probe is in flight
+        for thread in threads:
+            thread.join(timeout=0.1)
+        assert len(rejected) == 31
+        assert middleware.is_available() is False
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert middleware.state == "CLOSED"
+
+    def test_when_half_open_probe_fails__should_open_the_circuit_again(self):
+        middleware = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        middleware.failure_count = 1
+        middleware.state = "OPEN"
+        middleware.last_failure_time = datetime(2019, 3, 18, 20, 00)
+
+        with freeze_time("2019-03-18 20:02:00"):
+            assert middleware.allow_request() is True
+            assert middleware.allow_request() is False
+            middleware.record_failure()
+            assert middleware.state == "OPEN"
+            assert middleware.allow_request() is False
+
+        # a new probe once the timeout expires again
+        with freeze_time("2019-03-18 20:04:00"):
+            assert middleware.allow_request() is True
+            assert middleware.state == "HALF-OPEN"
+
+    def test_when_half_open_probe_is_lost__should_admit_another_one(self):
+        middleware = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        middleware.failure_count = 1
+        middleware.state = "OPEN"
+        middleware.last_failure_time = datetime(2019, 3, 18, 20, 00)
+
+        with freeze_time("2019-03-18 20:02:00"):
+            assert middleware.allow_request() is True
+        with freeze_time("2019-03-18 20:02:30"):
+            assert middleware.allow_request() is False
+        with freeze_time("2019-03-18 20:03:00"):
+            assert middleware.allow_request() is True
+
+
+class TestAsyncCircuitBreaker:
+
+    def test_when_failure_threshold_is_exceeded__should_circuit_opened(self):
+        mock_send = AsyncMock(side_effect=Exception("ERRROR"))
+        middleware = AsyncCircuitBreaker(failure_threshold=2, reset_timeout=100)
+
+        for _ in range(2):
+            with pytest.raises(Exception, match="ERRROR"):
+                asyncio.run(middleware.call(mock_send))
+
+        with pytest.raises(Exception, match="Circuit is OPEN"):
+            asyncio.run(middleware.call(mock_send))
+
+        assert middleware.state == "OPEN"
+        assert mock_send.await_count == 2
+
+    def test_when_half_open_call_succeeds__should_close_the_circuit(self):
+        middleware = AsyncCircuitBreaker(failure_threshold=3, reset_timeout=60)
+        middleware.failure_count = 3
+        middleware.state = "OPEN"
+        middleware.last_failure_time = datetime(2019, 3, 18, 20, 00)
+
+        with freeze_time("2019-03-18 20:02:00"):
+            assert asyncio.run(middleware.call(AsyncMock(return_value="SUCCESS"))) == "SUCCESS"
+
+        assert middleware.state == "CLOSED"
@@ -0,0 +1,92 @@
+import math
+
+import pytest
+from freezegun import freeze_time
+
+from email_throttle.core.middlewares.default.rate_limit_engines import (
+    GCRAEngine,
+    SlidingWindowEngine,
+    TokenBucketEngine,
+)
+from email_throttle.core.middlewares.default.rate_limiter import (
+    GCRARateLimiter,
+    RateLimiter,
+    TokenBucketRateLimiter,
+)
+
+ENGINES = [SlidingWindowEngine, TokenBucketEngine, GCRAEngine]
+
+
+class TestRateLimitEngines:
+
+    @pytest.mark.parametrize("engine_class", ENGINES)
+    def test_when_burst_is_exhausted__should_reject(self, engine_class):
+        with freeze_time("2019-03-18 20:00:00"):
+            engine = engine_class(max_requests=3, per_second=30)
+
+            assert all(engine.try_acquire() for _ in range(3))
+            assert not engine.try_acquire()
+
+    @pytest.mark.parametrize("engine_class", ENGINES)
+    def test_when_window_has_passed__should_admit_again(self, engine_class):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            engine = engine_class(max_requests=3, per_second=30)
+            for _ in range(3):
+                engine.try_acquire()
+
+            frozen.tick(30)
+            assert all(engine.try_acquire() for _ in range(3))
+            assert not engine.try_acquire()
+
+    @pytest.mark.parametrize("engine_class", [TokenBucketEngine, GCRAEngine])
+    def test_permits_are_released_gradually(self, engine_class):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            engine = engine_class(max_requests=3, per_second=30)
+            for _ in range(3):
+                engine.try_acquire()
+
+            # one permit every 10 seconds
+            frozen.tick(10)
+            assert engine.try_acquire()
+            assert not engine.try_acquire()
+
+    @pytest.mark.parametrize("engine_class", ENGINES)
+    def test_when_permits_exceed_the_available_ones__should_not_consume(self, engine_class):
+        with freeze_time("2019-03-18 20:00:00"):
+            engine = engine_class(max_requests=3, per_second=30)
+            engine.try_acquire()
+
+            assert not engine.try_acquire(3)
+            assert engine.try_acquire(2)
+
+    @pytest.mark.parametrize("engine_class", ENGINES)
+    def test_wait_time_is_the_time_until_the_next_permit(self, engine_class):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            engine = engine_class(max_requests=3, per_second=30)
+            assert engine.wait_time() == 0
+
+            for _ in range(3):
+                engine.try_acquire()
+                frozen.tick(1)
+
+            # sliding window: first request expires at 30s, buckets: next permit is released at 10s
+            expected = 27 if engine_class is SlidingWindowEngine else 7
+            assert engine.wait_time() == pytest.approx(expected)
+            assert engine.wait_time(4) == math.inf
+
+    @pytest.mark.parametrize(
+        "limiter_class, engine_class",
+        [
+            (RateLimiter, SlidingWindowEngine),
+            (TokenBucketRateLimiter, TokenBucketEngine),
+            (GCRARateLimiter, GCRAEngine),
+        ],
+    )
+    def test_limiters_use_their_engine(self, limiter_class, engine_class):
+        limiter = limiter_class(max_requests=2, per_second=100)
+
+        assert isinstance(limiter.engine, engine_class)
+        assert limiter.call(lambda: "Success") == "Success"
+        assert limiter.call(lambda: "Success") == "Success"
+        with pytest.raises(Exception, match="Too many requests"):
+            limiter.call(lambda: "Success")
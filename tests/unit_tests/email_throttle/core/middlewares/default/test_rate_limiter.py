@@ -1,10 +1,12 @@
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import MagicMock, patch
 
 import pytest
 from freezegun import freeze_time
 
 from email_throttle.core.abstract.sender import EmailSender
-from email_throttle.core.middlewares.default.rate_limiter import RateLimiter
+from email_throttle.core.exceptions import RateLimitExceeded
+from email_throttle.core.middlewares.default.rate_limiter import AsyncRateLimiter, RateLimiter
 
 
 class TestRateLimiter:
@@ -41,3 +43,82 @@ class TestRateLimiter:
         # after the timeout, the rate limiter should be unlimited again
         with freeze_time("2019-03-18 20:01:00"):
             assert rate_limiter.allow_request()
+
+    def test_when_wait_is_enabled__should_sleep_until_the_next_permit(self):
+        mock_sender = MagicMock(EmailSender)
+        rate_limiter = RateLimiter(max_requests=2, per_second=60, wait=True)
+
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            with patch("email_throttle.core.middlewares.default.rate_limiter.time.sleep") as mock_sleep:
+                mock_sleep.side_effect = frozen.tick
+                for dt in [0, 30, 0]:
+                    frozen.tick(dt)
+                    rate_limiter.call(lambda: mock_sender.send_email())
+
+                # the third call waits until the first request leaves the window
+                mock_sleep.assert_called_once_with(30.0)
+
+        assert mock_sender.send_email.call_count == 3
+
+    def test_when_wait_exceeds_max_wait__should_raise_without_sleeping(self):
+        mock_sender = MagicMock(EmailSender)
+        rate_limiter = RateLimiter(max_requests=1, per_second=60, wait=True, max_wait=10)
+
+        with freeze_time("2019-03-18 20:00:00"):
+            with patch("email_throttle.core.middlewares.default.rate_limiter.time.sleep") as mock_sleep:
+                rate_limiter.call(lambda: mock_sender.send_email())
+
+                with pytest.raises(RateLimitExceeded) as error:
+                    rate_limiter.call(lambda: mock_sender.send_email())
+
+                mock_sleep.assert_not_called()
+                assert error.value.retry_after == 60.0
+
+        assert mock_sender.send_email.call_count == 1
+
+    def test_is_available__should_not_take_a_permit(self):
+        rate_limiter = RateLimiter(max_requests=1, per_second=60)
+
+        assert rate_limiter.is_available()
+        assert rate_limiter.is_available()
+        assert rate_limiter.allow_request()
+        assert not rate_limiter.is_available()
+
+    def test_is_available_in_wait_mode__should_accept_waits_up_to_max_wait(self):
+        short = RateLimiter(max_requests=1, per_second=60, wait=True, max_wait=5)
+        long = RateLimiter(max_requests=1, per_second=60, wait=True, max_wait=120)
+        short.allow_request()
+        long.allow_request()
+
+        assert not short.is_available()
+        assert long.is_available()
+
+
+class TestAsyncRateLimiter:
+
+    def test_when_wait_is_enabled__should_await_the_next_permit(self):
+        async def send():
+            return "Success"
+
+        rate_limiter = AsyncRateLimiter(max_requests=1, per_second=60, wait=True)
+
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+
+            async def fake_sleep(delay):
+                frozen.tick(delay)
+
+            with patch("email_throttle.core.middlewares.default.rate_limiter.asyncio.sleep", new=fake_sleep):
+                assert asyncio.run(rate_limiter.call(send)) == "Success"
+                assert asyncio.run(rate_limiter.call(send)) == "Success"
+                # the second call has waited for the whole window
+                assert rate_limiter.engine.wait_time() == 60.0
+
+    def test_when_max_request_is_exceeded__should_raise_exception(self):
+        async def send():
+            return "Success"
+
+        rate_limiter = AsyncRateLimiter(max_requests=1, per_second=60)
+
+        assert asyncio.run(rate_limiter.call(send)) == "Success"
+        with pytest.raises(RateLimitExceeded):
+            asyncio.run(rate_limiter.call(send))
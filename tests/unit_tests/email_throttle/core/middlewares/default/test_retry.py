@@ -1,8 +1,19 @@
-import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from email_throttle.core.middlewares.default.retry import (ConstantBackoff,
+import pytest
+from freezegun import freeze_time
+
+from email_throttle.core.abstract.backoff import Backoff
+from email_throttle.core.exceptions import RateLimitExceeded
+from email_throttle.core.middlewares.default.retry import (AdaptiveBackoff,
+                                                           AsyncRetry,
+                                                           ConstantBackoff,
+                                                           DecorrelatedJitterBackoff,
                                                            ExponentialBackoff,
-                                                           Retry)
+                                                           FullJitterBackoff,
+                                                           Retry,
+                                                           RetryBudget)
 
 
 class TestRetry:
@@ -77,3 +88,108 @@ class TestRetry:
         # Ensure retry has reset its internal state
         result = retry.call(lambda: "Immediate Success")
         assert result == "Immediate Success"
+
+
+class TestAsyncRetry:
+
+    def test_retry_awaits_the_backoff_and_succeeds(self):
+        attempt_counter = 0
+
+        async def fail_once():
+            nonlocal attempt_counter
+            attempt_counter += 1
+            if attempt_counter < 2:
+                raise Exception("Failure")
+            return "Success"
+
+        retry = AsyncRetry(retries=3, backoff=ConstantBackoff(0.01))
+
+        with patch("email_throttle.core.middlewares.default.retry.asyncio.sleep", new=AsyncMock()) as mock_sleep:
+            result = asyncio.run(retry.call(fail_once))
+
+        assert result == "Success"
+        assert attempt_counter == 2
+        mock_sleep.assert_awaited_once_with(0.01)
+
+    def test_retry_exceeds_attempts(self):
+        attempt_counter = 0
+
+        async def always_fail():
+            nonlocal attempt_counter
+            attempt_counter += 1
+            raise Exception("Failure")
+
+        retry = AsyncRetry(retries=3, backoff=ConstantBackoff(0))
+
+        with pytest.raises(Exception, match="Failure"):
+            asyncio.run(retry.call(always_fail))
+
+        assert attempt_counter == 3
+
+
+class TestBackoff:
+
+    def test_full_jitter__should_stay_under_the_exponential_delay(self):
+        backoff = FullJitterBackoff(base=1, factor=2, max_delay=5)
+
+        delays = [backoff.get_delay(attempt) for attempt in (1, 2, 3) for _ in range(100)]
+
+        assert all(0 <= delay <= 5 for delay in delays)
+        assert len(set(delays)) > 1
+
+    def test_decorrelated_jitter__should_grow_from_the_previous_delay(self):
+        backoff = DecorrelatedJitterBackoff(base=1, max_delay=10)
+
+        for _ in range(100):
+            assert 1 <= backoff.get_delay(1) <= 3
+            assert 1 <= backoff.get_delay(2, previous=3) <= 9
+            assert backoff.get_delay(3, previous=9) <= 10
+
+    def test_adaptive__should_honour_retry_after(self):
+        backoff = AdaptiveBackoff(fallback=ConstantBackoff(7), max_delay=30)
+
+        assert backoff.get_delay(1, RateLimitExceeded(retry_after=2.5)) == 2.5
+        assert backoff.get_delay(1, RateLimitExceeded(retry_after=100)) == 30
+        assert backoff.get_delay(1, Exception("Failure")) == 7
+
+    @patch("time.sleep")
+    def test_retry__should_pass_the_error_and_previous_delay(self, mock_sleep):
+        backoff = MagicMock(Backoff)
+        backoff.get_delay.side_effect = [1.0, 2.0]
+        error = RateLimitExceeded(retry_after=1.0)
+
+        with pytest.raises(RateLimitExceeded):
+            Retry(retries=3, backoff=backoff).call(MagicMock(side_effect=error))
+
+        assert backoff.get_delay.call_args_list[0].args == (1, error, None)
+        assert backoff.get_delay.call_args_list[1].args == (2, error, 1.0)
+
+
+class TestRetryBudget:
+
+    def test_retries_are_limited_to_the_ratio_of_requests(self):
+        budget = RetryBudget(ratio=0.1, window=10, min_retries=0)
+
+        with freeze_time("2024-01-01 00:00:00") as frozen:
+            for _ in range(100):
+                budget.record_request()
+            retries = sum(budget.try_retry() for _ in range(50))
+            assert retries == 10
+
+            # the requests leave the window
+            frozen.tick(11)
+            budget.record_request()
+            assert not budget.try_retry()
+
+    def test_retry_without_budget__should_raise_right_away(self):
+        budget = RetryBudget(ratio=0, min_retries=1)
+        func = MagicMock(side_effect=Exception("Failure"))
+        retry = Retry(retries=3, backoff=ConstantBackoff(0), budget=budget)
+
+        with pytest.raises(Exception, match="Failure"):
+            retry.call(func)
+        assert func.call_count == 2
+
+        with pytest.raises(Exception, match="Failure"):
+            retry.call(func)
+        assert func.call_count == 3
@@ -0,0 +1,126 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from email_throttle.core.failover import EmailFailoverWithState
+from email_throttle.core.middlewares.default.circuit_breaker import CircuitBreaker
+from email_throttle.core.middlewares.default.rate_limit_engines import (
+    GCRAEngine,
+    SlidingWindowEngine,
+    TokenBucketEngine,
+)
+from email_throttle.core.middlewares.default.retry import ConstantBackoff, Retry
+
+THREADS = 32
+
+
+def run_in_threads(target, threads: int = THREADS) -> float:
+    """Runs `target(thread_number)` in `threads` threads started together, returns the elapsed seconds."""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(number):
+        barrier.wait()
+        target(number)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+
+class TestThreadSafety:
+
+    @pytest.mark.parametrize("engine_class", [SlidingWindowEngine, TokenBucketEngine, GCRAEngine])
+    def test_engines_admit_exactly_the_quota(self, engine_class):
+        # the window is long enough to not refill during the test
+        engine = engine_class(1000, 3600)
+        admitted = [0] * THREADS
+
+        def acquire(number):
+            admitted[number] = sum(engine.try_acquire() for _ in range(500))
+
+        run_in_threads(acquire)
+
+        assert sum(admitted) == 1000
+
+    def test_engine_throughput_with_threads(self):
+        engine = GCRAEngine(10**9, 3600)
+        calls = 2_000
+
+        def acquire(_):
+            for _ in range(calls):
+                engine.try_acquire()
+
+        elapsed = run_in_threads(acquire)
+
+        # uncontended lock cost is negligible, generous bound for slow machines
+        assert THREADS * calls / elapsed > 20_000
+
+    def test_circuit_breaker_counts_every_failure(self):
+        cb = CircuitBreaker(failure_threshold=THREADS * 50, reset_timeout=60)
+
+        def fail(_):
+            for _ in range(50):
+                cb.record_failure()
+
+        run_in_threads(fail)
+
+        assert cb.failure_count == THREADS * 50
+        assert cb.state == "OPEN"
+
+    def test_circuit_breaker_opens_once_under_concurrent_failures(self):
+        cb = CircuitBreaker(failure_threshold=10, reset_timeout=60)
+        calls = MagicMock(side_effect=Exception("Failure"))
+
+        def send(_):
+            for _ in range(20):
+                try:
+                    cb.call(calls)
+                except Exception:
+                    pass
+
+        run_in_threads(send)
+
+        # concurrent calls admitted before the circuit opened may still fail, but no more than one per thread
+        assert cb.state == "OPEN"
+        assert 10 <= calls.call_count < 10 + THREADS
+        assert not cb.allow_request()
+
+    def test_retry_attempts_are_per_call(self):
+        retry = Retry(retries=3, backoff=ConstantBackoff(0))
+        results = [None] * THREADS
+
+        def send(number):
+            attempts = 0
+
+            def fail_twice():
+                nonlocal attempts
+                attempts += 1
+                if attempts < 3:
+                    raise Exception("Failure")
+                return number
+
+            results[number] = retry.call(fail_twice)
+
+        run_in_threads(send)
+
+        assert results == list(range(THREADS))
+
+    def test_failover_skips_a_failing_service_once(self):
+        failing, first, second = MagicMock(), MagicMock(), MagicMock()
+        failing.send_email.return_value = (False, Exception("Failure"))
+        first.send_email.return_value = (True, "sent")
+        second.send_email.return_value = (True, "sent")
+        failover = EmailFailoverWithState([failing, first, second])
+
+        run_in_threads(lambda _: failover.send_email(MagicMock()))
+
+        assert failover.current_service_index == 1
+        assert first.send_email.call_count == THREADS
+        second.send_email.assert_not_called()
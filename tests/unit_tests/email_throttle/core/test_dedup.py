@@ -0,0 +1,121 @@
+import pytest
+from freezegun import freeze_time
+
+from email_throttle.core.dedup import BloomFilter, IdempotencyIndex, TimeWindowBloomFilter, bloom_parameters
+
+
+class TestBloomFilter:
+
+    def test_parameters(self):
+        bits, hashes = bloom_parameters(1_000_000, 1e-6)
+
+        # about 28.8 bits and 20 hashes per key
+        assert bits == pytest.approx(28.76e6, rel=0.01)
+        assert hashes == 20
+
+    def test_no_false_negatives_and_about_the_configured_false_positives(self):
+        bloom = BloomFilter(10_000, 0.01)
+        for n in range(10_000):
+            bloom.add(f"key-{n}")
+
+        assert all(f"key-{n}" in bloom for n in range(10_000))
+        false_positives = sum(f"other-{n}" in bloom for n in range(20_000))
+        assert false_positives / 20_000 < 0.02
+        assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.3)
+
+    def test_clear(self):
+        bloom = BloomFilter(100, 0.01)
+        bloom.add("key")
+
+        bloom.clear()
+
+        assert "key" not in bloom
+        assert bloom.false_positive_rate() == 0
+
+
+class TestTimeWindowBloomFilter:
+
+    def test_keys_are_remembered_between_one_and_two_windows(self):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            bloom = TimeWindowBloomFilter(100, 0.01, window=60)
+            bloom.add("old")
+            frozen.tick(59)
+            assert "old" in bloom
+
+            frozen.tick(1)
+            bloom.add("new")
+            assert "old" in bloom
+
+            frozen.tick(60)
+            assert "old" not in bloom
+            assert "new" in bloom
+
+    def test_after_two_idle_windows_every_key_is_forgotten(self):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            bloom = TimeWindowBloomFilter(100, 0.01, window=60)
+            bloom.add("key")
+
+            frozen.tick(120)
+
+            assert "key" not in bloom
+
+    def test_memory(self):
+        assert TimeWindowBloomFilter(1_000_000, 1e-6, window=60).memory() == 2 * BloomFilter.byte_size(1_000_000, 1e-6)
+
+
+class TestIdempotencyIndex:
+
+    def test_a_sent_key_is_a_duplicate(self):
+        index = IdempotencyIndex.create()
+
+        assert index.claim("key")
+        index.release("key", sent=True)
+
+        assert not index.claim("key")
+        assert index.stats()["duplicates"] == 1
+
+    def test_a_failed_send_can_be_retried(self):
+        index = IdempotencyIndex.create()
+
+        assert index.claim("key")
+        index.release("key", sent=False)
+
+        assert index.claim("key")
+
+    def test_a_key_in_flight_cannot_be_claimed(self):
+        index = IdempotencyIndex.create()
+
+        assert index.claim("key")
+        assert not index.claim("key")
+
+    def test_keys_evicted_from_the_lru_are_uncertain(self):
+        index = IdempotencyIndex.create(exact_size=2)
+        for key in ("a", "b", "c"):
+            index.claim(key)
+            index.release(key, sent=True)
+
+        # "a" is only in the Bloom filter: sent again unless strict
+        assert index.claim("a")
+        assert index.stats()["uncertain"] == 1
+        assert not index.claim("b")
+
+    def test_strict_drops_the_keys_only_found_by_the_filter(self):
+        index = IdempotencyIndex.create(exact_size=1, strict=True)
+        for key in ("a", "b"):
+            index.claim(key)
+            index.release(key, sent=True)
+
+        assert not index.claim("a")
+        assert index.stats()["uncertain"] == 1
+
+    def test_stats(self):
+        index = IdempotencyIndex.create(capacity=1000, error_rate=0.01)
+        index.claim("key")
+        index.release("key", sent=True)
+
+        stats = index.stats()
+
+        assert stats["recent_keys"] == 1
+        assert 0 < stats["false_positive_rate"] < 1e-6
+        assert stats["filter_bytes"] == 2 * BloomFilter.byte_size(1000, 0.01)
+        assert "1 recent keys" in str(index)
@@ -1,10 +1,16 @@
+import asyncio
+import time
 from datetime import datetime
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from email_throttle.core.abstract.middleware import Middleware
-from email_throttle.core.abstract.sender import EmailSender
+from email_throttle.core.abstract.middleware import AsyncMiddleware, Middleware
+from email_throttle.core.abstract.sender import AsyncEmailSender, EmailSender
 from email_throttle.core.entity import EmailMessage
-from email_throttle.core.service import EmailService
+from email_throttle.core.exceptions import BatchFailed, RateLimitExceeded
+from email_throttle.core.middlewares.default.circuit_breaker import AsyncCircuitBreaker, CircuitBreaker
+from email_throttle.core.middlewares.default.rate_limiter import AsyncRateLimiter, RateLimiter
+from email_throttle.core.middlewares.default.retry import Retry
+from email_throttle.core.service import AsyncEmailService, EmailService, Rejected
 
 
 class TestEmailService:
@@ -75,3 +81,240 @@ class TestEmailService:
             m.call.assert_called_once()
 
         assert result is False
+
+    def test_when_middlewares_are_replaced__pipeline_is_recompiled(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_email.return_value = "Success"
+        m1 = MagicMock(Middleware)
+        m1.call.side_effect = lambda func: func()
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[])
+        message = EmailMessage(subject="Test", body="Body", to="email", from_email="email")
+
+        assert email_service.send_email(message) == (True, "Success")
+        m1.call.assert_not_called()
+
+        email_service.middlewares = [m1]
+
+        assert email_service.send_email(message) == (True, "Success")
+        m1.call.assert_called_once()
+        mock_sender.send_email.assert_called_with(message)
+
+    def get_messages(self, count):
+        return [EmailMessage(subject=f"Test {i}", body="Body", to="email", from_email="email") for i in range(count)]
+
+    def test_send_many__batch_counts_as_n_permits_and_one_breaker_call(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.side_effect = lambda messages: [(True, m.subject) for m in messages]
+        rate_limiter = RateLimiter(max_requests=4, per_second=100)
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=100)
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[circuit_breaker, rate_limiter])
+
+        assert email_service.send_many(self.get_messages(3)) == [(True, "Test 0"), (True, "Test 1"), (True, "Test 2")]
+        mock_sender.send_many.assert_called_once()
+
+        # only one permit left for a batch of two
+        results = email_service.send_many(self.get_messages(2))
+        assert [result for result, _ in results] == [False, False]
+        assert isinstance(results[0][1], RateLimitExceeded)
+        assert mock_sender.send_many.call_count == 1
+        # a rejected batch is a single failure for the breaker
+        assert circuit_breaker.failure_count == 1
+
+    def test_send_many__batch_larger_than_the_rate_limit_is_sent_in_chunks(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.side_effect = lambda messages: [(True, m.subject) for m in messages]
+        rate_limiter = RateLimiter(max_requests=2, per_second=0.01, wait=True)
+        email_service = EmailService(vendor=mock_sender, middlewares=[rate_limiter])
+
+        results = email_service.send_many(self.get_messages(5))
+
+        assert results == [(True, f"Test {i}") for i in range(5)]
+        assert [len(call.args[0]) for call in mock_sender.send_many.call_args_list] == [2, 2, 1]
+
+    def test_send_many__chunks_over_the_rate_limit_are_rejected_on_their_own(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.side_effect = lambda messages: [(True, m.subject) for m in messages]
+        email_service = EmailService(vendor=mock_sender, middlewares=[RateLimiter(max_requests=2, per_second=100)])
+
+        results = email_service.send_many(self.get_messages(5))
+
+        assert results[:2] == [(True, "Test 0"), (True, "Test 1")]
+        assert [sent for sent, _ in results[2:]] == [False, False, False]
+        mock_sender.send_many.assert_called_once()
+
+    def test_send_many__default_sender_reports_each_message(self):
+        class FailingSender(EmailSender):
+            def send_email(self, message):
+                if message.subject == "Test 1":
+                    raise Exception("Error")
+                return "Success"
+
+        email_service = EmailService(vendor=FailingSender("failing"), middlewares=[])
+
+        results = email_service.send_many(self.get_messages(3))
+
+        assert [result for result, _ in results] == [True, False, True]
+        assert str(results[1][1]) == "Error"
+
+    def test_send_many__failing_vendor_trips_the_breaker(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.side_effect = lambda messages: [(False, Exception("Error"))] * len(messages)
+        circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[circuit_breaker])
+
+        for _ in range(5):
+            results = email_service.send_many(self.get_messages(3))
+            assert [result for result, _ in results] == [False, False, False]
+
+        assert circuit_breaker.state == "OPEN"
+        assert circuit_breaker.failure_count == 2
+        # the open breaker rejects the following batches before the vendor
+        assert mock_sender.send_many.call_count == 2
+        assert isinstance(results[0][1], Rejected)
+
+    def test_send_many__failed_batch_is_retried_and_partial_failures_are_not(self):
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.side_effect = [
+            [(False, Exception("Error"))] * 2,
+            [(True, "Success"), (False, Exception("Error"))],
+        ]
+        retry = Retry(retries=3, backoff=MagicMock(get_delay=MagicMock(return_value=0)))
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[retry])
+
+        results = email_service.send_many(self.get_messages(2))
+
+        assert [result for result, _ in results] == [True, False]
+        assert mock_sender.send_many.call_count == 2
+
+    def test_send_many__failed_batch_reports_the_vendor_errors(self):
+        error = Exception("Error")
+        mock_sender = MagicMock(EmailSender)
+        mock_sender.send_many.return_value = [(False, error)] * 2
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[])
+
+        assert email_service.send_many(self.get_messages(2)) == [(False, error)] * 2
+
+    def test_when_circuit_is_open__should_reject_without_running_the_pipeline(self):
+        mock_sender = MagicMock(EmailSender)
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=100)
+        circuit_breaker.record_failure()
+        circuit_breaker.call = MagicMock()
+
+        email_service = EmailService(vendor=mock_sender, middlewares=[circuit_breaker])
+
+        first = email_service.send_email(self.get_messages(1)[0])
+        second = email_service.send_email(self.get_messages(1)[0])
+
+        assert first == (False, second[1])
+        assert isinstance(first[1], Rejected)
+        assert first[1].middleware is circuit_breaker
+        assert email_service.send_many(self.get_messages(2)) == [(False, first[1])] * 2
+        circuit_breaker.call.assert_not_called()
+        mock_sender.send_email.assert_not_called()
+
+    def test_rejections_are_logged_once_per_interval(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=100)
+        circuit_breaker.record_failure()
+        email_service = EmailService(vendor=MagicMock(EmailSender), middlewares=[circuit_breaker])
+
+        with patch("email_throttle.core.log_sampling.logger") as mock_logger:
+            for message in self.get_messages(100):
+                email_service.send_email(message)
+
+        mock_logger.opt.return_value.log.assert_called_once()
+
+
+class TestAsyncEmailService:
+
+    class SlowSender(AsyncEmailSender):
+        async def send_email(self, message):
+            await asyncio.sleep(0.05)
+            return message.subject
+
+    def get_message(self, subject="Test"):
+        return EmailMessage(subject=subject, body="Body", to="email", from_email="email")
+
+    def test_middlewares_called_in_order(self):
+        calls = []
+
+        class RecorderMiddleware(AsyncMiddleware):
+            def __init__(self, name):
+                self.name = name
+
+            def allow_request(self) -> bool:
+                return True
+
+            async def call(self, func):
+                calls.append(self.name)
+                return await func()
+
+        email_service = AsyncEmailService(
+            vendor=self.SlowSender("slow"),
+            middlewares=[RecorderMiddleware("m1"), RecorderMiddleware("m2"), RecorderMiddleware("m3")],
+        )
+
+        result = asyncio.run(email_service.send_email(self.get_message()))
+
+        assert result == (True, "Test")
+        assert calls == ["m1", "m2", "m3"]
+
+    def test_when_email_sender_fails__should_return_the_error(self):
+        mock_sender = MagicMock(AsyncEmailSender)
+        mock_sender.send_email = AsyncMock(side_effect=Exception("Error"))
+        email_service = AsyncEmailService(vendor=mock_sender, middlewares=[])
+
+        result, err = asyncio.run(email_service.send_email(self.get_message()))
+
+        assert result is False
+        assert str(err) == "Error"
+
+    def test_sends_are_kept_in_flight_concurrently(self):
+        email_service = AsyncEmailService(vendor=self.SlowSender("slow"), middlewares=[])
+
+        async def send_all():
+            messages = [self.get_message(f"Test {i}") for i in range(2_000)]
+            return await asyncio.gather(*(email_service.send_email(message) for message in messages))
+
+        start = time.perf_counter()
+        results = asyncio.run(send_all())
+
+        assert all(ok for ok, _ in results)
+        # 2000 sends of 50ms each finish in about the time of a single one
+        assert time.perf_counter() - start < 2
+
+    def test_send_many__concurrent_default_and_rate_limiter_permits(self):
+        email_service = AsyncEmailService(
+            vendor=self.SlowSender("slow"),
+            middlewares=[AsyncRateLimiter(max_requests=3, per_second=100)],
+        )
+        messages = [self.get_message(f"Test {i}") for i in range(3)]
+
+        assert asyncio.run(email_service.send_many(messages)) == [(True, "Test 0"), (True, "Test 1"), (True, "Test 2")]
+        assert [result for result, _ in asyncio.run(email_service.send_many(messages[:1]))] == [False]
+
+    def test_send_many__batch_larger_than_the_rate_limit_is_sent_in_chunks(self):
+        email_service = AsyncEmailService(
+            vendor=self.SlowSender("slow"),
+            middlewares=[AsyncRateLimiter(max_requests=2, per_second=0.01, wait=True)],
+        )
+        messages = [self.get_message(f"Test {i}") for i in range(5)]
+
+        assert asyncio.run(email_service.send_many(messages)) == [(True, f"Test {i}") for i in range(5)]
+
+    def test_send_many__failing_vendor_trips_the_breaker(self):
+        mock_sender = AsyncMock(AsyncEmailSender)
+        mock_sender.send_many.side_effect = lambda messages: [(False, Exception("Error"))] * len(messages)
+        circuit_breaker = AsyncCircuitBreaker(failure_threshold=1, reset_timeout=60)
+        email_service = AsyncEmailService(vendor=mock_sender, middlewares=[circuit_breaker])
+        messages = [self.get_message(f"Test {i}") for i in range(2)]
+
+        results = asyncio.run(email_service.send_many(messages))
+
+        assert [result for result, _ in results] == [False, False]
+        assert not isinstance(results[0][1], BatchFailed)
+        assert circuit_breaker.state == "OPEN"
@@ -1,10 +1,19 @@
-from unittest.mock import Mock
+import asyncio
+from unittest.mock import AsyncMock, Mock
 
 import pytest
+from email_throttle.core.abstract.routing import RoutingStrategy
+from email_throttle.core.abstract.sender import EmailSender
 from email_throttle.core.entity import EmailMessage
-from email_throttle.core.service import EmailService
+from email_throttle.core.middlewares.default.rate_limiter import RateLimiter
+from email_throttle.core.service import AsyncEmailService, EmailService
 
-from email_throttle.core.failover import EmailFailover, EmailFailoverWithState
+from email_throttle.core.failover import (
+    AsyncEmailFailover,
+    AsyncEmailFailoverWithState,
+    EmailFailover,
+    EmailFailoverWithState,
+)
 
 
 class TestEmailFailover:
@@ -67,6 +76,73 @@ class TestEmailFailover:
         mock_service1.send_email.assert_called_once_with(message)
         mock_service2.send_email.assert_called_once_with(message)
 
+    def test_send_many_fails_over_only_the_failed_messages(self):
+        messages = [self.get_message() for _ in range(3)]
+        mock_service1 = Mock(spec=EmailService)
+        mock_service1.send_many.return_value = [(True, "Success"), (False, "Failure"), (True, "Success")]
+        mock_service1.name = "MockedEmailService"
+
+        mock_service2 = Mock(spec=EmailService)
+        mock_service2.send_many.return_value = [(True, "Success")]
+        mock_service2.name = "MockedEmailService2"
+
+        failover = EmailFailover(services=[mock_service1, mock_service2])
+
+        assert failover.send_many(messages) == [True, True, True]
+        mock_service1.send_many.assert_called_once_with(messages)
+        mock_service2.send_many.assert_called_once_with([messages[1]])
+
+    def test_send_many_delivers_a_batch_larger_than_the_rate_limit(self):
+        vendor = Mock(EmailSender)
+        vendor.send_many.side_effect = lambda batch: [(True, "Success")] * len(batch)
+        fallback = Mock()
+        service = EmailService(vendor, [RateLimiter(max_requests=10, per_second=0.01, wait=True)])
+        failover = EmailFailover(services=[service, fallback])
+
+        assert failover.send_many([self.get_message()] * 25) == [True] * 25
+        fallback.send_many.assert_not_called()
+
+    def test_send_many_all_fail(self):
+        mock_service = Mock(spec=EmailService)
+        mock_service.send_many.return_value = [(False, "Failure"), (True, "Success")]
+        mock_service.name = "MockedEmailService"
+
+        failover = EmailFailover(services=[mock_service])
+
+        assert failover.send_many([self.get_message(), self.get_message()]) == [False, True]
+
+    def test_send_email_skips_unavailable_services_without_calling_them(self):
+        unavailable = Mock(spec=EmailService)
+        unavailable.is_available.return_value = False
+        unavailable.name = "Unavailable"
+        available = Mock(spec=EmailService)
+        available.send_email.return_value = (True, "Success")
+        available.name = "Available"
+
+        failover = EmailFailover(services=[unavailable, available])
+
+        assert failover.send_email(self.get_message())
+        unavailable.send_email.assert_not_called()
+
+    def test_send_email_follows_the_routing_order(self):
+        services = []
+        for name in ("first", "second"):
+            service = Mock(spec=EmailService)
+            service.send_email.return_value = (True, "Success")
+            service.name = name
+            services.append(service)
+        routing = Mock(spec=RoutingStrategy)
+        routing.order.return_value = [1, 0]
+
+        failover = EmailFailover(services=services, routing=routing)
+
+        assert failover.send_email(self.get_message())
+        services[0].send_email.assert_not_called()
+        services[1].send_email.assert_called_once()
+        routing.started.assert_called_once_with(1)
+        assert routing.finished.call_args.args[0] == 1
+        assert routing.finished.call_args.args[2] is True
+
 
 class TestEmailFailoverWithState:
     def get_message(self):
@@ -107,3 +183,142 @@ class TestEmailFailoverWithState:
 
         mock_service1.send_email.assert_called_with(message)
         mock_service2.send_email.assert_called_with(message)
+
+    def test_send_email_counts_unavailable_service_as_failed(self):
+        unavailable = Mock(spec=EmailService)
+        unavailable.is_available.return_value = False
+        unavailable.name = "Unavailable"
+        available = Mock(spec=EmailService)
+        available.send_email.return_value = (True, "Success")
+        available.name = "Available"
+
+        failover = EmailFailoverWithState(services=[unavailable, available])
+
+        assert failover.send_email(self.get_message())
+        unavailable.send_email.assert_not_called()
+        assert failover.current_service_index == 1
+
+    def test_send_email_gives_up_after_a_cycle_without_available_services(self):
+        services = [Mock(spec=EmailService) for _ in range(3)]
+        for i, service in enumerate(services):
+            service.is_available.return_value = False
+            service.name = f"MockedEmailService{i}"
+
+        failover = EmailFailoverWithState(services=services)
+        with pytest.raises(Exception, match="No email service available"):
+            failover.send_email(self.get_message())
+        with pytest.raises(Exception, match="No email service available"):
+            failover.send_many([self.get_message()])
+
+        # one check per service and per send, not max_retries cycles
+        assert [service.is_available.call_count for service in services] == [2, 2, 2]
+        assert not any(service.send_email.called or service.send_many.called for service in services)
+
+    def test_send_many_keeps_the_service_that_succeeded(self):
+        messages = [self.get_message() for _ in range(2)]
+        mock_service1 = Mock(spec=EmailService)
+        mock_service1.send_many.return_value = [(False, "Failure"), (True, "Success")]
+        mock_service1.name = "MockedEmailService"
+
+        mock_service2 = Mock(spec=EmailService)
+        mock_service2.send_many.side_effect = lambda batch: [(True, "Success")] * len(batch)
+        mock_service2.name = "MockedEmailService2"
+
+        failover = EmailFailoverWithState(services=[mock_service1, mock_service2])
+
+        assert failover.send_many(messages) == [True, True]
+        mock_service2.send_many.assert_called_once_with([messages[0]])
+
+        # the next batch starts with the second service
+        assert failover.send_many(messages) == [True, True]
+        assert mock_service1.send_many.call_count == 1
+
+    def test_send_many_all_fail_finish_after_max_retries_reached(self):
+        mock_service = Mock(spec=EmailService)
+        mock_service.send_many.return_value = [(False, "Failure")]
+        mock_service.name = "MockedEmailService"
+
+        failover = EmailFailoverWithState(services=[mock_service], max_retries=1)
+        with pytest.raises(Exception, match="Max retries reached"):
+            failover.send_many([self.get_message()])
+
+
+class TestAsyncEmailFailover:
+    def get_message(self):
+        return EmailMessage(
+            to=["test@example.com"],
+            subject="Test Subject",
+            body="Test Body",
+            from_email="from email",
+        )
+
+    def get_service(self, name, result):
+        service = Mock(spec=AsyncEmailService)
+        service.send_email = AsyncMock(return_value=result)
+        service.name = name
+        return service
+
+    def test_send_email_success_on_second_try(self):
+        service1 = self.get_service("MockedEmailService", (False, "Failure"))
+        service2 = self.get_service("MockedEmailService2", (True, "Success"))
+
+        failover = AsyncEmailFailover(services=[service1, service2])
+        message = self.get_message()
+
+        assert asyncio.run(failover.send_email(message))
+        service1.send_email.assert_awaited_once_with(message)
+        service2.send_email.assert_awaited_once_with(message)
+
+    def test_send_email_all_fail(self):
+        services = [self.get_service(f"MockedEmailService{i}", (False, "Failure")) for i in range(2)]
+
+        failover = AsyncEmailFailover(services=services)
+
+        assert not asyncio.run(failover.send_email(self.get_message()))
+
+    def test_with_state__keeps_using_the_service_that_succeeded(self):
+        service1 = self.get_service("MockedEmailService", (False, "Failure"))
+        service2 = self.get_service("MockedEmailService2", (True, "Success"))
+
+        failover = AsyncEmailFailoverWithState(services=[service1, service2])
+        message = self.get_message()
+
+        assert asyncio.run(failover.send_email(message))
+        assert asyncio.run(failover.send_email(message))
+        assert service1.send_email.await_count == 1
+        assert service2.send_email.await_count == 2
+
+    def test_with_state__all_fail_finish_after_max_retries_reached(self):
+        services = [self.get_service(f"MockedEmailService{i}", (False, "Failure")) for i in range(2)]
+
+        failover = AsyncEmailFailoverWithState(services=services, max_retries=1)
+        with pytest.raises(Exception, match="Max retries reached"):
+            asyncio.run(failover.send_email(self.get_message()))
+
+    def test_with_state__gives_up_after_a_cycle_without_available_services(self):
+        services = [self.get_service(f"MockedEmailService{i}", (True, "Success")) for i in range(2)]
+        for service in services:
+            service.is_available.return_value = False
+
+        failover = AsyncEmailFailoverWithState(services=services)
+        with pytest.raises(Exception, match="No email service available"):
+            asyncio.run(failover.send_email(self.get_message()))
+        with pytest.raises(Exception, match="No email service available"):
+            asyncio.run(failover.send_many([self.get_message()]))
+
+        assert [service.is_available.call_count for service in services] == [2, 2]
+
+    def test_send_many_fails_over_only_the_failed_messages(self):
+        messages = [self.get_message() for _ in range(2)]
+        service1 = self.get_service("MockedEmailService", None)
+        service1.send_many = AsyncMock(return_value=[(False, "Failure"), (True, "Success")])
+        service2 = self.get_service("MockedEmailService2", None)
+        service2.send_many = AsyncMock(return_value=[(True, "Success")])
+
+        assert asyncio.run(AsyncEmailFailover(services=[service1, service2]).send_many(messages)) == [True, True]
+        service2.send_many.assert_awaited_once_with([messages[0]])
+
+        service1.send_many = AsyncMock(return_value=[(False, "Failure"), (True, "Success")])
+        failover = AsyncEmailFailoverWithState(services=[service1, service2])
+        assert asyncio.run(failover.send_many(messages)) == [True, True]
+        assert failover.current_service_index == 1
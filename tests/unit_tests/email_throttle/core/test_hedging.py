@@ -0,0 +1,130 @@
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from email_throttle.core.entity import EmailMessage
+from email_throttle.core.hedging import HedgedEmailFailover, LatencyWindow
+from email_throttle.core.service import EmailService
+from email_throttle.vendors.noop import LatencyNoOpEmailSender, NoOpEmailSender
+
+
+def get_message():
+    return EmailMessage(subject="Test", body="Body", to=["to@example.com"], from_email="from@example.com")
+
+
+class TestLatencyWindow:
+
+    def test_percentile(self):
+        window = LatencyWindow(size=100)
+        assert window.percentile(95) is None
+
+        for ms in range(1, 101):
+            window.add(ms / 1000)
+
+        assert window.percentile(50) == 0.05
+        assert window.percentile(95) == 0.095
+        assert window.percentile(100) == 0.1
+
+    def test_keeps_the_last_samples(self):
+        window = LatencyWindow(size=2)
+        for seconds in (10, 1, 2):
+            window.add(seconds)
+
+        assert len(window) == 2
+        assert window.percentile(100) == 2
+
+
+class TestHedgedEmailFailover:
+
+    @pytest.fixture
+    def senders(self):
+        return [LatencyNoOpEmailSender("slow", 0.3), LatencyNoOpEmailSender("fast")]
+
+    def get_failover(self, senders, **kwargs):
+        return HedgedEmailFailover([EmailService(sender, []) for sender in senders], initial_delay=0.05, **kwargs)
+
+    def test_slow_primary__should_be_hedged_and_the_first_success_wins(self, senders):
+        failover = self.get_failover(senders)
+        message = get_message()
+
+        start = time.perf_counter()
+        assert failover.send_email(message)
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.25
+        # both copies carry the same generated key, the caller's message is not changed
+        assert len(senders[1].keys) == 1
+        assert senders[0].keys in (set(), senders[1].keys)
+        assert message.idempotency_key is None
+        assert failover.metrics.hedges == 1
+        assert failover.metrics.hedge_wins == 1
+        assert failover.metrics.hedge_rate == 1.0
+
+        failover.executor.shutdown(wait=True)
+        # the primary finished later: that's the latency the hedge saved
+        assert failover.metrics.saved_latency > 0.1
+
+    def test_fast_primary__should_not_be_hedged(self):
+        senders = [LatencyNoOpEmailSender("fast"), LatencyNoOpEmailSender("other")]
+        failover = self.get_failover(senders)
+
+        assert failover.send_email(get_message())
+
+        failover.close()
+        assert senders[0].delivered == 1
+        assert senders[1].delivered == 0
+        assert failover.metrics.snapshot()["hedge_rate"] == 0.0
+
+    def test_failed_primary__should_fail_over_without_hedging(self):
+        failing = Mock(spec=EmailService)
+        failing.send_email.return_value = (False, Exception("Failure"))
+        failing.name = "failing"
+        sender = LatencyNoOpEmailSender("ok")
+        failover = HedgedEmailFailover([failing, EmailService(sender, [])], initial_delay=10)
+
+        assert failover.send_email(get_message())
+
+        failover.close()
+        assert sender.delivered == 1
+        assert failover.metrics.hedges == 0
+
+    def test_all_fail__should_return_false(self):
+        failing = Mock(spec=EmailService)
+        failing.send_email.return_value = (False, Exception("Failure"))
+        failing.name = "failing"
+        failover = HedgedEmailFailover([failing, failing], initial_delay=10)
+
+        assert not failover.send_email(get_message())
+        assert failing.send_email.call_count == 2
+        failover.close()
+
+    def test_hedge_delay__should_follow_the_latency_percentile(self):
+        failover = self.get_failover([NoOpEmailSender("a")], percentile=90, min_samples=10)
+        assert failover.hedge_delay() == 0.05
+
+        for ms in range(1, 11):
+            failover.latency.add(ms / 100)
+
+        assert failover.hedge_delay() == 0.09
+        failover.close()
+
+    def test_copy_not_started_when_another_won__should_not_be_sent(self):
+        sender = LatencyNoOpEmailSender("late")
+        failover = self.get_failover([sender])
+        won = threading.Event()
+        won.set()
+
+        assert failover._attempt(0, failover.services[0], get_message(), won) is None
+        assert sender.delivered == 0
+        failover.close()
+
+    def test_same_idempotency_key__should_be_delivered_once_by_a_vendor(self):
+        sender = LatencyNoOpEmailSender("vendor")
+        message = get_message()
+        message.idempotency_key = "key"
+
+        sender.send_email(message)
+        assert sender.send_email(message) == "Email already sent from vendor"
+        assert sender.delivered == 1
@@ -0,0 +1,24 @@
+from unittest.mock import patch
+
+from freezegun import freeze_time
+
+from email_throttle.core.log_sampling import SampledLog
+
+
+class TestSampledLog:
+
+    @patch("email_throttle.core.log_sampling.logger")
+    def test_logs_once_per_interval_with_the_skipped_count(self, mock_logger):
+        log = mock_logger.opt.return_value.log
+        sampled = SampledLog(interval=5, level="ERROR")
+
+        with freeze_time("2024-01-01 00:00:00") as frozen:
+            for _ in range(10):
+                sampled.log("Service {} failed", "v1")
+            log.assert_called_once_with("ERROR", "Service {} failed", "v1")
+
+            frozen.tick(5)
+            sampled.log("Service {} failed", "v2")
+
+        assert log.call_count == 2
+        assert log.call_args.args == ("ERROR", "Service {} failed (9 more since the last report)", "v2")
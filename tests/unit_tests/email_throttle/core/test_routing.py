@@ -0,0 +1,75 @@
+import pytest
+
+from email_throttle.core.routing import EwmaLatency, LeastInFlight, OrderedRouting, WeightedRoundRobin
+
+
+class TestOrderedRouting:
+
+    def test_order_is_the_list_order(self):
+        assert OrderedRouting().order(3) == [0, 1, 2]
+
+
+class TestWeightedRoundRobin:
+
+    def test_first_service_follows_the_weights_smoothly(self):
+        routing = WeightedRoundRobin([5, 1, 1])
+
+        firsts = [routing.order(3)[0] for _ in range(7)]
+
+        assert firsts == [0, 0, 1, 0, 2, 0, 0]
+
+    def test_fallbacks_are_ordered_by_weight(self):
+        routing = WeightedRoundRobin([1, 3, 2])
+
+        assert routing.order(3) == [1, 2, 0]
+
+    def test_needs_a_weight_per_service(self):
+        with pytest.raises(ValueError):
+            WeightedRoundRobin([1, 2]).order(3)
+        with pytest.raises(ValueError):
+            WeightedRoundRobin([1, 2, 3]).order(2)
+
+
+class TestLeastInFlight:
+
+    def test_prefers_the_service_with_fewer_sends_in_progress(self):
+        routing = LeastInFlight(3)
+        routing.started(0)
+        routing.started(0)
+        routing.started(1)
+
+        assert routing.order(3) == [2, 1, 0]
+
+        routing.finished(0, 0.1, True)
+        routing.finished(0, 0.1, True)
+
+        assert routing.order(3) == [0, 2, 1]
+
+
+class TestEwmaLatency:
+
+    def test_unmeasured_services_go_first(self):
+        routing = EwmaLatency(3)
+        routing.finished(0, 0.01, True)
+
+        assert routing.order(3) == [1, 2, 0]
+
+    def test_prefers_the_lowest_average_latency(self):
+        routing = EwmaLatency(2, alpha=0.5)
+        routing.finished(0, 0.2, True)
+        routing.finished(1, 0.1, True)
+
+        assert routing.order(2) == [1, 0]
+
+        # a slow sample moves the average half way
+        routing.finished(1, 0.5, True)
+
+        assert routing.latency[1] == pytest.approx(0.3)
+        assert routing.order(2) == [0, 1]
+
+    def test_failures_are_penalized(self):
+        routing = EwmaLatency(2, failure_penalty=1.0)
+        routing.finished(0, 0.01, False)
+        routing.finished(1, 0.5, True)
+
+        assert routing.order(2) == [1, 0]
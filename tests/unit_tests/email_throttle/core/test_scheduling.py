@@ -0,0 +1,168 @@
+import pytest
+from freezegun import freeze_time
+
+from email_throttle.core.scheduling import DomainScheduler, FifoScheduler, PriorityLanes, recipient_domain
+
+
+def drain(scheduler: DomainScheduler | PriorityLanes) -> list:
+    items = []
+    while (item := scheduler.pop()) is not None:
+        items.append(item)
+    return items
+
+
+class TestRecipientDomain:
+
+    @pytest.mark.parametrize(
+        "to, domain",
+        [(["Ann@Gmail.com", "bob@outlook.com"], "gmail.com"), (["no-domain"], "no-domain"), ([], "")],
+    )
+    def test_domain_of_the_first_recipient(self, to, domain):
+        assert recipient_domain(to) == domain
+
+
+class TestDomainScheduler:
+
+    def test_small_domains_are_not_stuck_behind_a_large_one(self):
+        scheduler = DomainScheduler(rate=1000, burst=1000)
+        for n in range(100):
+            scheduler.push("gmail.com", f"gmail-{n}")
+        scheduler.push("small.org", "small-0")
+        scheduler.push("other.net", "other-0")
+
+        items = drain(scheduler)
+
+        assert items[:4] == ["gmail-0", "small-0", "other-0", "gmail-1"]
+        assert len(items) == len(scheduler) + 102 == 102
+
+    def test_costs_are_served_by_deficit(self):
+        scheduler = DomainScheduler(rate=1000, burst=1000, quantum=2)
+        for n in range(3):
+            scheduler.push("campaign.com", f"campaign-{n}", cost=4)
+            scheduler.push("single.com", f"single-{2 * n}")
+            scheduler.push("single.com", f"single-{2 * n + 1}")
+
+        items = drain(scheduler)
+
+        # both domains send 2 recipients per round: a message of 4 recipients takes two rounds
+        assert items == [
+            "single-0",
+            "single-1",
+            "campaign-0",
+            "single-2",
+            "single-3",
+            "single-4",
+            "single-5",
+            "campaign-1",
+            "campaign-2",
+        ]
+
+    def test_a_paced_domain_lets_the_others_send(self):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            scheduler = DomainScheduler(rate=1, burst=1, limits={"fast.com": (100, 100)})
+            for n in range(3):
+                scheduler.push("slow.com", f"slow-{n}")
+                scheduler.push("fast.com", f"fast-{n}")
+
+            assert drain(scheduler) == ["slow-0", "fast-0", "fast-1", "fast-2"]
+            assert scheduler.wait_time() == pytest.approx(1)
+
+            frozen.tick(1)
+            assert drain(scheduler) == ["slow-1"]
+
+    def test_wait_time_without_queued_items(self):
+        assert DomainScheduler().wait_time() is None
+
+    def test_a_cost_over_the_burst_is_capped(self):
+        scheduler = DomainScheduler(rate=2, burst=2, quantum=5)
+        scheduler.push("example.com", "everyone", cost=50)
+
+        assert scheduler.pop() == "everyone"
+
+    def test_idle_domains_are_forgotten(self):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            scheduler = DomainScheduler(rate=1, burst=1, max_idle_domains=2)
+            for n in range(3):
+                scheduler.push(f"domain-{n}.com", n)
+                scheduler.pop()
+
+            # the buckets of the idle domains are still refilling
+            scheduler.push("domain-3.com", 3)
+            assert len(scheduler.domains) == 4
+
+            frozen.tick(1)
+            scheduler.push("domain-4.com", 4)
+            assert list(scheduler.domains) == ["domain-3.com", "domain-4.com"]
+
+
+class TestPriorityLanes:
+
+    def test_lanes_send_by_weight_while_both_have_items(self):
+        lanes = PriorityLanes({"transactional": 3, "bulk": 1})
+        for n in range(6):
+            lanes.push("bulk", "example.com", f"bulk-{n}")
+        for n in range(4):
+            lanes.push("transactional", "example.com", f"reset-{n}")
+
+        # spread evenly: 3 of every 4 pops, then bulk drains alone
+        assert drain(lanes) == [
+            "reset-0",
+            "reset-1",
+            "bulk-0",
+            "reset-2",
+            "reset-3",
+            "bulk-1",
+            "bulk-2",
+            "bulk-3",
+            "bulk-4",
+            "bulk-5",
+        ]
+
+    def test_bulk_is_never_starved(self):
+        lanes = PriorityLanes({"transactional": 9, "bulk": 1})
+        for n in range(100):
+            lanes.push("transactional", "example.com", "reset")
+            lanes.push("bulk", "example.com", "bulk")
+
+        assert [lanes.pop() for _ in range(20)].count("bulk") == 2
+
+    def test_a_paced_lane_gives_its_turn(self):
+        with freeze_time("2019-03-18 20:00:00"):
+            lanes = PriorityLanes({"transactional": 9, "bulk": 1}, lambda: DomainScheduler(rate=1, burst=1))
+            for n in range(3):
+                lanes.push("transactional", "gmail.com", f"reset-{n}")
+                lanes.push("bulk", "outlook.com", f"bulk-{n}")
+
+            assert drain(lanes) == ["reset-0", "bulk-0"]
+            assert lanes.wait_time() == pytest.approx(1)
+            assert len(lanes) == 4
+
+    def test_a_paced_lane_builds_up_no_credit(self):
+        with freeze_time("2019-03-18 20:00:00"):
+            lanes = PriorityLanes({"transactional": 1, "bulk": 1}, lambda: DomainScheduler(rate=1, burst=1))
+            for n in range(2):
+                lanes.push("bulk", "paced.com", f"paced-{n}")
+            for n in range(20):
+                lanes.push("transactional", f"t{n}.com", f"reset-{n}")
+            # paced-1 waits, transactional sends alone meanwhile
+            assert [lanes.pop() for _ in range(10)].count("paced-1") == 0
+
+            for n in range(3):
+                lanes.push("bulk", f"b{n}.com", f"bulk-{n}")
+
+            # once bulk can send again, the lanes alternate instead of bulk bursting ahead
+            assert [lanes.pop() for _ in range(6)] == ["bulk-0", "reset-9", "bulk-1", "reset-10", "bulk-2", "reset-11"]
+
+    def test_lanes_need_positive_weights(self):
+        with pytest.raises(ValueError):
+            PriorityLanes({"transactional": 1, "bulk": 0})
+
+    def test_fifo_lane(self):
+        fifo = FifoScheduler()
+        assert fifo.wait_time() is None
+
+        fifo.push("b.com", 1)
+        fifo.push("a.com", 2)
+
+        assert fifo.wait_time() == 0
+        assert drain(fifo) == [1, 2]
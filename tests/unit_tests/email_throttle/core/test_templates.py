@@ -0,0 +1,70 @@
+from string import Template
+from unittest.mock import Mock
+
+import pytest
+
+from email_throttle.core.entity import EmailMessage, EmailTemplate, TemplatedEmail
+from email_throttle.core.templates import CompiledTemplate, TemplateRenderer, compile_text, render_text
+
+TEMPLATE = EmailTemplate(subject="Hi $name", body="Your code is ${code}.", from_email="from@example.com", is_html=True)
+
+
+def templated(template_id: str = "welcome", **variables) -> TemplatedEmail:
+    return TemplatedEmail(template_id, ["to@example.com"], {"name": "Ann", "code": "42", **variables}, "key")
+
+
+class TestCompileText:
+
+    @pytest.mark.parametrize(
+        "text",
+        ["", "no placeholders", "$name", "Hi $name, ${name}s", "costs $$5 for $name", "$name$code end $$"],
+    )
+    def test_renders_like_string_template(self, text):
+        variables = {"name": "Ann", "code": "42"}
+
+        assert render_text(compile_text(text), variables) == Template(text).substitute(variables)
+
+    def test_invalid_placeholder(self):
+        with pytest.raises(ValueError, match="Invalid placeholder"):
+            compile_text("Hi $ there")
+
+
+class TestCompiledTemplate:
+
+    def test_render(self):
+        message = CompiledTemplate(TEMPLATE).render(templated())
+
+        assert message == EmailMessage(
+            subject="Hi Ann",
+            body="Your code is 42.",
+            to=["to@example.com"],
+            from_email="from@example.com",
+            is_html=True,
+            idempotency_key="key",
+        )
+
+    def test_a_missing_variable_is_an_error(self):
+        with pytest.raises(KeyError, match="code"):
+            CompiledTemplate(TEMPLATE).render(TemplatedEmail("welcome", ["to@example.com"], {"name": "Ann"}))
+
+
+class TestTemplateRenderer:
+
+    def test_templates_are_loaded_and_compiled_once(self):
+        load = Mock(return_value=TEMPLATE)
+        renderer = TemplateRenderer(load)
+
+        subjects = [renderer.render(templated(name=f"user {n}")).subject for n in range(3)]
+
+        assert subjects == ["Hi user 0", "Hi user 1", "Hi user 2"]
+        load.assert_called_once_with("welcome")
+
+    def test_least_recently_used_templates_are_evicted(self):
+        load = Mock(return_value=TEMPLATE)
+        renderer = TemplateRenderer(load, cache_size=2)
+
+        for template_id in ("a", "b", "a", "c", "a", "b"):
+            renderer.render(templated(template_id))
+
+        # "b" was evicted by "c", "a" stayed as the most recently used
+        assert [call.args[0] for call in load.call_args_list] == ["a", "b", "c", "b"]
@@ -0,0 +1,42 @@
+from email_throttle.core.entity import EmailMessage
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+from email_throttle.infra.blobs.store import FileBlobStore, is_reference
+
+
+def email(**fields) -> EmailMessage:
+    return EmailMessage(**{"subject": "test", "body": "body", "to": ["to@example.com"], "from_email": "from", **fields})
+
+
+class TestClaimCheck:
+
+    def test_small_messages_are_not_changed(self, tmp_path):
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=10)
+        message = email(attachments=("small",))
+
+        assert claim_check.check_in(message) is message
+        assert claim_check.check_out(message) is message
+
+    def test_large_body_and_attachments_are_offloaded(self, tmp_path):
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=10)
+        message = email(body="b" * 11, attachments=("small", "a" * 11))
+
+        checked_in = claim_check.check_in(message)
+
+        assert is_reference(checked_in.body)
+        assert checked_in.attachments[0] == "small" and is_reference(checked_in.attachments[1])
+        assert claim_check.check_out(checked_in) == message
+
+    def test_an_attachment_sent_to_many_recipients_is_stored_once(self, tmp_path):
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=10)
+        attachment = "a" * 100
+
+        checked_in = [claim_check.check_in(email(to=[f"{n}@example.com"], attachments=(attachment,))) for n in range(5)]
+
+        assert len({message.attachments[0] for message in checked_in}) == 1
+        assert len(list(tmp_path.rglob("*"))) == 2  # a subdirectory and the blob
+
+    def test_an_inline_value_that_looks_like_a_reference_is_kept(self, tmp_path):
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=1000)
+        message = email(body="blob:sha256:not really")
+
+        assert claim_check.check_out(claim_check.check_in(message)) == message
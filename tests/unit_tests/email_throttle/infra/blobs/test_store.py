@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from email_throttle.infra.blobs.store import FileBlobStore, is_reference
+
+
+def stored_files(root) -> list[str]:
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+class TestFileBlobStore:
+
+    def test_put_and_read_back(self, tmp_path):
+        store = FileBlobStore(str(tmp_path))
+
+        reference = store.put("¡hola!".encode())
+
+        assert is_reference(reference)
+        assert store.read_text(reference) == "¡hola!"
+
+    def test_the_same_data_is_stored_once(self, tmp_path):
+        store = FileBlobStore(str(tmp_path))
+
+        references = {store.put(b"attachment") for _ in range(3)}
+        other = store.put(b"other attachment")
+
+        assert len(references) == 1 and other not in references
+        assert len(stored_files(tmp_path)) == 2
+
+    def test_references_are_valid_for_another_store_on_the_same_directory(self, tmp_path):
+        reference = FileBlobStore(str(tmp_path)).put(b"data")
+
+        assert FileBlobStore(str(tmp_path)).read_text(reference) == "data"
+
+    def test_open_maps_the_blob(self, tmp_path):
+        store = FileBlobStore(str(tmp_path))
+        reference = store.put(b"0123456789")
+
+        with store.open(reference) as view:
+            assert view.readonly
+            assert bytes(view[2:5]) == b"234"
+
+    def test_empty_blob(self, tmp_path):
+        store = FileBlobStore(str(tmp_path))
+
+        assert store.read_text(store.put(b"")) == ""
+
+    def test_invalid_reference(self, tmp_path):
+        with pytest.raises(ValueError, match="Invalid blob reference"):
+            FileBlobStore(str(tmp_path)).read_text("blob:sha256:../../etc/passwd")
@@ -0,0 +1,41 @@
+import pytest
+
+from email_throttle.core.entity import EmailTemplate
+from email_throttle.infra.blobs.store import FileBlobStore
+from email_throttle.infra.blobs.templates import TemplateStore
+
+TEMPLATE = EmailTemplate(subject="Hi $name", body="Hello $name", from_email="from@example.com")
+
+
+class TestTemplateStore:
+
+    def test_register_and_load(self, tmp_path):
+        templates = TemplateStore(FileBlobStore(str(tmp_path)))
+
+        template_id = templates.register(TEMPLATE)
+
+        assert templates.exists(template_id)
+        assert TemplateStore(FileBlobStore(str(tmp_path))).load(template_id) == TEMPLATE
+
+    def test_the_id_is_the_digest_of_the_template(self, tmp_path):
+        templates = TemplateStore(FileBlobStore(str(tmp_path)))
+
+        assert templates.register(TEMPLATE) == templates.register(TEMPLATE)
+        assert templates.register(TEMPLATE) != templates.register(EmailTemplate("Hi", "Hello", "from@example.com"))
+
+    @pytest.mark.parametrize(
+        "template", [EmailTemplate("Hi $", "Hello", "from@example.com"), EmailTemplate("Hi", "Hello ${name", "f")]
+    )
+    def test_invalid_templates_are_not_registered(self, tmp_path, template):
+        templates = TemplateStore(FileBlobStore(str(tmp_path)))
+
+        with pytest.raises(ValueError, match="Invalid placeholder"):
+            templates.register(template)
+
+        assert not list(tmp_path.iterdir())
+
+    def test_unknown_ids(self, tmp_path):
+        templates = TemplateStore(FileBlobStore(str(tmp_path)))
+
+        assert not templates.exists("0" * 64)
+        assert not templates.exists("../secrets")
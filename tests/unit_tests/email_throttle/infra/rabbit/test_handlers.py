@@ -0,0 +1,399 @@
+import dataclasses
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pika
+import pytest
+
+from email_throttle.core.entity import EmailMessage, Priority
+from email_throttle.core.exceptions import PoisonMessage
+from email_throttle.core.scheduling import DomainScheduler, PriorityLanes
+from email_throttle.infra.rabbit.handlers import PARKING_QUEUE, RETRY_EXCHANGE, RabbitConsumer, RabbitProducer
+from email_throttle.infra.rabbit.serializers import WireFormat
+from email_throttle.infra.rabbit.topology import PERSISTENT, Topology
+
+EMAIL = EmailMessage(subject="test", body="body", to=["to@example.com"], from_email="from@example.com")
+
+
+def delivery(tag: int):
+    method = MagicMock()
+    method.delivery_tag = tag
+    return method
+
+
+class TestRabbitConsumer:
+
+    def get_connection(self):
+        connection = MagicMock()
+        # the callbacks run on the "connection thread" when the events are processed
+        connection.pending_callbacks = []
+        connection.add_callback_threadsafe.side_effect = connection.pending_callbacks.append
+        return connection
+
+    def test_qos_is_set_before_consuming(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+
+        RabbitConsumer(connection, MagicMock(), lambda body: body, prefetch=16, concurrency=4)
+
+        calls = [name for name, *_ in channel.method_calls if name in ("basic_qos", "basic_consume")]
+        assert calls == ["basic_qos", "basic_consume"]
+        channel.basic_qos.assert_called_once_with(prefetch_count=16)
+
+    def test_without_concurrency__acks_inline(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        handler = MagicMock()
+        consumer = RabbitConsumer(connection, handler, lambda body: body.decode())
+
+        consumer.consume(channel, delivery(1), None, b"message")
+
+        handler.assert_called_once_with("message")
+        channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+    def test_with_concurrency__handles_messages_in_parallel_and_acks_on_the_connection_thread(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        # every worker waits until 4 messages are in flight at the same time
+        barrier = threading.Barrier(4, timeout=5)
+        handler = MagicMock(side_effect=lambda message: barrier.wait())
+        consumer = RabbitConsumer(connection, handler, lambda body: body, prefetch=4, concurrency=4)
+
+        for tag in range(1, 5):
+            consumer.consume(channel, delivery(tag), None, b"message")
+
+        consumer.close()
+
+        assert handler.call_count == 4
+        # workers never touch the channel
+        channel.basic_ack.assert_not_called()
+        for callback in connection.pending_callbacks:
+            callback()
+        assert sorted(call.kwargs["delivery_tag"] for call in channel.basic_ack.call_args_list) == [1, 2, 3, 4]
+
+    def test_without_retry_delays__failed_message_is_dead_lettered(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection, MagicMock(side_effect=Exception("Error")), lambda body: body, concurrency=2
+        )
+
+        consumer.consume(channel, delivery(1), None, b"message")
+        consumer.close()
+        self.run_callbacks(connection, 1)
+
+        # rejected, it doesn't hold a prefetch slot
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+        channel.basic_ack.assert_not_called()
+
+    def test_with_the_requeue_policy__failed_message_is_nacked_back_to_its_queue(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection,
+            MagicMock(side_effect=Exception("Error")),
+            lambda body: body,
+            failure_policy="requeue",
+            topology=Topology("quorum", delivery_limit=5),
+        )
+
+        consumer.consume(channel, delivery(1), None, b"message")
+
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=True)
+        emails = next(call for call in channel.queue_declare.call_args_list if call.kwargs["queue"] == "emails")
+        assert emails.kwargs["arguments"]["x-delivery-limit"] == 5
+
+    def test_the_requeue_policy_needs_a_delivery_limit(self):
+        with pytest.raises(ValueError, match="delivery limit"):
+            RabbitConsumer(self.get_connection(), MagicMock(), lambda body: body, failure_policy="requeue")
+
+    def test_poison_messages_are_dead_lettered_instead_of_retried(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        handler = MagicMock()
+        consumer = RabbitConsumer(connection, handler, MagicMock(side_effect=ValueError("bad")), retry_delays=(1,))
+
+        consumer.consume(channel, delivery(1), None, b"not an email")
+
+        handler.assert_not_called()
+        channel.basic_publish.assert_not_called()
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+
+    def test_messages_the_handler_finds_poison_are_dead_lettered_instead_of_retried(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        handler = MagicMock(side_effect=PoisonMessage("unrenderable"))
+        consumer = RabbitConsumer(connection, handler, lambda body: body, retry_delays=(1,))
+
+        consumer.consume(channel, delivery(1), None, b"email")
+
+        handler.assert_called_once_with(b"email")
+        channel.basic_publish.assert_not_called()
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+
+    def test_queues_are_durable_and_dead_letter_to_the_parking_queue(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+
+        RabbitConsumer(connection, MagicMock(), lambda body: body)
+
+        declared = {call.kwargs["queue"]: call.kwargs for call in channel.queue_declare.call_args_list}
+        assert declared["emails"]["durable"] and declared[PARKING_QUEUE]["durable"]
+        assert declared["emails"]["arguments"] == {
+            "x-dead-letter-exchange": RETRY_EXCHANGE,
+            "x-dead-letter-routing-key": PARKING_QUEUE,
+        }
+
+    def test_with_retry_delays__declares_a_ttl_queue_per_delay(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+
+        RabbitConsumer(connection, MagicMock(), lambda body: body, retry_delays=(1, 30))
+
+        declared = {call.kwargs["queue"]: call.kwargs.get("arguments") for call in channel.queue_declare.call_args_list}
+        assert declared["emails.retry.1000ms"] == {
+            "x-message-ttl": 1000,
+            "x-dead-letter-exchange": "throttler",
+            "x-dead-letter-routing-key": "emails",
+        }
+        assert declared["emails.retry.30000ms"]["x-message-ttl"] == 30000
+        assert PARKING_QUEUE in declared
+
+    def test_with_retry_delays__failed_message_is_republished_with_its_attempt_and_acked(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection, MagicMock(side_effect=Exception("Error")), lambda body: body, retry_delays=(1, 30)
+        )
+
+        attempts = []
+        properties = pika.BasicProperties(content_type="application/json")
+        for tag in range(1, 6):
+            consumer.consume(channel, delivery(tag), properties, b"message")
+            published = channel.basic_publish.call_args.kwargs
+            attempts.append((published["routing_key"], published["properties"].headers["x-attempt"]))
+            # the broker dead-letters it back with the same headers
+            properties = published["properties"]
+
+        assert attempts == [
+            ("emails.retry.1000ms", 1),
+            ("emails.retry.30000ms", 2),
+            ("emails.retry.30000ms", 3),
+            ("emails.retry.30000ms", 4),
+            (PARKING_QUEUE, 5),
+        ]
+        assert channel.basic_publish.call_args.kwargs["exchange"] == RETRY_EXCHANGE
+        assert properties.content_type == "application/json"
+        assert channel.basic_ack.call_count == 5
+
+    def test_with_retry_delays_and_concurrency__requeue_runs_on_the_connection_thread(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection, MagicMock(side_effect=Exception("Error")), lambda body: body, concurrency=2, retry_delays=(1,)
+        )
+
+        consumer.consume(channel, delivery(1), None, b"message")
+        consumer.close()
+
+        channel.basic_publish.assert_not_called()
+        for callback in connection.pending_callbacks:
+            callback()
+        assert channel.basic_publish.call_args.kwargs["routing_key"] == "emails.retry.1000ms"
+        channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+    def test_with_a_wire_format__deliveries_are_decoded_by_content_type(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        callback = MagicMock()
+        consumer = RabbitConsumer(connection, callback, MagicMock(), wire_format=WireFormat())
+
+        for codec in ("json", "binary"):
+            body, properties = WireFormat(codec).encode(EMAIL)
+            consumer.consume(channel, delivery(1), properties, body)
+
+        assert callback.call_args_list == [((EMAIL,),), ((EMAIL,),)]
+        assert channel.basic_ack.call_count == 2
+
+    def run_callbacks(self, connection, count: int):
+        """Runs the callbacks scheduled by the workers, as the connection thread would, until `count` ran."""
+        deadline = time.monotonic() + 5
+        while count and time.monotonic() < deadline:
+            if connection.pending_callbacks:
+                connection.pending_callbacks.pop(0)()
+                count -= 1
+            else:
+                time.sleep(0.001)
+
+    def test_with_a_scheduler__domains_take_turns(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        handled = []
+        consumer = RabbitConsumer(
+            connection,
+            lambda message: handled.append(message.to[0]),
+            lambda body: EmailMessage(subject="s", body="b", to=[body.decode()], from_email="f"),
+            scheduler=DomainScheduler(rate=1000, burst=1000),
+        )
+
+        for tag, to in enumerate(["1@gmail.com", "2@gmail.com", "3@gmail.com", "4@gmail.com", "1@small.org"]):
+            consumer.consume(channel, delivery(tag), None, to.encode())
+        self.run_callbacks(connection, 5)
+
+        # the first message was handed to the worker on arrival, the others waited in the scheduler
+        assert handled == ["1@gmail.com", "2@gmail.com", "1@small.org", "3@gmail.com", "4@gmail.com"]
+        assert channel.basic_ack.call_count == 5
+        assert consumer.in_flight == 0
+        consumer.close()
+
+    def test_with_a_scheduler__paced_domains_are_dispatched_later(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection,
+            MagicMock(),
+            lambda body: EmailMessage(subject="s", body="b", to=["to@gmail.com"], from_email="f"),
+            concurrency=2,
+            scheduler=DomainScheduler(rate=1, burst=1),
+        )
+
+        consumer.consume(channel, delivery(1), None, b"first")
+        consumer.consume(channel, delivery(2), None, b"second")
+        consumer.consume(channel, delivery(3), None, b"third")
+
+        assert consumer.in_flight == 1
+        # a single timer until the domain has a token again
+        delay, wake = connection.call_later.call_args.args
+        assert connection.call_later.call_count == 1
+        assert 0 < delay <= 1
+        consumer.close()
+
+    def test_with_priority_lanes__consumes_each_lane_and_the_transactional_one_first(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        handled = []
+        consumer = RabbitConsumer(
+            connection,
+            lambda message: handled.append(message.subject),
+            lambda body: EmailMessage(subject=body.decode(), body="b", to=["to@example.com"], from_email="f"),
+            scheduler=PriorityLanes({Priority.TRANSACTIONAL: 2, Priority.BULK: 1}),
+        )
+        callbacks = {
+            call.kwargs["queue"]: call.kwargs["on_message_callback"] for call in channel.basic_consume.call_args_list
+        }
+
+        for tag in range(4):
+            callbacks["emails"](channel, delivery(tag), None, f"bulk {tag}".encode())
+        for tag in range(4, 7):
+            callbacks["emails.transactional"](channel, delivery(tag), None, f"reset {tag}".encode())
+        self.run_callbacks(connection, 7)
+
+        # the first bulk message was handed to the worker on arrival, then 2 transactional turns for 1 bulk one
+        assert handled == ["bulk 0", "reset 4", "bulk 1", "reset 5", "reset 6", "bulk 2", "bulk 3"]
+        consumer.close()
+
+    def test_with_priority_lanes__retries_go_back_to_their_lane(self):
+        connection = self.get_connection()
+        channel = connection.channel.return_value
+        consumer = RabbitConsumer(
+            connection,
+            MagicMock(side_effect=Exception("Error")),
+            lambda body: EMAIL,
+            scheduler=PriorityLanes({Priority.TRANSACTIONAL: 4, Priority.BULK: 1}),
+            retry_delays=(1,),
+        )
+
+        consumer.consume(channel, delivery(1), None, b"message", queue="emails.transactional")
+        self.run_callbacks(connection, 1)
+
+        declared = {call.kwargs["queue"]: call.kwargs.get("arguments") for call in channel.queue_declare.call_args_list}
+        assert declared["emails.transactional.retry.1000ms"]["x-dead-letter-routing-key"] == "emails.transactional"
+        assert declared["emails.retry.1000ms"]["x-dead-letter-routing-key"] == "emails"
+        assert channel.basic_publish.call_args.kwargs["routing_key"] == "emails.transactional.retry.1000ms"
+        channel.basic_ack.assert_called_once_with(delivery_tag=1)
+        consumer.close()
+
+
+class TestRabbitProducer:
+
+    def get_producer(self, **kwargs):
+        connection = MagicMock()
+        producer = RabbitProducer(connection, serializer=lambda message: f"body {message}", **kwargs)
+        return producer, connection.channel.return_value
+
+    def test_send_many_commits_once_per_batch(self):
+        producer, channel = self.get_producer(batch_size=2)
+
+        assert producer.send_many(range(5)) == (5, 0)
+
+        channel.tx_select.assert_called_once()
+        assert channel.basic_publish.call_count == 5
+        assert channel.tx_commit.call_count == 3
+        assert channel.basic_publish.call_args.kwargs["body"] == "body 4"
+
+    def test_when_a_commit_fails__only_that_batch_is_rejected(self):
+        producer, channel = self.get_producer(batch_size=2)
+        channel.is_open = True
+        channel.tx_commit.side_effect = [None, pika.exceptions.AMQPChannelError("Error"), None]
+
+        assert producer.send_many(range(5)) == (3, 2)
+        channel.tx_rollback.assert_called_once()
+
+    def test_when_the_channel_was_closed__it_is_reopened(self):
+        connection = MagicMock()
+        closed_channel, new_channel = MagicMock(), MagicMock()
+        closed_channel.is_open = False
+        closed_channel.tx_commit.side_effect = pika.exceptions.ChannelClosedByBroker(406, "PRECONDITION_FAILED")
+        connection.channel.side_effect = [closed_channel, new_channel]
+        producer = RabbitProducer(connection, serializer=str, batch_size=1)
+
+        assert producer.send_many(range(2)) == (1, 1)
+        assert producer.channel is new_channel
+        new_channel.tx_select.assert_called_once()
+        new_channel.tx_commit.assert_called_once()
+
+    def test_without_confirm__nothing_is_committed(self):
+        producer, channel = self.get_producer(confirm=False)
+
+        assert producer.send_many(range(3)) == (3, 0)
+        producer.send(4)
+
+        channel.tx_select.assert_not_called()
+        channel.tx_commit.assert_not_called()
+        assert channel.basic_publish.call_count == 4
+
+    def test_with_a_wire_format__the_content_type_is_published(self):
+        connection = MagicMock()
+        producer = RabbitProducer(connection, serializer=str, wire_format=WireFormat("binary"))
+        channel = connection.channel.return_value
+
+        assert producer.send_many([EMAIL]) == (1, 0)
+
+        published = channel.basic_publish.call_args.kwargs
+        assert published["properties"].content_type == "application/vnd.email-throttle.email.v1"
+        assert WireFormat().decode(published["body"], published["properties"]) == EMAIL
+
+    def test_messages_are_persistent_unless_the_topology_is_transient(self):
+        producer, channel = self.get_producer(wire_format=WireFormat())
+        producer.send(EMAIL)
+        assert channel.basic_publish.call_args.kwargs["properties"].delivery_mode == PERSISTENT
+
+        producer, channel = self.get_producer(topology=Topology("transient"))
+        producer.send(EMAIL)
+        assert channel.basic_publish.call_args.kwargs["properties"] is None
+
+    def test_messages_are_routed_to_the_queue_of_their_priority(self):
+        producer, channel = self.get_producer()
+        transactional = dataclasses.replace(EMAIL, priority=Priority.TRANSACTIONAL)
+
+        producer.send_many([EMAIL, transactional])
+        producer.send(transactional)
+
+        routing_keys = [call.kwargs["routing_key"] for call in channel.basic_publish.call_args_list]
+        assert routing_keys == ["emails", "emails.transactional", "emails.transactional"]
+        assert {call.kwargs["queue"] for call in channel.queue_declare.call_args_list} == {
+            "emails",
+            "emails.transactional",
+            PARKING_QUEUE,
+        }
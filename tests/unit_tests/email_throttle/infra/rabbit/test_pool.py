@@ -0,0 +1,121 @@
+import threading
+from unittest.mock import MagicMock
+
+import pika
+import pytest
+
+from email_throttle.infra.rabbit.pool import PoolExhausted, RabbitProducerPool
+
+
+class TestRabbitProducerPool:
+
+    def get_pool(self, size=2, **kwargs):
+        connections = []
+
+        def create_connection():
+            connection = MagicMock()
+            connection.is_open = True
+            connection.channel.return_value.is_open = True
+            connections.append(connection)
+            return connection
+
+        return RabbitProducerPool(str, size=size, create_connection_fn=create_connection, **kwargs), connections
+
+    def test_producers_are_reused_between_checkouts(self):
+        pool, connections = self.get_pool()
+
+        pool.start()
+        with pool.acquire() as first:
+            pass
+        with pool.acquire() as second:
+            pass
+
+        assert first is second
+        assert len(connections) == 1
+
+    def test_topology_is_declared_by_each_connection(self):
+        pool, connections = self.get_pool()
+
+        with pool.acquire():
+            with pool.acquire():
+                pass
+
+        assert len(connections) == 2
+        declared = [c.channel.return_value.queue_declare.called for c in connections]
+        assert declared == [True, True]
+
+    def test_when_the_broker_restarted__reconnected_producer_declares_the_topology_again(self):
+        pool, connections = self.get_pool(size=1)
+
+        with pool.acquire():
+            pass
+        connections[0].process_data_events.side_effect = pika.exceptions.StreamLostError("lost")
+
+        with pool.acquire() as producer:
+            assert producer.connection is connections[1]
+        connections[1].channel.return_value.exchange_declare.assert_called()
+        connections[1].channel.return_value.queue_declare.assert_called()
+
+    def test_when_the_connection_was_closed__should_reconnect(self):
+        pool, connections = self.get_pool(size=1)
+
+        with pool.acquire():
+            pass
+        connections[0].process_data_events.side_effect = pika.exceptions.StreamLostError("lost")
+
+        with pool.acquire() as producer:
+            assert producer.connection is connections[1]
+
+    def test_when_a_request_fails_with_an_amqp_error__producer_is_discarded(self):
+        pool, connections = self.get_pool(size=1)
+
+        with pytest.raises(pika.exceptions.AMQPChannelError):
+            with pool.acquire():
+                raise pika.exceptions.AMQPChannelError("Error")
+
+        connections[0].close.assert_called_once()
+        with pool.acquire() as producer:
+            assert producer.connection is connections[1]
+
+    def test_when_the_broker_is_down_at_startup__should_connect_on_first_use(self):
+        pool, connections = self.get_pool(size=1)
+        pool.create_connection_fn = MagicMock(side_effect=pika.exceptions.AMQPConnectionError("down"))
+
+        pool.start()
+
+        with pytest.raises(pika.exceptions.AMQPConnectionError):
+            with pool.acquire():
+                pass
+        # the slot is released even if the connection failed
+        pool.create_connection_fn = MagicMock(return_value=MagicMock())
+        with pool.acquire() as producer:
+            producer.channel.queue_declare.assert_called()
+
+    def test_when_all_producers_are_checked_out__should_time_out(self):
+        pool, _ = self.get_pool(size=1, timeout=0.01)
+        checked_out = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with pool.acquire():
+                checked_out.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        checked_out.wait()
+        try:
+            with pytest.raises(PoolExhausted):
+                with pool.acquire():
+                    pass
+        finally:
+            release.set()
+            thread.join()
+
+    def test_close_closes_the_connections(self):
+        pool, connections = self.get_pool()
+        pool.start()
+
+        pool.close()
+
+        connections[0].close.assert_called_once()
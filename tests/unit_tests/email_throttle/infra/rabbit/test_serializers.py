@@ -0,0 +1,136 @@
+import json
+
+import pika
+import pytest
+from pydantic import ValidationError
+
+from email_throttle.core.entity import EmailMessage, Priority, TemplatedEmail
+from email_throttle.infra.blobs.claim_check import ClaimCheck
+from email_throttle.infra.blobs.store import FileBlobStore
+from email_throttle.infra.rabbit.serializers import (
+    CODECS,
+    BinaryCodec,
+    JsonCodec,
+    WireFormat,
+    decode_email_message,
+    encode_email_message,
+)
+
+EMAIL = {"subject": "test", "body": "body", "to": ["to@example.com"], "from_email": "from@example.com"}
+
+
+class TestSerializers:
+
+    def test_decode_builds_the_entity_from_the_queue_body(self):
+        body = json.dumps(EMAIL).encode()
+
+        message = decode_email_message(body)
+
+        assert message == EmailMessage(**EMAIL)
+        assert message.cc == () and message.idempotency_key is None
+
+    def test_encode_and_decode_round_trip(self):
+        message = EmailMessage(**EMAIL, cc=("cc@example.com",), idempotency_key="key", priority=Priority.TRANSACTIONAL)
+
+        assert decode_email_message(encode_email_message(message)) == message
+
+    def test_decode_validates_the_body(self):
+        with pytest.raises(ValidationError):
+            decode_email_message(b'{"subject": "test", "to": "to@example.com"}')
+
+    def test_entity_has_no_instance_dict(self):
+        assert not hasattr(EmailMessage(**EMAIL), "__dict__")
+
+
+class TestBinaryCodec:
+
+    def test_round_trip_with_every_field(self):
+        message = EmailMessage(
+            **EMAIL,
+            cc=("cc@example.com", "ñandú@example.com"),
+            bcc=("bcc@example.com",),
+            attachments=("file.pdf",),
+            is_html=True,
+            links=("https://example.com",),
+            idempotency_key="key",
+            priority=Priority.TRANSACTIONAL,
+        )
+
+        assert BinaryCodec().decode(BinaryCodec().encode(message)) == message
+
+    def test_is_smaller_than_json(self):
+        message = EmailMessage(**EMAIL)
+
+        assert len(BinaryCodec().encode(message)) < len(JsonCodec().encode(message))
+
+    def test_rejects_lists_too_long_for_the_header(self):
+        codec = BinaryCodec()
+        codec.encode(EmailMessage(**{**EMAIL, "to": ["to@example.com"] * 65_535}))
+
+        with pytest.raises(ValueError, match="at most 65535"):
+            codec.encode(EmailMessage(**{**EMAIL, "to": ["to@example.com"] * 65_536}))
+
+    def test_rejects_an_unknown_version(self):
+        body = b"\x02" + BinaryCodec().encode(EmailMessage(**EMAIL))[1:]
+
+        with pytest.raises(ValueError, match="version 2"):
+            BinaryCodec().decode(body)
+
+    def test_rejects_a_truncated_body(self):
+        with pytest.raises(ValueError, match="Truncated"):
+            BinaryCodec().decode(BinaryCodec().encode(EmailMessage(**EMAIL))[:10])
+
+
+class TestWireFormat:
+
+    @pytest.mark.parametrize("codec", sorted(CODECS))
+    def test_sets_the_content_type_of_the_codec(self, codec):
+        body, properties = WireFormat(codec).encode(EmailMessage(**EMAIL))
+
+        assert properties.content_type == CODECS[codec].content_type
+        assert properties.content_encoding is None
+        assert WireFormat().decode(body, properties) == EmailMessage(**EMAIL)
+
+    def test_only_large_bodies_are_compressed(self):
+        wire_format = WireFormat("binary", compression="deflate", compress_over=100)
+        small, large = EmailMessage(**EMAIL), EmailMessage(**{**EMAIL, "body": "lorem ipsum " * 100})
+
+        _, properties = wire_format.encode(small)
+        body, compressed = wire_format.encode(large)
+
+        assert properties.content_encoding is None
+        assert compressed.content_encoding == "deflate"
+        assert len(body) < len(BinaryCodec().encode(large))
+        assert WireFormat().decode(body, compressed) == large
+
+    def test_large_bodies_are_offloaded_before_encoding(self, tmp_path):
+        claim_check = ClaimCheck(FileBlobStore(str(tmp_path)), threshold=100)
+        large = EmailMessage(**{**EMAIL, "body": "lorem ipsum " * 100})
+
+        body, properties = WireFormat(claim_check=claim_check).encode(large)
+
+        assert len(body) < 300
+        assert claim_check.check_out(WireFormat().decode(body, properties)) == large
+
+    def test_templated_emails_have_their_own_content_type(self):
+        templated = TemplatedEmail("0" * 64, ["to@example.com"], {"name": "Ann"})
+
+        body, properties = WireFormat("binary").encode(templated)
+
+        assert properties.content_type == "application/vnd.email-throttle.templated+json"
+        assert WireFormat().decode(body, properties) == templated
+
+    def test_without_properties__the_body_is_json(self):
+        assert WireFormat("binary").decode(json.dumps(EMAIL).encode()) == EmailMessage(**EMAIL)
+
+    def test_rejects_unknown_content_types_and_encodings(self):
+        with pytest.raises(ValueError, match="content type"):
+            WireFormat().decode(b"", pika.BasicProperties(content_type="text/plain"))
+        with pytest.raises(ValueError, match="content encoding"):
+            WireFormat().decode(b"", pika.BasicProperties(content_encoding="br"))
+
+    def test_rejects_an_unknown_codec(self):
+        with pytest.raises(ValueError, match="Unknown codec"):
+            WireFormat("xml")
+        with pytest.raises(ValueError, match="compression"):
+            WireFormat(compression="br")
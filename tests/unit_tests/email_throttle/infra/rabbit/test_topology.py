@@ -0,0 +1,52 @@
+from unittest.mock import MagicMock, patch
+
+import pika
+import pytest
+
+from email_throttle.infra.rabbit.topology import PERSISTENT, Topology
+
+
+class TestTopology:
+
+    def test_transient_queues_and_messages(self):
+        channel = MagicMock()
+        topology = Topology("transient")
+
+        topology.declare_queue(channel, "emails")
+
+        channel.queue_declare.assert_called_once_with(queue="emails", durable=False, arguments=None)
+        assert topology.persist(None) is None
+
+    def test_durable_queues_and_persistent_messages(self):
+        channel = MagicMock()
+        topology = Topology("durable")
+
+        topology.declare_exchange(channel, "throttler")
+        topology.declare_queue(channel, "emails", {"x-message-ttl": 1000})
+
+        channel.exchange_declare.assert_called_once_with(exchange="throttler", exchange_type="direct", durable=True)
+        channel.queue_declare.assert_called_once_with(queue="emails", durable=True, arguments={"x-message-ttl": 1000})
+        assert topology.persist(None).delivery_mode == PERSISTENT
+        properties = topology.persist(pika.BasicProperties(content_type="application/json"))
+        assert (properties.content_type, properties.delivery_mode) == ("application/json", PERSISTENT)
+
+    def test_quorum_queues_limit_the_deliveries_of_the_consumed_queues(self):
+        channel = MagicMock()
+        topology = Topology("quorum", delivery_limit=5)
+
+        topology.declare_queue(channel, "emails", consumed=True)
+        topology.declare_queue(channel, "emails.retry.1000ms")
+
+        consumed, retry = [call.kwargs["arguments"] for call in channel.queue_declare.call_args_list]
+        assert consumed == {"x-queue-type": "quorum", "x-delivery-limit": 5}
+        assert retry == {"x-queue-type": "quorum"}
+
+    @pytest.mark.parametrize("queue_type, delivery_limit", [("lazy", None), ("durable", 5)])
+    def test_rejects_invalid_topologies(self, queue_type, delivery_limit):
+        with pytest.raises(ValueError):
+            Topology(queue_type, delivery_limit)
+
+    def test_from_env(self):
+        assert Topology.from_env() == Topology("durable")
+        with patch.dict("os.environ", {"EMAIL_THROTTLE_QUEUE_TYPE": "quorum", "EMAIL_THROTTLE_DELIVERY_LIMIT": "3"}):
+            assert Topology.from_env() == Topology("quorum", 3)
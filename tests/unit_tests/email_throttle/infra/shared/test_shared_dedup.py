@@ -0,0 +1,50 @@
+from freezegun import freeze_time
+
+from email_throttle.core.dedup import IdempotencyIndex
+from email_throttle.infra.shared.dedup import SharedTimeWindowBloomFilter
+
+
+class TestSharedTimeWindowBloomFilter:
+
+    def test_keys_are_shared_by_every_instance(self, tmp_path):
+        first = SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+        second = SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+
+        first.add("key")
+
+        assert "key" in second
+        assert "other" not in second
+
+    def test_close(self, tmp_path):
+        first = SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+        first.add("key")
+
+        first.close()
+
+        assert first.record.buffer.closed
+        assert "key" in SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+
+    def test_rotation_is_shared(self, tmp_path):
+        with freeze_time("2019-03-18 20:00:00") as frozen:
+            first = SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+            second = SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60)
+            first.add("old")
+
+            frozen.tick(60)
+            second.add("new")
+            frozen.tick(60)
+
+            assert "old" not in first
+            assert "new" in first
+            assert first.current == second.current
+
+    def test_a_strict_index_drops_the_keys_sent_by_another_consumer(self, tmp_path):
+        consumers = [
+            IdempotencyIndex(SharedTimeWindowBloomFilter.for_node(str(tmp_path), 1000, 0.01, window=60), strict=True)
+            for _ in range(2)
+        ]
+
+        consumers[0].claim("key")
+        consumers[0].release("key", sent=True)
+
+        assert not consumers[1].claim("key")
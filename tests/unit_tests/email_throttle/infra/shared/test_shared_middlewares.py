@@ -0,0 +1,90 @@
+import multiprocessing
+
+import pytest
+from freezegun import freeze_time
+
+from email_throttle.infra.shared.middlewares import SharedCircuitBreaker, SharedGCRAEngine
+
+
+def acquire_permits(path: str, attempts: int, admitted):
+    engine = SharedGCRAEngine(path, max_requests=50, per_second=3600)
+    count = sum(engine.try_acquire() for _ in range(attempts))
+    with admitted.get_lock():
+        admitted.value += count
+
+
+class TestSharedGCRAEngine:
+
+    def test_engines_on_the_same_path_share_the_quota(self, tmp_path):
+        first = SharedGCRAEngine.for_vendor(str(tmp_path), "vendor", max_requests=3, per_second=30)
+        second = SharedGCRAEngine.for_vendor(str(tmp_path), "vendor", max_requests=3, per_second=30)
+        other_vendor = SharedGCRAEngine.for_vendor(str(tmp_path), "other", max_requests=3, per_second=30)
+
+        with freeze_time("2019-03-18 20:00:00"):
+            assert first.try_acquire(2)
+            assert second.try_acquire()
+            assert not first.try_acquire()
+            assert not second.try_acquire()
+            assert other_vendor.try_acquire()
+
+    def test_a_new_engine_does_not_reset_the_shared_state(self, tmp_path):
+        path = str(tmp_path / "vendor.rate_limiter")
+        with freeze_time("2019-03-18 20:00:00"):
+            assert SharedGCRAEngine(path, max_requests=1, per_second=30).try_acquire()
+            assert not SharedGCRAEngine(path, max_requests=1, per_second=30).try_acquire()
+
+    def test_processes_share_the_quota(self, tmp_path):
+        context = multiprocessing.get_context("fork")
+        path = str(tmp_path / "vendor.rate_limiter")
+        admitted = context.Value("i", 0)
+
+        processes = [context.Process(target=acquire_permits, args=(path, 40, admitted)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert admitted.value == 50
+
+
+class TestSharedCircuitBreaker:
+
+    def test_a_breaker_opened_by_one_process_is_open_for_all(self, tmp_path):
+        first = SharedCircuitBreaker.for_vendor(str(tmp_path), "vendor", failure_threshold=2, reset_timeout=60)
+        second = SharedCircuitBreaker.for_vendor(str(tmp_path), "vendor", failure_threshold=2, reset_timeout=60)
+
+        def fail():
+            raise Exception("ERROR")
+
+        with freeze_time("2019-03-18 20:00:00"):
+            for breaker in (first, second):
+                with pytest.raises(Exception, match="ERROR"):
+                    breaker.call(fail)
+
+            assert first.state == second.state == "OPEN"
+            assert second.failure_count == 2
+            assert not first.allow_request()
+
+            with pytest.raises(Exception, match="Circuit is OPEN"):
+                second.call(lambda: "Success")
+
+        # once the timeout expires, one of them closes the circuit for both
+        with freeze_time("2019-03-18 20:01:00"):
+            assert second.call(lambda: "Success") == "Success"
+            assert first.state == "CLOSED"
+            assert first.failure_count == 0
+
+    def test_a_single_probe_for_every_process_when_half_open(self, tmp_path):
+        first = SharedCircuitBreaker.for_vendor(str(tmp_path), "vendor", failure_threshold=1, reset_timeout=60)
+        second = SharedCircuitBreaker.for_vendor(str(tmp_path), "vendor", failure_threshold=1, reset_timeout=60)
+
+        with freeze_time("2019-03-18 20:00:00"):
+            first.record_failure()
+
+        with freeze_time("2019-03-18 20:01:00"):
+            assert first.allow_request()
+            assert second.state == "HALF-OPEN"
+            assert not second.allow_request()
+            assert not second.is_available()
+            first.reset()
+            assert second.allow_request()
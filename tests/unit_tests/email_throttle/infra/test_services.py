@@ -0,0 +1,65 @@
+import pytest
+
+from email_throttle.core.middlewares.default.circuit_breaker import CircuitBreaker
+from email_throttle.core.middlewares.default.rate_limiter import RateLimiter
+from email_throttle.core.middlewares.default.retry import Retry
+from email_throttle.core.routing import EwmaLatency, OrderedRouting
+from email_throttle.infra.services import create_routing, create_services
+from email_throttle.infra.shared.middlewares import (
+    SharedCircuitBreaker,
+    SharedGCRAEngine,
+)
+from email_throttle.vendors.noop import NoOpEmailSender
+
+
+class TestServices:
+    def test_create_services(self):
+        vendors_config = [
+            {
+                "name": "vendor1",
+                "middlewares": ["cb", "rl"],
+                "circuit_breaker": {"threshold": 2, "reset_timeout": 10},
+                "rate_limiter": {"max_attempts": 3, "per_seconds": 20},
+            },
+            {
+                "name": "vendor2",
+                "middlewares": ["retry"],
+                "retry": {"retries": 5},
+            },
+        ]
+
+        services = create_services(vendors_config)
+        assert len(services) == 2
+        assert isinstance(services[0].service, NoOpEmailSender)
+        assert isinstance(services[0].middlewares[0], CircuitBreaker)
+        assert isinstance(services[0].middlewares[1], RateLimiter)
+        assert isinstance(services[1].middlewares[0], Retry)
+
+    def test_create_services_with_shared_state(self, tmp_path):
+        vendors_config = [
+            {
+                "name": "vendor1",
+                "middlewares": ["cb", "rl"],
+                "circuit_breaker": {"threshold": 2, "reset_timeout": 10},
+                "rate_limiter": {"max_attempts": 3, "per_seconds": 20},
+                "state_dir": str(tmp_path),
+            },
+        ]
+
+        services = create_services(vendors_config)
+        assert isinstance(services[0].middlewares[0], SharedCircuitBreaker)
+        assert isinstance(services[0].middlewares[1].engine, SharedGCRAEngine)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["vendor1.circuit_breaker", "vendor1.rate_limiter"]
+
+    def test_create_routing(self):
+        assert isinstance(create_routing("ordered", 2), OrderedRouting)
+        assert create_routing("wrr", 2).weights == [1, 1]
+        assert create_routing("wrr", 2, [3, 1]).weights == [3, 1]
+        assert create_routing("least", 2).in_flight == [0, 0]
+        assert isinstance(create_routing("ewma", 2), EwmaLatency)
+
+    def test_create_routing_with_a_weight_per_vendor(self):
+        with pytest.raises(ValueError):
+            create_routing("wrr", 3, [1, 2])
+        with pytest.raises(ValueError):
+            create_routing("wrr", 2, [1, 2, 3])